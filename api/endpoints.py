@@ -1,6 +1,16 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from pydantic import BaseModel
-from core.manager import consulta_unitaria,masivo,propensy_score,propensy_score_licencia
+from typing import Literal, Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from core.manager import consulta_lote,consulta_unitaria_async,estadisticas_cache,masivo,estado_masivo,resultados_masivo,propensy_score_async,propensy_score_licencia_async,propensy_score_licencia_pagina_async,propensy_score_licencia_ndjson,propensy_score_licencia_csv,propensy_score_licencia_arrow,propensy_score_licencia_parquet
+from api.respuestas import RespuestaDataFrame, RespuestaGrupos, RespuestaJSON, respuesta_tabla
+from core.database import pools
+from core.metricas import metricas
+from core.model_registry import registry
+from core.perfilador import fase, perfilable
+from core.queries import catalogo
+from core.serializacion import MEDIA_ARROW, MEDIA_PARQUET, arrow_disponible
+from core.services import CONSULTA_LOTE_MAX, parse_dates
 
 router = APIRouter()
 
@@ -12,60 +22,181 @@ class ConsultaRequest(BaseModel):
     nombre_columna: str
     fecha_inicio: str
     fecha_fin: str
+    # json: {"status", "data"}; arrow / parquet: archivo con las licencias puntuadas
+    formato: Literal["json", "arrow", "parquet"] = "json"
     
+class Combinacion(BaseModel):
+    cod_diagnostico_principal: str
+    especialidad_profesional: str
+
+
+# Modelo para validar la entrada de /negocio1/consulta/lote
+class ConsultaLoteRequest(BaseModel):
+    combinaciones: list[Combinacion] = Field(min_length=1, max_length=CONSULTA_LOTE_MAX)
+    nombre_columna: str
+    fecha_inicio: str
+    fecha_fin: str
+    # json: resultados agrupados por combinación; arrow / parquet: una tabla con la columna "combinacion"
+    formato: Literal["json", "arrow", "parquet"] = "json"
+
 # Modelo para validar la entrada
 class MasivoRequest(BaseModel):
     fecha_inicio: str
     fecha_fin: str    
 
 
+# Modelo para validar la entrada de la ejecución masiva
+class MasivoJobRequest(MasivoRequest):
+    # Filas por lote leídas, puntuadas y guardadas a la vez (por defecto MASIVO_CHUNK_SIZE)
+    chunk_size: Optional[int] = Field(default=None, gt=0)
+    # Puntúa cada lote repartiendo (regla × partición) en el pool de procesos (MASIVO_PROCESOS)
+    paralelo: bool = False
+    # Solo puntúa licencias sin score, o con score de una versión anterior del modelo
+    incremental: bool = False
+    # Calcula y guarda las ventanas 7/15/30 días por médico (frecuencia_* / otorgados_*)
+    umbrales: bool = False
+
+
+# Modelo para validar la entrada de /score/details
+class ScoreDetailsRequest(MasivoRequest):
+    # Licencias por página; sin limite se devuelve el rango completo (formato json)
+    limite: Optional[int] = Field(default=None, gt=0, le=10000)
+    # Cursor de la página siguiente (campo `siguiente` de la respuesta anterior)
+    despues_id_lic: str = ""
+    # json: respuesta completa o paginada; ndjson / csv / arrow: streaming del rango completo;
+    # parquet: archivo del rango completo
+    formato: Literal["json", "ndjson", "csv", "arrow", "parquet"] = "json"
+
+
+def verifica_formato(formato: str) -> None:
+    """
+    Responde 406 si el formato pedido requiere una biblioteca opcional que no está
+    instalada, antes de consultar o de empezar un streaming.
+    """
+    if formato in ("arrow", "parquet") and not arrow_disponible():
+        raise HTTPException(
+            status_code=406,
+            detail=f"El formato {formato} requiere pyarrow (ver requirements-opcionales.txt)",
+        )
+
+
 @router.post("/negocio1/consulta")
+@perfilable
 async def consulta(request: ConsultaRequest):
     """
     Endpoint para ejecutar la función 'consulta' del archivo businessModel.pkl.
     """
+    verifica_formato(request.formato)
     try:
-        result = consulta_unitaria(
+        result = await consulta_unitaria_async(
             request.fecha_inicio,
             request.fecha_fin,
             request.especialidad_profesional,
             request.cod_diagnostico_principal,
             request.nombre_columna,
         )
-        return {"status": "success", "data": result}
+        with fase("serializacion"):
+            if request.formato != "json":
+                return respuesta_tabla(result, request.formato, "consulta")
+            return RespuestaDataFrame(result, status="success")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error ejecutando el pickle: {str(e)}"
         )
         
+@router.post("/negocio1/consulta/lote")
+@perfilable
+def consulta_en_lote(request: ConsultaLoteRequest):
+    """
+    /negocio1/consulta para varias combinaciones (diagnóstico, especialidad) del mismo
+    rango con una sola consulta y un solo puntaje. En json, "data" trae un elemento por
+    combinación, en el orden recibido, con sus licencias puntuadas.
+    """
+    verifica_formato(request.formato)
+    combinaciones = [
+        (combinacion.cod_diagnostico_principal, combinacion.especialidad_profesional)
+        for combinacion in request.combinaciones
+    ]
+    try:
+        result = consulta_lote(request.fecha_inicio, request.fecha_fin, combinaciones, request.nombre_columna)
+        with fase("serializacion"):
+            if request.formato != "json":
+                return respuesta_tabla(result, request.formato, "consulta_lote")
+            return RespuestaGrupos(
+                [combinacion.model_dump() for combinacion in request.combinaciones],
+                result, "combinacion", status="success",
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error ejecutando el pickle: {str(e)}"
+        )
+
 @router.post("/masivo")
-async def masiva(request: MasivoRequest, background_tasks: BackgroundTasks):
+@perfilable
+async def masiva(request: MasivoJobRequest, background_tasks: BackgroundTasks):
     """
-    Endpoint para ejecutar la función 'consulta' del archivo businessModel.pkl.
-    
-            background_tasks.add_task(
-            ManagerPickle().ejecuta_masivo(from_db, fecha_inicio, fecha_fin)
-        )   
-    
+    Encola la ejecución masiva del rango y devuelve el job (job_id, estado y progreso).
+    Una segunda solicitud para el mismo rango mientras el job sigue activo devuelve el mismo job.
     """
     try:
         result = masivo(
             request.fecha_inicio,
-            request.fecha_fin
+            request.fecha_fin,
+            request.chunk_size,
+            request.paralelo,
+            request.incremental,
+            request.umbrales
         )
         return {"status": "success", "data": result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error ejecutando el pickle: {str(e)}"
         )
+
+@router.get("/masivo/{job_id}")
+def masivo_estado(job_id: str):
+    """
+    Devuelve el estado (queued, running, done, partial o failed) y progreso de una
+    ejecución masiva. partial: algunos lotes no se guardaron (ver errores).
+    """
+    result = estado_masivo(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No existe la ejecución masiva {job_id}")
+    return {"status": "success", "data": result}
+
+@router.get("/masivo/{job_id}/resultados")
+def masivo_resultados(
+    job_id: str,
+    limite: int = Query(default=1000, gt=0, le=10000),
+    despues_id_lic: str = "",
+    despues_rn: int = 0,
+):
+    """
+    Pagina los scores guardados para el rango del job. Para la página siguiente se
+    envían los valores de `siguiente` como despues_id_lic y despues_rn.
+    """
+    try:
+        result = resultados_masivo(job_id, limite, despues_id_lic, despues_rn)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No existe la ejecución masiva {job_id}")
+    return {"status": "success", **result}
         
 @router.post("/score")
-def execute_score(request: MasivoRequest):
+@perfilable
+async def execute_score(request: MasivoRequest):
     """Ejecuta la consulta de resumen de propensity score y devuelve los resultados."""
     try:
-        data = propensy_score(request.fecha_inicio,request.fecha_fin)
+        data = await propensy_score_async(request.fecha_inicio,request.fecha_fin)
 
-        return {"status": "success", "data": data}
+        return RespuestaJSON({"status": "success", "data": data})
 
     except ValueError as e:
         return {"status": "error", "message": str(e)}
@@ -73,14 +204,92 @@ def execute_score(request: MasivoRequest):
         return {"status": "error", "message": f"Error inesperado: {str(e)}"}
     
 @router.post("/score/details")
-def query_score(request: MasivoRequest):
-    """Ejecuta la consulta de resumen de propensity score y devuelve los resultados."""
+@perfilable
+async def query_score(request: ScoreDetailsRequest):
+    """
+    Scores por licencia del rango, con una columna por regla en "score".
+
+    Con `limite` la respuesta se pagina por licencia (usar `siguiente` para la página
+    siguiente). Con formato ndjson, csv o arrow el rango completo se envía en streaming,
+    leyéndolo página a página desde la base de datos; parquet lo arma completo.
+    """
+    if request.formato != "json":
+        # En streaming el status 200 se envía antes de leer: las fechas se validan antes
+        try:
+            parse_dates(request.fecha_inicio, request.fecha_fin)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    verifica_formato(request.formato)
+
+    if request.formato == "ndjson":
+        return StreamingResponse(
+            propensy_score_licencia_ndjson(request.fecha_inicio, request.fecha_fin),
+            media_type="application/x-ndjson",
+        )
+    if request.formato == "csv":
+        return StreamingResponse(
+            propensy_score_licencia_csv(request.fecha_inicio, request.fecha_fin),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=score_details.csv"},
+        )
+    if request.formato == "arrow":
+        return StreamingResponse(
+            propensy_score_licencia_arrow(request.fecha_inicio, request.fecha_fin),
+            media_type=MEDIA_ARROW,
+            headers={"Content-Disposition": "attachment; filename=score_details.arrow"},
+        )
+    if request.formato == "parquet":
+        try:
+            data = await propensy_score_licencia_parquet(request.fecha_inicio, request.fecha_fin)
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return Response(
+            data,
+            media_type=MEDIA_PARQUET,
+            headers={"Content-Disposition": "attachment; filename=score_details.parquet"},
+        )
+
     try:
-        data = propensy_score_licencia(request.fecha_inicio,request.fecha_fin)
+        if request.limite is not None:
+            pagina = await propensy_score_licencia_pagina_async(
+                request.fecha_inicio, request.fecha_fin, request.limite, request.despues_id_lic
+            )
+            return RespuestaJSON({"status": "success", **pagina})
 
-        return data
+        data = await propensy_score_licencia_async(request.fecha_inicio,request.fecha_fin)
+
+        return RespuestaJSON(data)
 
     except ValueError as e:
         return {"status": "error", "message": str(e)}
     except Exception as e:
-        return {"status": "error", "message": f"Error inesperado: {str(e)}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Error inesperado: {str(e)}"}
+
+@router.get("/cache")
+def cache_stats():
+    """Métricas de hit/miss de los cachés de /score y /score/details."""
+    return {"status": "success", "data": estadisticas_cache()}
+
+
+@router.get("/modelos")
+def modelos_cargados():
+    """Lista los modelos cargados en memoria y su versión (hash del archivo pickle)."""
+    return {"status": "success", "data": registry.versiones()}
+
+
+@router.get("/consultas")
+def consultas_stats():
+    """Ejecuciones, filas y tiempos por archivo de consulta SQL (las más costosas primero)."""
+    return {"status": "success", "data": catalogo.estadisticas()}
+
+
+@router.get("/pools")
+def pools_stats():
+    """Conexiones en uso, libres, capacidad y saturación de cada pool de conexiones."""
+    return {"status": "success", "data": pools.estadisticas()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Métricas del proceso en el formato de texto de Prometheus."""
+    return PlainTextResponse(metricas.exporta(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,55 @@
+from typing import Optional
+
+import pandas as pd
+from fastapi.responses import JSONResponse, Response
+
+from core.serializacion import MEDIA_ARROW, MEDIA_PARQUET, arrow_ipc, dataframe_json, dumps, envoltorio_json, parquet
+
+
+class RespuestaJSON(JSONResponse):
+    """
+    JSONResponse serializada con core.serializacion.dumps (orjson si está instalado).
+    Devolverla directamente desde el handler evita además el jsonable_encoder de FastAPI.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class RespuestaDataFrame(Response):
+    media_type = "application/json"
+
+    def __init__(self, df: pd.DataFrame, status_code: int = 200, headers: Optional[dict] = None, **campos):
+        """{**campos, "data": [registros del DataFrame]}, codificado directo desde las columnas."""
+        super().__init__(envoltorio_json(dataframe_json(df), **campos), status_code, headers)
+
+
+class RespuestaGrupos(Response):
+    media_type = "application/json"
+
+    def __init__(self, grupos: list[dict], df: pd.DataFrame, columna: str, status_code: int = 200, **campos):
+        """
+        {**campos, "data": [{**grupos[i], "data": [registros con df[columna] == i]}, ...]}:
+        un elemento por grupo, en orden y aunque no tenga registros.
+        """
+        registros = {}
+        if not df.empty:
+            for posicion, grupo in df.groupby(columna, sort=False):
+                registros[posicion] = dataframe_json(grupo.drop(columns=columna))
+        data = b"[" + b",".join(
+            envoltorio_json(registros.get(posicion, b"[]"), **grupo) for posicion, grupo in enumerate(grupos)
+        ) + b"]"
+        super().__init__(envoltorio_json(data, **campos), status_code)
+
+
+def respuesta_tabla(df: pd.DataFrame, formato: str, nombre: str) -> Response:
+    """El DataFrame como archivo Arrow IPC (formato "arrow") o Parquet (formato "parquet")."""
+    if formato == "arrow":
+        return Response(
+            arrow_ipc(df), media_type=MEDIA_ARROW,
+            headers={"Content-Disposition": f"attachment; filename={nombre}.arrow"},
+        )
+    return Response(
+        parquet(df), media_type=MEDIA_PARQUET,
+        headers={"Content-Disposition": f"attachment; filename={nombre}.parquet"},
+    )
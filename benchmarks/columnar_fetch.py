@@ -0,0 +1,133 @@
+"""
+Compara la lectura por filas (fetchall + pd.DataFrame) con la lectura columnar
+(COPY ... TO STDOUT, core/columnar.py) sobre una tabla sintética con la forma de
+ml.licencias.
+
+Crea la tabla UNLOGGED ml.bench_licencias con `--filas` licencias (1M por defecto),
+ejecuta cada modo `--repeticiones` veces e imprime en JSON el mejor tiempo, filas/s,
+memoria del DataFrame resultante y sus dtypes, y las columnas cuyos valores difieren
+entre ambos modos (nulos, textos vacíos y "NA" incluidos). Al terminar borra la tabla
+(salvo --conserva).
+
+Uso:
+    python benchmarks/columnar_fetch.py --filas 1000000
+
+Usa la conexión de core/database.py (variables DB_* del .env).
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.columnar import ENTERO, FECHA, lee_columnar  # noqa: E402
+from core.database import motor  # noqa: E402
+from core.services import COLUMNAS_MASIVO, TIPOS_LICENCIAS  # noqa: E402
+
+CREA_TABLA = """
+CREATE UNLOGGED TABLE ml.bench_licencias AS
+SELECT
+    'LIC' || lpad(g::text, 10, '0') AS id_licencia,
+    'F' || g AS folio,
+    -- Algunos nulos, textos vacíos y el código "NA" para comparar su lectura en ambos modos
+    CASE WHEN g % 97 = 0 THEN NULL ELSE (1 + (g::int8 * 7919) % 400)::int4 END AS dias_reposo,
+    DATE '2025-01-01' + (g % 365) AS fecha_emision,
+    DATE '2025-01-01' + (g % 365) + (g % 3) AS fecha_inicio_reposo,
+    CASE WHEN g % 89 = 0 THEN '' ELSE (ARRAY['MEDICINA GENERAL', 'Sin Especialidad', 'Medicina General', 'TRAUMATOLOGIA', 'PSIQUIATRIA'])[1 + g % 5] END AS especialidad_profesional,
+    CASE WHEN g % 83 = 0 THEN 'NA' ELSE (ARRAY['F', 'M', 'J', 'S', 'K'])[1 + (g / 5) % 5] || lpad((g % 100)::text, 2, '0') END AS cod_diagnostico_principal
+FROM generate_series(1, :filas) AS g
+"""
+
+CONSULTA = """
+SELECT id_licencia, folio, dias_reposo, fecha_emision, fecha_inicio_reposo,
+       especialidad_profesional, cod_diagnostico_principal
+FROM ml.bench_licencias
+WHERE fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+"""
+
+PARAMS = {"fecha_inicio": "2025-01-01", "fecha_fin": "2025-12-31"}
+
+
+def por_filas(conn) -> pd.DataFrame:
+    filas = conn.execute(text(CONSULTA), PARAMS).fetchall()
+    return pd.DataFrame(filas, columns=COLUMNAS_MASIVO)
+
+
+def columnar(conn) -> pd.DataFrame:
+    return list(lee_columnar(conn, CONSULTA, PARAMS, TIPOS_LICENCIAS))[0]
+
+
+def diferencias(filas: pd.DataFrame, columnas: pd.DataFrame) -> list[str]:
+    """Columnas con algún valor distinto entre los dos modos (los dtypes pueden diferir)."""
+    filas = filas.sort_values("id_licencia", ignore_index=True)
+    columnas = columnas.sort_values("id_licencia", ignore_index=True)
+    distintas = []
+    for columna, tipo in TIPOS_LICENCIAS.items():
+        a, b = filas[columna], columnas[columna]
+        if tipo == FECHA:
+            a, b = pd.to_datetime(a).astype("datetime64[us]"), pd.to_datetime(b).astype("datetime64[us]")
+        elif tipo == ENTERO:
+            a, b = a.astype("Float64"), b.astype("Float64")
+        else:
+            a, b = a.astype(object), b.astype(object)
+            a, b = a.where(a.notna(), None), b.where(b.notna(), None)
+        if not a.equals(b):
+            distintas.append(columna)
+    return distintas
+
+
+def mide(nombre: str, lector, repeticiones: int) -> tuple[pd.DataFrame, dict]:
+    tiempos = []
+    df = None
+    for _ in range(repeticiones):
+        with motor().connect() as conn:
+            inicio = time.perf_counter()
+            df = lector(conn)
+            tiempos.append(time.perf_counter() - inicio)
+    mejor = min(tiempos)
+    return df, {
+        "modo": nombre,
+        "filas": len(df),
+        "mejor_s": round(mejor, 3),
+        "promedio_s": round(sum(tiempos) / len(tiempos), 3),
+        "filas_por_s": round(len(df) / mejor) if mejor else None,
+        "memoria_mb": round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1),
+        "dtypes": {columna: str(tipo) for columna, tipo in df.dtypes.items()},
+    }
+
+
+def main(args):
+    with motor().begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS ml.bench_licencias"))
+        conn.execute(text(CREA_TABLA), {"filas": args.filas})
+        conn.execute(text("ANALYZE ml.bench_licencias"))
+    try:
+        df_filas, resultado_filas = mide("por_filas", por_filas, args.repeticiones)
+        df_columnar, resultado_columnar = mide("columnar", columnar, args.repeticiones)
+        resultados = [resultado_filas, resultado_columnar]
+    finally:
+        if not args.conserva:
+            with motor().begin() as conn:
+                conn.execute(text("DROP TABLE IF EXISTS ml.bench_licencias"))
+
+    aceleracion = resultados[0]["mejor_s"] / resultados[1]["mejor_s"] if resultados[1]["mejor_s"] else None
+    print(json.dumps({
+        "filas": args.filas,
+        "repeticiones": args.repeticiones,
+        "resultados": resultados,
+        "aceleracion": round(aceleracion, 2) if aceleracion else None,
+        "columnas_distintas": diferencias(df_filas, df_columnar),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--conserva", action="store_true", help="No borra ml.bench_licencias al terminar")
+    main(parser.parse_args())
@@ -0,0 +1,285 @@
+"""
+Generador determinista de datos sintéticos con la forma del esquema ml: médicos,
+especialidades (con variantes de escritura), licencias y
+licencia_diagnostico_especialidad, con distribuciones sesgadas como las reales
+(pocos médicos y diagnósticos concentran la mayoría de las licencias).
+
+La misma `--semilla` y `--filas` producen siempre los mismos datos, así que los
+resultados de benchmarks/suite.py son comparables entre commits.
+
+Uso:
+    python benchmarks/datos_sinteticos.py --filas 1000000 --confirma <DB_NAME>
+
+Carga en la base de core/database.py (variables DB_*), que debe ser una base
+desechable: crea el esquema ml si no existe, aplica las migraciones y VACÍA las
+tablas antes de cargar. Por eso exige repetir el nombre de la base en --confirma.
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FILAS_MIN = 10_000
+FILAS_MAX = 10_000_000
+CHUNK_SIZE = 500_000
+
+# Variantes de escritura como las que llegan en las licencias (ver core/especialidades.py)
+ESPECIALIDADES = [
+    ("MEDICINA GENERAL", 30),
+    ("Medicina General", 12),
+    ("Sin Especialidad", 10),
+    ("medicina general ", 3),
+    ("MEDICINA FAMILIAR", 8),
+    ("PSIQUIATRIA ADULTO", 7),
+    ("Psiquiatría", 4),
+    ("TRAUMATOLOGIA", 7),
+    ("Traumatología y Ortopedia", 3),
+    ("MEDICINA INTERNA", 6),
+    ("GINECOLOGIA Y OBSTETRICIA", 5),
+    ("PEDIATRIA", 3),
+    ("NEUROLOGIA", 2),
+]
+
+# Letras CIE-10 más frecuentes en licencias (F: salud mental, M: osteomuscular)
+LETRAS_DIAGNOSTICO = ["F", "M", "J", "S", "K", "A", "R", "Z", "N", "G", "O", "I"]
+
+TABLAS = [
+    "ml.licencia_diagnostico_especialidad",
+    "ml.propensity_score",
+    "ml.propensity_score_diario",
+    "ml.licencias",
+    "ml.especialidad_profesional_medicos",
+    "ml.especialidad_profesional",
+    "ml.medicos",
+]
+
+# Subconjunto de sql/basededatos.sql que usan las consultas de sql/, más
+# licencia_diagnostico_especialidad (no está en ese script)
+ESQUEMA = """
+CREATE SCHEMA IF NOT EXISTS ml;
+
+CREATE TABLE IF NOT EXISTS ml.medicos (
+    rut_medico varchar(128) NOT NULL,
+    CONSTRAINT medicos_pkey PRIMARY KEY (rut_medico)
+);
+
+CREATE TABLE IF NOT EXISTS ml.especialidad_profesional (
+    id_especialidad_profesional serial4 NOT NULL,
+    descripcion_especialidad_profesional varchar(255) NULL,
+    CONSTRAINT especialidad_profesional_descripcion_especialidad_profesion_key UNIQUE (descripcion_especialidad_profesional),
+    CONSTRAINT especialidad_profesional_pkey PRIMARY KEY (id_especialidad_profesional)
+);
+
+CREATE TABLE IF NOT EXISTS ml.especialidad_profesional_medicos (
+    id_especialidad_profesional_medicos serial4 NOT NULL,
+    rut_medico varchar(128) NOT NULL,
+    id_especialidad_profesional int4 NULL,
+    CONSTRAINT especialidad_profesional_medicos_pkey PRIMARY KEY (id_especialidad_profesional_medicos, rut_medico)
+);
+
+CREATE TABLE IF NOT EXISTS ml.licencias (
+    id_licencias serial4 NOT NULL,
+    id_lic varchar(128) NULL,
+    folio varchar NULL,
+    fecha_emision date NULL,
+    dias_reposo int4 NULL,
+    fecha_inicio_reposo date NULL,
+    rut_medico varchar(128) NULL,
+    cod_diagnostico_principal varchar NULL,
+    CONSTRAINT licencias_pkey PRIMARY KEY (id_licencias),
+    CONSTRAINT unique_folio UNIQUE (folio),
+    CONSTRAINT unique_id_lic UNIQUE (id_lic)
+);
+
+CREATE TABLE IF NOT EXISTS ml.licencia_diagnostico_especialidad (
+    id_licencia varchar(128) NULL,
+    cod_diagnostico varchar NULL,
+    especialidad_medico varchar NULL
+);
+
+CREATE TABLE IF NOT EXISTS ml.propensity_score (
+    id_propensity_score int8 NULL,
+    id_lic varchar(128) NULL,
+    folio varchar NULL,
+    rn int4 NULL,
+    rn2 int4 NULL,
+    frecuencia_mensual float4 NULL,
+    frecuencia_semanal float4 NULL,
+    otorgados_mensual float4 NULL,
+    otorgados_semanal float4 NULL,
+    ml float4 NULL,
+    score float4 NULL
+);
+"""
+
+
+def _zipf(n: int, s: float, rng: np.random.Generator) -> np.ndarray:
+    """Pesos 1/rango^s sobre `n` elementos, en un orden aleatorio (determinista por `rng`)."""
+    pesos = 1.0 / np.arange(1, n + 1) ** s
+    return rng.permutation(pesos / pesos.sum())
+
+
+class DatosSinteticos:
+    def __init__(self, filas: int, semilla: int = 0, desde: str = "2025-01-01", dias: int = 365):
+        """
+        Define el universo de los datos: `filas` licencias emitidas en `dias` días desde
+        `desde`, de unos filas/250 médicos con popularidad Zipf, y unos 400 diagnósticos
+        también Zipf. Los lotes de licencias se generan bajo demanda (ver licencias()).
+        """
+        if not FILAS_MIN <= filas <= FILAS_MAX:
+            raise ValueError(f"filas debe estar entre {FILAS_MIN} y {FILAS_MAX}")
+        self.filas = filas
+        self.semilla = semilla
+        self.desde = pd.Timestamp(desde)
+        self.dias = dias
+
+        rng = np.random.default_rng([semilla])
+        n_medicos = max(100, filas // 250)
+        self.ruts = np.array([f"{10_000_000 + i}-{i % 10}" for i in range(n_medicos)])
+        self.pesos_medicos = _zipf(n_medicos, 0.9, rng)
+
+        nombres, pesos = zip(*ESPECIALIDADES)
+        self.especialidades = list(nombres)
+        pesos = np.array(pesos, dtype=float)
+        self.especialidad_medico = rng.choice(len(nombres), size=n_medicos, p=pesos / pesos.sum())
+
+        self.diagnosticos = np.array([f"{letra}{numero:02d}" for letra in LETRAS_DIAGNOSTICO for numero in range(0, 100, 3)])
+        self.pesos_diagnosticos = _zipf(len(self.diagnosticos), 1.0, rng)
+
+    @property
+    def fecha_fin(self) -> pd.Timestamp:
+        return self.desde + pd.Timedelta(days=self.dias - 1)
+
+    def medicos(self) -> pd.DataFrame:
+        return pd.DataFrame({"rut_medico": self.ruts})
+
+    def especialidad_profesional(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "id_especialidad_profesional": np.arange(1, len(self.especialidades) + 1),
+            "descripcion_especialidad_profesional": self.especialidades,
+        })
+
+    def especialidad_profesional_medicos(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "id_especialidad_profesional_medicos": np.arange(1, len(self.ruts) + 1),
+            "rut_medico": self.ruts,
+            "id_especialidad_profesional": self.especialidad_medico + 1,
+        })
+
+    def licencias(self, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+        """
+        Lotes de a lo más `chunk_size` licencias, con las columnas de sql/masivo.sql más
+        id_licencias y rut_medico. Cada lote usa su propio generador (semilla, índice):
+        con la misma semilla y el mismo `chunk_size` los datos son idénticos.
+        """
+        for indice, inicio in enumerate(range(0, self.filas, chunk_size)):
+            n = min(chunk_size, self.filas - inicio)
+            rng = np.random.default_rng([self.semilla, indice + 1])
+            ids = np.arange(inicio + 1, inicio + n + 1)
+            medicos = rng.choice(len(self.ruts), size=n, p=self.pesos_medicos)
+            emision = self.desde + pd.to_timedelta(rng.integers(0, self.dias, size=n), unit="D")
+            # Mediana ~7 días, cola larga: algunas sobre 30 (umbral de las reglas) y sobre 365
+            dias_reposo = np.clip(np.rint(rng.lognormal(2.0, 0.9, size=n)), 1, 400).astype("int32")
+            yield pd.DataFrame({
+                "id_licencias": ids,
+                "id_licencia": np.char.add("L", np.char.zfill(ids.astype(str), 10)),
+                "folio": np.char.add("F", np.char.zfill(ids.astype(str), 10)),
+                "dias_reposo": dias_reposo,
+                "fecha_emision": emision,
+                "fecha_inicio_reposo": emision + pd.to_timedelta(rng.integers(0, 3, size=n), unit="D"),
+                "especialidad_profesional": np.array(self.especialidades, dtype=object)[self.especialidad_medico[medicos]],
+                "cod_diagnostico_principal": rng.choice(self.diagnosticos, size=n, p=self.pesos_diagnosticos),
+                "rut_medico": self.ruts[medicos],
+            })
+
+
+def _copia(conn, tabla: str, df: pd.DataFrame) -> None:
+    """COPY ... FROM STDIN en CSV sobre la conexión SQLAlchemy `conn` (psycopg2 o psycopg 3)."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, date_format="%Y-%m-%d")
+    copy_sql = f"COPY {tabla} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+        else:
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def carga(datos: DatosSinteticos) -> dict:
+    """Crea el esquema si falta, aplica las migraciones, vacía las tablas y carga `datos`."""
+    from core.database import LOTE, motor
+    from core.especialidades import construye
+    from core.migrations import aplica_migraciones
+
+    engine = motor(LOTE)
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(ESQUEMA)
+    aplica_migraciones()
+
+    inicio = time.perf_counter()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"TRUNCATE {', '.join(TABLAS)}")
+        _copia(conn, "ml.medicos", datos.medicos())
+        _copia(conn, "ml.especialidad_profesional", datos.especialidad_profesional())
+        _copia(conn, "ml.especialidad_profesional_medicos", datos.especialidad_profesional_medicos())
+        for lote in datos.licencias():
+            _copia(conn, "ml.licencias", lote[[
+                "id_licencias", "id_licencia", "folio", "fecha_emision", "dias_reposo",
+                "fecha_inicio_reposo", "rut_medico", "cod_diagnostico_principal",
+            ]].rename(columns={"id_licencia": "id_lic"}))
+            _copia(conn, "ml.licencia_diagnostico_especialidad", lote[[
+                "id_licencia", "cod_diagnostico_principal", "especialidad_profesional",
+            ]].rename(columns={
+                "cod_diagnostico_principal": "cod_diagnostico", "especialidad_profesional": "especialidad_medico",
+            }))
+        conn.execute(text("SELECT setval('ml.licencias_id_licencias_seq', :filas)"), {"filas": datos.filas})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for tabla in TABLAS:
+            conn.exec_driver_sql(f"ANALYZE {tabla}")
+
+    # Ids canónicos de especialidad para sql/consulta1.sql
+    especialidades = construye()
+    return {
+        "filas": datos.filas,
+        "semilla": datos.semilla,
+        "medicos": len(datos.ruts),
+        "especialidades": especialidades,
+        "segundos_carga": round(time.perf_counter() - inicio, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--desde", default="2025-01-01")
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--confirma", required=True, help="Nombre de la base (DB_NAME) que se va a vaciar")
+    args = parser.parse_args()
+
+    from core.database import config_conexion
+    db_name = config_conexion()["name"]
+    if args.confirma != db_name:
+        parser.error(f"--confirma no coincide con DB_NAME ({db_name})")
+
+    datos = DatosSinteticos(args.filas, args.semilla, args.desde, args.dias)
+    print(json.dumps(carga(datos), indent=2))
+
+
+if __name__ == "__main__":
+    main()
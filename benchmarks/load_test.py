@@ -0,0 +1,105 @@
+"""
+Prueba de carga con tráfico mixto contra la API /lm/ml.
+
+Lanza `--concurrencia` clientes durante `--duracion` segundos. Cada cliente elige un
+endpoint según los pesos de ENDPOINTS y mide la latencia de cada respuesta. Al final
+imprime en JSON, por endpoint, la cantidad de requests, errores y latencias p50/p95/p99/max (ms).
+
+Uso:
+    uvicorn main:app --workers 1
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --desde 2025-01-01 --hasta 2025-01-31
+
+Requiere httpx (pip install httpx).
+
+Resultados medidos contra un despliegue real (uvicorn + PostgreSQL 16, 200.000
+licencias sintéticas) con su entorno en benchmarks/resultados/load_test_<fecha>.json.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+# (nombre, método, ruta, peso)
+ENDPOINTS = [
+    ("score_details", "POST", "/lm/ml/score/details", 6),
+    ("score", "POST", "/lm/ml/score", 3),
+    ("negocio1_consulta", "POST", "/lm/ml/negocio1/consulta", 1),
+]
+
+
+def percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def cuerpo(nombre: str, args) -> dict:
+    rango = {"fecha_inicio": args.desde, "fecha_fin": args.hasta}
+    if nombre == "negocio1_consulta":
+        return {
+            **rango,
+            "especialidad_profesional": args.especialidad,
+            "cod_diagnostico_principal": args.diagnostico,
+            "nombre_columna": "propensity_score_rn_1",
+        }
+    return rango
+
+
+async def cliente(http: httpx.AsyncClient, args, fin: float, latencias: dict, errores: dict):
+    nombres = [e[0] for e in ENDPOINTS]
+    pesos = [e[3] for e in ENDPOINTS]
+    rutas = {e[0]: (e[1], e[2]) for e in ENDPOINTS}
+    while time.monotonic() < fin:
+        nombre = random.choices(nombres, weights=pesos)[0]
+        metodo, ruta = rutas[nombre]
+        inicio = time.perf_counter()
+        try:
+            respuesta = await http.request(metodo, ruta, json=cuerpo(nombre, args))
+            if respuesta.status_code >= 400:
+                errores[nombre] += 1
+        except httpx.HTTPError:
+            errores[nombre] += 1
+        latencias[nombre].append((time.perf_counter() - inicio) * 1000)
+
+
+async def main(args):
+    latencias = {e[0]: [] for e in ENDPOINTS}
+    errores = {e[0]: 0 for e in ENDPOINTS}
+    fin = time.monotonic() + args.duracion
+    limites = httpx.Limits(max_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limites) as http:
+        await asyncio.gather(*[
+            cliente(http, args, fin, latencias, errores) for _ in range(args.concurrencia)
+        ])
+
+    resumen = {
+        nombre: {
+            "requests": len(valores),
+            "errores": errores[nombre],
+            "rps": round(len(valores) / args.duracion, 2),
+            "p50_ms": round(percentil(valores, 50), 2),
+            "p95_ms": round(percentil(valores, 95), 2),
+            "p99_ms": round(percentil(valores, 99), 2),
+            "max_ms": round(max(valores, default=0.0), 2),
+        }
+        for nombre, valores in latencias.items()
+    }
+    print(json.dumps({"concurrencia": args.concurrencia, "duracion_s": args.duracion, "endpoints": resumen}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--desde", default="2025-01-01")
+    parser.add_argument("--hasta", default="2025-01-31")
+    parser.add_argument("--especialidad", default="MEDICINA GENERAL")
+    parser.add_argument("--diagnostico", default="F32")
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--duracion", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,232 @@
+"""
+Suite de benchmarks sobre datos sintéticos (benchmarks/datos_sinteticos.py).
+
+Sin base de datos mide el puntaje en memoria: BusinessModel.predict_prob y la regla
+compilada de cada modelo, ManagerPickle.puntua_lote, el modo paralelo (con el costo
+de transferir las particiones a los procesos por separado) y las ventanas de umbrales.
+Con --base mide además, contra la base cargada por datos_sinteticos.py con las
+mismas --filas y --semilla: el masivo completo (lectura + puntaje + upsert),
+update_propensity_score_licencias y cada consulta de lectura de sql/.
+
+Imprime (y guarda en --salida) un JSON con el commit, el entorno y, por caso, los
+tiempos mínimo/mediana/máximo y filas/s. Con --compara <anterior.json> muestra la
+razón mediana_actual / mediana_anterior por caso y termina con código 1 si alguna
+supera --tolerancia.
+
+Uso:
+    python benchmarks/suite.py --filas 100000 --salida resultados.json
+    python benchmarks/datos_sinteticos.py --filas 1000000 --confirma <DB_NAME>
+    python benchmarks/suite.py --filas 1000000 --base --compara resultados_main.json
+
+Las consultas de sql/ usan funciones de PostgreSQL (jsonb, arreglos, pg_trgm), por
+lo que las mediciones con base requieren PostgreSQL; no hay sustituto en SQLite.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from datos_sinteticos import DatosSinteticos  # noqa: E402
+
+# Consultas de sql/ que escriben o no son consultas: no se miden como lectura
+SQL_EXCLUIDAS = {"basededatos.sql", "umbrales_update.sql"}
+
+
+def mide(nombre: str, funcion: Callable[[], int], repeticiones: int) -> dict:
+    """Ejecuta `funcion` (devuelve las filas procesadas) `repeticiones` veces y resume los tiempos."""
+    tiempos, filas = [], 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    mediana = statistics.median(tiempos)
+    resultado = {
+        "caso": nombre,
+        "repeticiones": repeticiones,
+        "min_s": round(min(tiempos), 4),
+        "mediana_s": round(mediana, 4),
+        "max_s": round(max(tiempos), 4),
+        "filas": filas,
+        "filas_por_s": round(filas / mediana) if mediana > 0 else None,
+    }
+    print(f"{nombre}: {resultado['mediana_s']}s ({filas} filas)", file=sys.stderr)
+    return resultado
+
+
+def casos_en_memoria(datos: DatosSinteticos, repeticiones: int) -> list[dict]:
+    from core.manager_pickle import COLUMNAS_MODELO, ManagerPickle
+    from core.umbrales import calcula_ventanas
+
+    df = pd.concat(datos.licencias(), ignore_index=True)
+    data = df[COLUMNAS_MODELO]
+    manager = ManagerPickle()
+    modelos = manager.carga_modelos()
+
+    resultados = []
+    for rn, modelo in modelos.items():
+        resultados.append(mide(f"predict_prob_rn_{rn}", lambda: len(modelo.predict_prob(data)), repeticiones))
+        regla = modelo.compila()
+        resultados.append(mide(f"regla_compilada_rn_{rn}", lambda: len(regla.puntua(data)), repeticiones))
+    resultados.append(mide("puntua_lote", lambda: len(manager.puntua_lote(df, modelos)), repeticiones))
+    resultados.extend(casos_paralelo(df, manager, repeticiones))
+
+    ruts, _ = pd.factorize(df["rut_medico"])
+    dias = df["fecha_emision"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    dias_reposo = df["dias_reposo"].to_numpy(dtype=float)
+    resultados.append(mide(
+        "ventanas_umbrales", lambda: len(calcula_ventanas(ruts, dias, dias_reposo)["frecuencia_semanal"]), repeticiones
+    ))
+    return resultados
+
+
+def casos_paralelo(df: pd.DataFrame, manager, repeticiones: int) -> list[dict]:
+    """
+    Modo paralelo del masivo: el puntaje completo en el pool de procesos y, aparte, lo
+    que cuesta mover los datos (pickle de ida de cada partición por regla y de vuelta
+    de cada columna de score), para compararlo con el tiempo de puntuar.
+    """
+    from multiprocessing.reduction import ForkingPickler
+    from core.manager_pickle import cierra_pool_puntaje, particiones_paralelo
+
+    # La primera llamada levanta los procesos y precarga los modelos: queda fuera de la medición
+    manager.puntua_lote_paralelo(df)
+    resultados = [mide("puntua_lote_paralelo", lambda: len(manager.puntua_lote_paralelo(df)), repeticiones)]
+    cierra_pool_puntaje()
+
+    bytes_enviados = []
+
+    def transferencia() -> int:
+        enviados = 0
+        particiones = particiones_paralelo(df)
+        for _ in manager.model_names:
+            for particion in particiones:
+                ida = ForkingPickler.dumps(particion)
+                recibida = ForkingPickler.loads(ida)
+                vuelta = ForkingPickler.dumps(pd.Series(0, index=recibida.index, dtype="int64"))
+                ForkingPickler.loads(vuelta)
+                enviados += len(ida) + len(vuelta)
+        bytes_enviados.append(enviados)
+        return len(df)
+
+    resultados.append(mide("paralelo_transferencia", transferencia, repeticiones))
+    resultados[-1]["bytes"] = bytes_enviados[-1]
+    return resultados
+
+
+def casos_con_base(datos: DatosSinteticos, repeticiones: int, dias_consulta: int) -> list[dict]:
+    from core.database import LOTE, carga
+    from core.especialidades import diccionario_especialidades
+    from core.manager_pickle import ManagerPickle
+    from core.migrations import PARAMS_EXPLAIN
+    from core.services import execute_query, stream_masivo, update_propensity_score_licencias
+
+    desde = datos.desde.strftime("%Y-%m-%d")
+    hasta = min(datos.fecha_fin, datos.desde + pd.Timedelta(days=dias_consulta - 1)).strftime("%Y-%m-%d")
+    print(f"Rango de las consultas: {desde} a {hasta}", file=sys.stderr)
+
+    def masivo() -> int:
+        with carga(LOTE):
+            return ManagerPickle().ejecuta_pipeline(stream_masivo(desde, hasta))["procesadas"]
+
+    resultados = [mide("masivo", masivo, repeticiones)]
+
+    scores = next(datos.licencias(chunk_size=min(datos.filas, 100_000)))[["id_licencia", "folio", "fecha_emision"]]
+    scores["propensity_score_rn_1"] = (np.arange(len(scores)) % 7 == 0).astype(int)
+    resultados.append(mide(
+        "update_propensity_score_licencias",
+        lambda: update_propensity_score_licencias(scores, "propensity_score_rn_1", 1, version_modelo="benchmark"),
+        repeticiones,
+    ))
+
+    params = {
+        **PARAMS_EXPLAIN,
+        "fecha_inicio": datetime.fromisoformat(desde),
+        "fecha_fin": datetime.fromisoformat(hasta) + timedelta(days=1) - timedelta(microseconds=1),
+        "cod_diagnostico_principal": "F00",
+        "id_especialidad_canonica": diccionario_especialidades.id_de("Medicina General") or 1,
+        "versiones": ["", ""],
+        "limite": 5000,
+        "desde_id": 0,
+        "relee_desde": datetime.fromisoformat(hasta),
+    }
+    for path in sorted(Path("sql").glob("*.sql")):
+        if path.name in SQL_EXCLUIDAS:
+            continue
+        resultados.append(mide(
+            f"sql/{path.name}", lambda path=path: len(execute_query(f"./sql/{path.name}", params)), repeticiones
+        ))
+    return resultados
+
+
+def compara(actual: dict, anterior: dict, tolerancia: float) -> bool:
+    """Imprime la razón de medianas por caso; devuelve False si algún caso empeoró más que `tolerancia`."""
+    previos = {caso["caso"]: caso for caso in anterior["casos"]}
+    ok = True
+    print(f"Comparación con {anterior.get('commit', '?')[:10]} (tolerancia {tolerancia}x):", file=sys.stderr)
+    for caso in actual["casos"]:
+        previo = previos.get(caso["caso"])
+        if previo is None or not previo["mediana_s"]:
+            continue
+        razon = caso["mediana_s"] / previo["mediana_s"]
+        marca = "REGRESIÓN" if razon > tolerancia else ""
+        ok = ok and razon <= tolerancia
+        print(f"  {caso['caso']}: {previo['mediana_s']}s -> {caso['mediana_s']}s ({razon:.2f}x) {marca}", file=sys.stderr)
+    return ok
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--base", action="store_true", help="Incluye los casos contra la base de datos")
+    parser.add_argument("--dias-consulta", type=int, default=31, help="Días del rango de las consultas con base")
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    parser.add_argument("--compara", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=1.25)
+    args = parser.parse_args()
+
+    datos = DatosSinteticos(args.filas, args.semilla)
+    casos = casos_en_memoria(datos, args.repeticiones)
+    if args.base:
+        casos += casos_con_base(datos, args.repeticiones, args.dias_consulta)
+
+    resultado = {
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "maquina": platform.node(),
+        "filas": args.filas,
+        "semilla": args.semilla,
+        "casos": casos,
+    }
+    print(json.dumps(resultado, indent=2))
+    if args.salida:
+        Path(args.salida).write_text(json.dumps(resultado, indent=2))
+    if args.compara and not compara(resultado, json.loads(Path(args.compara).read_text()), args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# Invalidaciones recientes que se recuerdan para decidir si un resultado calculado
+# en paralelo sigue vigente; con más invalidaciones entre medio se descarta siempre
+_INVALIDACIONES_RECORDADAS = 256
+
+
+class ResultCache:
+    def __init__(self, nombre: str, max_entradas: int = 128, ttl: Optional[float] = 300.0):
+        """
+        Caché LRU acotado con expiración (TTL en segundos, None = sin expiración).
+
+        Las claves son tuplas cuyo segundo y tercer elemento son el inicio y el fin del
+        rango de fechas, lo que permite invalidar por rango con invalida_rango().
+
+        obtiene() y obtiene_async() calculan una sola vez por clave aunque lleguen varios
+        pedidos a la vez, y no guardan un resultado si su rango se invalidó mientras se
+        calculaba (la lectura puede ser anterior a la escritura que invalidó).
+        """
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        # Cálculos en curso por clave, compartidos entre hilos y event loops
+        self._en_curso: dict[Hashable, Future] = {}
+        # Cada invalidación sube la generación; se recuerdan las últimas con su rango
+        self._generacion = 0
+        self._invalidaciones = deque(maxlen=_INVALIDACIONES_RECORDADAS)
+        self.hits = 0
+        self.misses = 0
+        self.expiradas = 0
+        self.desalojadas = 0
+        self.invalidadas = 0
+        self.coalescidas = 0
+        self.descartadas = 0
+
+    @property
+    def generacion(self) -> int:
+        return self._generacion
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._get(key, default)
+
+    def _get(self, key: Hashable, default: Any) -> Any:
+        entrada = self._entradas.get(key)
+        if entrada is None:
+            self.misses += 1
+            return default
+        valor, guardado_en = entrada
+        if self.ttl is not None and time.monotonic() - guardado_en > self.ttl:
+            del self._entradas[key]
+            self.expiradas += 1
+            self.misses += 1
+            return default
+        self._entradas.move_to_end(key)
+        self.hits += 1
+        return valor
+
+    def set(self, key: Hashable, valor: Any, generacion: Optional[int] = None) -> bool:
+        """
+        Guarda `valor`. Con `generacion` (la leída antes de calcularlo) no lo guarda si
+        desde entonces se invalidó un rango que incluye la clave. Devuelve si se guardó.
+        """
+        with self._lock:
+            if generacion is not None and self._invalidada_desde(key, generacion):
+                self.descartadas += 1
+                return False
+            self._entradas[key] = (valor, time.monotonic())
+            self._entradas.move_to_end(key)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojadas += 1
+            return True
+
+    def _invalidada_desde(self, key: Hashable, generacion: int) -> bool:
+        if generacion == self._generacion:
+            return False
+        if not self._invalidaciones or self._invalidaciones[0][0] > generacion + 1:
+            # Hubo más invalidaciones de las que se recuerdan
+            return True
+        return any(
+            _se_cruza(key, desde, hasta)
+            for numero, desde, hasta in self._invalidaciones
+            if numero > generacion
+        )
+
+    def _inicia(self, key: Hashable):
+        """Hit, cálculo en curso de otro pedido, o un cálculo nuevo a cargo del llamador."""
+        with self._lock:
+            valor = self._get(key, None)
+            if valor is not None:
+                return valor, None, None
+            futuro = self._en_curso.get(key)
+            if futuro is not None:
+                self.coalescidas += 1
+                return None, futuro, None
+            futuro = self._en_curso[key] = Future()
+            return None, None, (futuro, self._generacion)
+
+    def _termina(self, key: Hashable, futuro: Future, generacion: int, valor: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._en_curso.get(key) is futuro:
+                del self._en_curso[key]
+        if error is not None:
+            futuro.set_exception(error)
+        else:
+            self.set(key, valor, generacion)
+            futuro.set_result(valor)
+
+    def obtiene(self, key: Hashable, calcula: Callable[[], Any]) -> Any:
+        """
+        Valor de `key`; si no está, lo calcula con `calcula()` una sola vez aunque otros
+        hilos lo pidan a la vez (esperan ese mismo cálculo) y lo guarda si sigue vigente.
+        """
+        valor, en_curso, propio = self._inicia(key)
+        if valor is not None:
+            return valor
+        if en_curso is not None:
+            return en_curso.result()
+        futuro, generacion = propio
+        try:
+            valor = calcula()
+        except BaseException as e:
+            self._termina(key, futuro, generacion, error=e)
+            raise
+        self._termina(key, futuro, generacion, valor)
+        return valor
+
+    async def obtiene_async(self, key: Hashable, calcula: Callable[[], Awaitable[Any]]) -> Any:
+        """Igual que obtiene(), con `calcula()` una corrutina; la espera no bloquea el event loop."""
+        valor, en_curso, propio = self._inicia(key)
+        if valor is not None:
+            return valor
+        if en_curso is not None:
+            return await asyncio.shield(asyncio.wrap_future(en_curso))
+        futuro, generacion = propio
+        # El cálculo corre en su propia tarea: si se cancela este pedido (cliente
+        # desconectado), los que esperan el mismo cálculo reciben igual el resultado
+        tarea = asyncio.ensure_future(calcula())
+        tarea.add_done_callback(lambda tarea: self._termina_tarea(key, futuro, generacion, tarea))
+        return await asyncio.shield(tarea)
+
+    def _termina_tarea(self, key: Hashable, futuro: Future, generacion: int, tarea: asyncio.Future) -> None:
+        if tarea.cancelled():
+            self._termina(key, futuro, generacion, error=asyncio.CancelledError())
+        elif tarea.exception() is not None:
+            self._termina(key, futuro, generacion, error=tarea.exception())
+        else:
+            self._termina(key, futuro, generacion, tarea.result())
+
+    def invalida_rango(self, desde: Optional[datetime], hasta: Optional[datetime]) -> int:
+        """
+        Elimina las entradas cuyo rango de fechas se cruza con [desde, hasta].
+        Si no se conoce el rango escrito (None), elimina todas. Los cálculos en curso
+        de esos rangos no se guardarán y los pedidos siguientes calculan de nuevo.
+        """
+        with self._lock:
+            self._generacion += 1
+            self._invalidaciones.append((self._generacion, desde, hasta))
+            eliminadas = [key for key in self._entradas if _se_cruza(key, desde, hasta)]
+            for key in eliminadas:
+                del self._entradas[key]
+            for key in [key for key in self._en_curso if _se_cruza(key, desde, hasta)]:
+                del self._en_curso[key]
+            self.invalidadas += len(eliminadas)
+            return len(eliminadas)
+
+    def clear(self) -> None:
+        self.invalida_rango(None, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "nombre": self.nombre,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+                "expiradas": self.expiradas,
+                "desalojadas": self.desalojadas,
+                "invalidadas": self.invalidadas,
+                "en_curso": len(self._en_curso),
+                "coalescidas": self.coalescidas,
+                "descartadas": self.descartadas,
+            }
+
+
+def _se_cruza(key: Hashable, desde: Optional[datetime], hasta: Optional[datetime]) -> bool:
+    """Si el rango de la clave (key[1], key[2]) se cruza con [desde, hasta]; None = todo."""
+    if desde is None or hasta is None:
+        return True
+    return key[1] <= hasta and desde <= key[2]
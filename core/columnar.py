@@ -0,0 +1,147 @@
+import io
+import os
+import re
+import tempfile
+from typing import Iterator, Optional
+
+import pandas as pd
+from sqlalchemy import Integer, String, bindparam, text
+from sqlalchemy.dialects import postgresql
+
+# Tamaño en memoria del buffer de COPY con psycopg2 antes de pasar a un archivo temporal
+COPY_BUFFER_MB = int(os.getenv("COPY_BUFFER_MB", "256"))
+
+# Dialecto con paramstyle "named" para renderizar la consulta con literales sin duplicar
+# los '%' del texto (p. ej. el operador % de pg_trgm en sql/consulta1.sql)
+_DIALECTO_LITERAL = postgresql.dialect(paramstyle="named")
+
+# Texto con que COPY escribe los NULL: distinto del texto vacío (que en CSV sale como "")
+NULO = r"\N"
+
+# Tipos de columna que entiende lee_columnar
+TEXTO = "texto"
+ENTERO = "entero"
+FECHA = "fecha"
+CATEGORIA = "categoria"
+ARREGLO_ENTEROS = "arreglo_enteros"
+
+
+def sql_con_literales(query: str, params: dict) -> str:
+    """
+    Renderiza la consulta con sus parámetros como literales SQL (escapados por
+    SQLAlchemy), ya que COPY no admite parámetros enlazados. Los parámetros que la
+    consulta no usa se ignoran, igual que al ejecutarla con parámetros.
+    """
+    binds = []
+    for nombre, valor in params.items():
+        if not re.search(rf"(?<![:\w]):{nombre}\b", query):
+            continue
+        if isinstance(valor, (list, tuple)):
+            tipo = Integer if all(isinstance(v, int) for v in valor) else String
+            binds.append(bindparam(nombre, list(valor), type_=postgresql.ARRAY(tipo)))
+        else:
+            binds.append(bindparam(nombre, valor))
+    stmt = text(query.strip().rstrip(";")).bindparams(*binds)
+    return str(stmt.compile(dialect=_DIALECTO_LITERAL, compile_kwargs={"literal_binds": True}))
+
+
+class _LectorCopy(io.RawIOBase):
+    """Adapta el iterador de bloques de COPY (psycopg 3) a un archivo de solo lectura."""
+
+    def __init__(self, bloques):
+        self._bloques = iter(bloques)
+        self._bloque = memoryview(b"")
+        self._posicion = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        # psycopg 3 entrega un bloque por fila: cada llamada llena el buffer con tantos
+        # bloques como quepan, en vez de devolver una fila por lectura
+        escritos, total = 0, len(buffer)
+        while escritos < total:
+            if self._posicion >= len(self._bloque):
+                try:
+                    self._bloque = memoryview(next(self._bloques)).cast("B")
+                except StopIteration:
+                    break
+                self._posicion = 0
+            n = min(total - escritos, len(self._bloque) - self._posicion)
+            buffer[escritos:escritos + n] = self._bloque[self._posicion:self._posicion + n]
+            self._posicion += n
+            escritos += n
+        return escritos
+
+
+def _arreglo_enteros(valor: str) -> list[int]:
+    if valor == NULO:
+        return []
+    valor = valor.strip("{}")
+    return [int(v) for v in valor.split(",")] if valor else []
+
+
+def _lee_csv(archivo, tipos: dict, chunk_size: Optional[int]):
+    fechas = [columna for columna, tipo in tipos.items() if tipo == FECHA]
+    return pd.read_csv(
+        archivo,
+        names=list(tipos),
+        header=None,
+        # Solo NULO es nulo: textos como "NA", "null" o "" se conservan tal cual
+        keep_default_na=False,
+        na_values=[NULO],
+        dtype={
+            columna: ("category" if tipo == CATEGORIA else str)
+            for columna, tipo in tipos.items()
+            if tipo in (TEXTO, CATEGORIA)
+        },
+        converters={
+            columna: _arreglo_enteros for columna, tipo in tipos.items() if tipo == ARREGLO_ENTEROS
+        },
+        parse_dates=fechas,
+        date_format={columna: "%Y-%m-%d" for columna in fechas},
+        chunksize=chunk_size,
+    )
+
+
+def _ajusta_enteros(df: pd.DataFrame, tipos: dict) -> pd.DataFrame:
+    # Int32 nullable siempre: el dtype no cambia entre lotes según traigan nulos o no
+    for columna, tipo in tipos.items():
+        if tipo == ENTERO:
+            df[columna] = df[columna].astype("Int32")
+    return df
+
+
+def lee_columnar(conn, query: str, params: dict, tipos: dict, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Ejecuta la consulta con COPY (...) TO STDOUT en CSV sobre la conexión SQLAlchemy
+    `conn` y la parsea directamente a columnas tipadas con pandas, sin crear un objeto
+    Python por fila. `tipos` es {columna: tipo} en el orden del SELECT.
+
+    Entrega DataFrames de a lo más `chunk_size` filas (uno solo si es None). Con
+    psycopg 3 el CSV se parsea a medida que llega; con psycopg2 se acumula primero
+    en un buffer que pasa a disco sobre COPY_BUFFER_MB.
+    """
+    copy_sql = f"COPY (\n{sql_con_literales(query, params)}\n) TO STDOUT WITH (FORMAT csv, NULL '{NULO}')"
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            with tempfile.SpooledTemporaryFile(max_size=COPY_BUFFER_MB * 1024 * 1024) as buffer:
+                cursor.copy_expert(copy_sql, buffer)
+                buffer.seek(0)
+                yield from _parsea(buffer, tipos, chunk_size)
+        else:
+            with cursor.copy(copy_sql) as copy:
+                yield from _parsea(io.BufferedReader(_LectorCopy(copy), 1024 * 1024), tipos, chunk_size)
+    finally:
+        cursor.close()
+
+
+def _parsea(archivo, tipos: dict, chunk_size: Optional[int]) -> Iterator[pd.DataFrame]:
+    if chunk_size is None:
+        yield _ajusta_enteros(_lee_csv(archivo, tipos, None), tipos)
+        return
+    with _lee_csv(archivo, tipos, chunk_size) as lector:
+        for df in lector:
+            if not df.empty:
+                yield _ajusta_enteros(df, tipos)
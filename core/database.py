@@ -1,24 +1,255 @@
 # app/core/database.py
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
+from core.metricas import POOL_AGOTADO, POOL_ESPERA_SEGUNDOS, metricas
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
-# Leer datos de conexión desde las variables de entorno
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
 
-# Crear URL de conexión a la base de datos
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+def config_conexion() -> dict:
+    """
+    Datos de conexión (DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS) leídos del entorno
+    al llamarla, no al importar el módulo: un load_dotenv posterior también se respeta.
+    """
+    return {clave: os.getenv(f"DB_{clave.upper()}") for clave in ("host", "port", "name", "user", "pass")}
 
-# Crear el motor de la base de datos
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=10, max_overflow=20, pool_timeout=30)
 
-# Crear una sesión para interactuar con la base de datos
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def url_conexion(asincrono: bool = False) -> str:
+    """URL de conexión a la base; con `asincrono`, la del driver asyncpg de los endpoints async."""
+    c = config_conexion()
+    dialecto = "postgresql+asyncpg" if asincrono else "postgresql"
+    return f"{dialecto}://{c['user']}:{c['pass']}@{c['host']}:{c['port']}/{c['name']}"
+
+
+# Cargas de trabajo con pool propio: "interactivo" para los requests de la API y
+# "lote" para masivos, umbrales, snapshot y procesos de carga o migración. Un masivo
+# solo toma conexiones del pool "lote", así que no puede dejar sin conexiones a /score.
+INTERACTIVO = "interactivo"
+LOTE = "lote"
+
+# Valores por defecto de cada pool. Se sobrescriben con DB_POOL_<CARGA>_<PARÁMETRO>
+# (p. ej. DB_POOL_LOTE_SIZE=8 o DB_POOL_INTERACTIVO_STATEMENT_TIMEOUT=60000), que se
+# leen al crear el motor. timeout y recycle en segundos; statement_timeout en
+# milisegundos, aplicado por el servidor a cada sentencia (0 = sin límite).
+# El motor async de la API usa la configuración "interactivo" con un pool aparte.
+POOL_DEFAULTS = {
+    INTERACTIVO: {
+        "size": 10,
+        "max_overflow": 20,
+        "timeout": 30.0,
+        "recycle": 1800,
+        "pre_ping": True,
+        "statement_timeout": 120000,
+    },
+    LOTE: {
+        "size": 4,
+        "max_overflow": 2,
+        "timeout": 600.0,
+        "recycle": 1800,
+        "pre_ping": True,
+        "statement_timeout": 0,
+    },
+}
+
+_carga_actual: ContextVar[str] = ContextVar("carga_actual", default=INTERACTIVO)
+
+
+def config_pool(carga: str) -> dict:
+    """Configuración del pool de `carga`: POOL_DEFAULTS con lo que defina el entorno."""
+    config = {}
+    for parametro, defecto in POOL_DEFAULTS[carga].items():
+        valor = os.getenv(f"DB_POOL_{carga.upper()}_{parametro.upper()}", "")
+        if valor == "":
+            config[parametro] = defecto
+        elif isinstance(defecto, bool):
+            config[parametro] = valor.lower() in ("1", "true")
+        else:
+            config[parametro] = type(defecto)(valor)
+    return config
+
+
+def _pool_medido(base, pool: str):
+    """
+    Subclase del pool que registra cuánto espera cada checkout por una conexión y
+    cuántas veces se agotó el pool_timeout esperando.
+    """
+    class PoolMedido(base):
+        def _do_get(self):
+            inicio = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                POOL_AGOTADO.incrementa(pool=pool)
+                raise
+            finally:
+                POOL_ESPERA_SEGUNDOS.observa(time.perf_counter() - inicio, pool=pool)
+
+    return PoolMedido
+
+
+def _connect_args(config: dict, url: str) -> dict:
+    connect_args = {}
+    # Sentencias preparadas del lado del servidor: con psycopg 3 una consulta se prepara
+    # después de SQL_PREPARE_THRESHOLD ejecuciones en la misma conexión (vacío = nunca).
+    # psycopg2 no prepara sentencias: ahí solo aplica el caché de compilación de SQLAlchemy.
+    if make_url(url).get_dialect().driver == "psycopg":
+        umbral = os.getenv("SQL_PREPARE_THRESHOLD", "5")
+        connect_args["prepare_threshold"] = int(umbral) if umbral else None
+    if config["statement_timeout"]:
+        connect_args["options"] = f"-c statement_timeout={config['statement_timeout']}"
+    return connect_args
+
+
+def _connect_args_async(config: dict) -> dict:
+    # asyncpg guarda hasta SQL_PREPARED_CACHE sentencias preparadas por conexión
+    connect_args = {"prepared_statement_cache_size": int(os.getenv("SQL_PREPARED_CACHE", "256"))}
+    if config["statement_timeout"]:
+        connect_args["server_settings"] = {"statement_timeout": str(config["statement_timeout"])}
+    return connect_args
+
+
+class Pools:
+    def __init__(self):
+        """
+        Motores (y sus pools) por carga de trabajo, creados al primer uso con la
+        configuración y los datos de conexión vigentes en ese momento.
+        """
+        self._motores = {}
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def _crea(self, nombre: str, carga: str, asincrono: bool):
+        config = config_pool(carga)
+        opciones = dict(
+            pool_size=config["size"],
+            max_overflow=config["max_overflow"],
+            pool_timeout=config["timeout"],
+            pool_recycle=config["recycle"],
+            pool_pre_ping=config["pre_ping"],
+        )
+        if asincrono:
+            motor = create_async_engine(
+                url_conexion(asincrono=True),
+                poolclass=_pool_medido(AsyncAdaptedQueuePool, nombre),
+                connect_args=_connect_args_async(config),
+                **opciones,
+            )
+        else:
+            url = url_conexion()
+            motor = create_engine(
+                url,
+                poolclass=_pool_medido(QueuePool, nombre),
+                connect_args=_connect_args(config, url),
+                **opciones,
+            )
+        self._configs[nombre] = config
+        return motor
+
+    def _obtiene(self, nombre: str, carga: str, asincrono: bool = False):
+        motor = self._motores.get(nombre)
+        if motor is None:
+            with self._lock:
+                motor = self._motores.get(nombre)
+                if motor is None:
+                    motor = self._motores[nombre] = self._crea(nombre, carga, asincrono)
+        return motor
+
+    def motor(self, carga: Optional[str] = None) -> Engine:
+        """Motor sync de `carga` (por defecto, la carga del contexto actual)."""
+        carga = carga or _carga_actual.get()
+        return self._obtiene(carga, carga)
+
+    def motor_async(self) -> AsyncEngine:
+        """Motor async (asyncpg) de los endpoints de la API."""
+        return self._obtiene(f"{INTERACTIVO}_async", INTERACTIVO, asincrono=True)
+
+    def _pool(self, nombre: str):
+        motor = self._motores[nombre]
+        return motor.sync_engine.pool if isinstance(motor, AsyncEngine) else motor.pool
+
+    def estadisticas(self) -> dict:
+        """Uso de cada pool creado: conexiones en uso, libres, capacidad y saturación."""
+        resultado = {}
+        for nombre in list(self._motores):
+            config = self._configs[nombre]
+            pool = self._pool(nombre)
+            en_uso = pool.checkedout()
+            capacidad = config["size"] + max(config["max_overflow"], 0)
+            resultado[nombre] = {
+                "en_uso": en_uso,
+                "libres": pool.checkedin(),
+                "capacidad": capacidad,
+                "saturacion": round(en_uso / capacidad, 4) if capacidad else None,
+                "agotado": POOL_AGOTADO.valor(pool=nombre),
+                "config": config,
+            }
+        return resultado
+
+    async def cierra(self) -> None:
+        """Cierra las conexiones de todos los pools; se vuelven a crear al siguiente uso."""
+        with self._lock:
+            motores, self._motores, self._configs = self._motores, {}, {}
+        for motor in motores.values():
+            if isinstance(motor, AsyncEngine):
+                await motor.dispose()
+            else:
+                motor.dispose()
+
+
+# Pools compartidos por todo el proceso
+pools = Pools()
+
+metricas.indicador(
+    "susesoml_pool_conexiones",
+    "Conexiones de cada pool por estado (en_uso, libres)",
+    ("pool", "estado"),
+    lambda: {
+        (nombre, estado): datos[estado]
+        for nombre, datos in pools.estadisticas().items()
+        for estado in ("en_uso", "libres")
+    },
+)
+metricas.indicador(
+    "susesoml_pool_capacidad",
+    "Máximo de conexiones de cada pool (pool_size + max_overflow)",
+    ("pool",),
+    lambda: {(nombre,): datos["capacidad"] for nombre, datos in pools.estadisticas().items()},
+)
+
+
+@contextmanager
+def carga(nombre: str):
+    """Las consultas del bloque (y de los hilos que copien su contexto) usan el pool `nombre`."""
+    token = _carga_actual.set(nombre)
+    try:
+        yield
+    finally:
+        _carga_actual.reset(token)
+
+
+def motor(carga: Optional[str] = None) -> Engine:
+    return pools.motor(carga)
+
+
+def motor_async() -> AsyncEngine:
+    return pools.motor_async()
+
+
+_Sesion = sessionmaker(autocommit=False, autoflush=False)
+
+
+def sesion() -> Session:
+    """Sesión sobre el motor de la carga actual."""
+    return _Sesion(bind=pools.motor())
+
@@ -0,0 +1,294 @@
+"""
+Diccionario de especialidades canónicas: cada texto de especialidad, normalizado,
+apunta a un id entero (ml.especialidad_alias -> ml.especialidad_canonica).
+
+El diccionario se construye desde la base (catálogo y diagnósticos de licencias)
+agrupando los textos por similitud de trigramas, respetando las correcciones manuales,
+y el servicio lo mantiene en memoria para resolver especialidades sin trabajo difuso por fila.
+
+Uso:
+    python -m core.especialidades construye
+    python -m core.especialidades alias "<texto>" "<nombre canónico>"
+    python -m core.especialidades resuelve "<texto>"
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from typing import Hashable, Optional
+
+from sqlalchemy import text
+
+from core.database import LOTE, motor
+from core.metricas import evento
+
+# Similitud mínima de trigramas para agrupar textos (la misma que usaba sql/consulta1.sql)
+ESPECIALIDAD_UMBRAL = float(os.getenv("ESPECIALIDAD_UMBRAL", "0.8"))
+# Segundos entre recargas del diccionario en memoria
+ESPECIALIDAD_TTL = float(os.getenv("ESPECIALIDAD_TTL", "600"))
+
+PALABRAS = re.compile(r"[0-9a-z]+")
+
+
+def normaliza(texto: Optional[str]) -> str:
+    """Sin tildes, en minúsculas y con los espacios colapsados (como ml.f_unaccent(lower(...)))."""
+    if texto is None:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas al estilo pg_trgm: por palabra, con dos espacios antes y uno después."""
+    resultado = set()
+    for palabra in PALABRAS.findall(texto):
+        palabra = f"  {palabra} "
+        resultado.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return resultado
+
+
+def similitud(a: set, b: set) -> float:
+    """similarity() de pg_trgm sobre conjuntos de trigramas ya calculados."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def agrupa(textos: dict, canonicos: list, manuales: dict, umbral: float = ESPECIALIDAD_UMBRAL) -> dict:
+    """
+    Asigna a cada texto ({texto original: frecuencia}) el nombre de su especialidad
+    canónica. Se respetan primero las correcciones `manuales` ({texto normalizado:
+    nombre}); luego cada texto, del más al menos frecuente, se une al canónico más
+    parecido con similitud mayor que `umbral` (como similarity() > 0.8 en SQL) o pasa a
+    ser uno nuevo. Los `canonicos` existentes van
+    primero, para que los nombres (y sus ids) no cambien entre construcciones.
+
+    Devuelve {texto normalizado: (nombre canónico, origen)}.
+    """
+    representantes = [(nombre, trigramas(normaliza(nombre))) for nombre in canonicos]
+    resultado = {normalizado: (nombre, "manual") for normalizado, nombre in manuales.items()}
+
+    normalizados = {}
+    for texto, cantidad in textos.items():
+        normalizado = normaliza(texto)
+        if not normalizado:
+            continue
+        # Entre las variantes de un mismo texto normalizado, el nombre es la más frecuente
+        actual = normalizados.get(normalizado)
+        if actual is None or cantidad > actual[1]:
+            normalizados[normalizado] = (texto.strip(), cantidad + (actual[1] if actual else 0))
+        else:
+            normalizados[normalizado] = (actual[0], actual[1] + cantidad)
+
+    for normalizado, (nombre, _) in sorted(normalizados.items(), key=lambda item: -item[1][1]):
+        if normalizado in resultado:
+            continue
+        propios = trigramas(normalizado)
+        mejor, mejor_similitud = None, 0.0
+        for canonico, trigramas_canonico in representantes:
+            valor = 1.0 if normaliza(canonico) == normalizado else similitud(propios, trigramas_canonico)
+            if valor > mejor_similitud:
+                mejor, mejor_similitud = canonico, valor
+        if mejor is not None and mejor_similitud > umbral:
+            resultado[normalizado] = (mejor, "exacta" if mejor_similitud == 1.0 else "trigram")
+        else:
+            representantes.append((nombre, propios))
+            resultado[normalizado] = (nombre, "exacta")
+    return resultado
+
+
+def _canonicas(conn) -> dict:
+    return {
+        nombre: id_canonica
+        for id_canonica, nombre in conn.execute(text(
+            "SELECT id_especialidad_canonica, nombre FROM ml.especialidad_canonica ORDER BY id_especialidad_canonica"
+        ))
+    }
+
+
+def _asegura_canonica(conn, nombre: str) -> int:
+    conn.execute(
+        text("INSERT INTO ml.especialidad_canonica (nombre) VALUES (:nombre) ON CONFLICT (nombre) DO NOTHING"),
+        {"nombre": nombre},
+    )
+    return conn.execute(
+        text("SELECT id_especialidad_canonica FROM ml.especialidad_canonica WHERE nombre = :nombre"),
+        {"nombre": nombre},
+    ).scalar()
+
+
+def construye() -> dict:
+    """
+    (Re)construye ml.especialidad_alias y ml.especialidad_profesional.id_especialidad_canonica
+    en una sola transacción. Los alias con origen 'manual' no se modifican.
+    """
+    with motor(LOTE).begin() as conn:
+        with open("./sql/especialidades_textos.sql", "r") as archivo:
+            textos = {texto: int(cantidad) for texto, cantidad in conn.execute(text(archivo.read()))}
+        canonicas = _canonicas(conn)
+        manuales = {
+            normalizado: nombre
+            for normalizado, nombre in conn.execute(text(
+                "SELECT a.texto_normalizado, c.nombre FROM ml.especialidad_alias a"
+                " JOIN ml.especialidad_canonica c USING (id_especialidad_canonica)"
+                " WHERE a.origen = 'manual'"
+            ))
+        }
+
+        asignacion = agrupa(textos, list(canonicas), manuales)
+        for nombre, _ in set(asignacion.values()):
+            if nombre not in canonicas:
+                canonicas[nombre] = _asegura_canonica(conn, nombre)
+
+        alias = [
+            {"texto": normalizado, "id": canonicas[nombre], "origen": origen}
+            for normalizado, (nombre, origen) in asignacion.items()
+            if origen != "manual"
+        ]
+        if alias:
+            conn.execute(text(
+                "INSERT INTO ml.especialidad_alias (texto_normalizado, id_especialidad_canonica, origen)"
+                " VALUES (:texto, :id, :origen)"
+                " ON CONFLICT (texto_normalizado) DO UPDATE"
+                " SET id_especialidad_canonica = EXCLUDED.id_especialidad_canonica,"
+                "     origen = EXCLUDED.origen, actualizado_en = now()"
+                " WHERE ml.especialidad_alias.origen <> 'manual'"
+            ), alias)
+
+        catalogo = conn.execute(text(
+            "SELECT id_especialidad_profesional, descripcion_especialidad_profesional FROM ml.especialidad_profesional"
+        )).fetchall()
+        ids, canonicos = [], []
+        for id_especialidad, descripcion in catalogo:
+            asignado = asignacion.get(normaliza(descripcion))
+            ids.append(id_especialidad)
+            canonicos.append(canonicas[asignado[0]] if asignado else None)
+        conn.execute(text(
+            "UPDATE ml.especialidad_profesional ep SET id_especialidad_canonica = v.id_canonica"
+            " FROM unnest(CAST(:ids AS int4[]), CAST(:canonicos AS int4[])) AS v(id, id_canonica)"
+            " WHERE ep.id_especialidad_profesional = v.id"
+        ), {"ids": ids, "canonicos": canonicos})
+
+    diccionario_especialidades.invalida()
+    return {
+        "textos": len(asignacion),
+        "canonicas": len({nombre for nombre, _ in asignacion.values()}),
+        "catalogo": len(catalogo),
+    }
+
+
+def agrega_alias(texto: str, nombre: str) -> int:
+    """
+    Registra una corrección manual: `texto` apunta a la especialidad canónica `nombre`
+    (que se crea si no existe). Para que llegue al catálogo hay que volver a construir.
+    """
+    with motor(LOTE).begin() as conn:
+        id_canonica = _asegura_canonica(conn, nombre.strip())
+        conn.execute(text(
+            "INSERT INTO ml.especialidad_alias (texto_normalizado, id_especialidad_canonica, origen)"
+            " VALUES (:texto, :id, 'manual')"
+            " ON CONFLICT (texto_normalizado) DO UPDATE"
+            " SET id_especialidad_canonica = EXCLUDED.id_especialidad_canonica, origen = 'manual', actualizado_en = now()"
+        ), {"texto": normaliza(texto), "id": id_canonica})
+    diccionario_especialidades.invalida()
+    return id_canonica
+
+
+class DiccionarioEspecialidades:
+    def __init__(self, ttl: float = ESPECIALIDAD_TTL, umbral: float = ESPECIALIDAD_UMBRAL):
+        """
+        Copia en memoria de ml.especialidad_alias, recargada cada `ttl` segundos.
+
+        Un texto se resuelve por igualdad de su forma normalizada; si no está en el
+        diccionario, por el alias de mayor similitud de trigramas mayor que `umbral`
+        (el resultado queda memorizado). Si la base no está disponible se conserva la
+        copia anterior (vacía si nunca cargó) y se reintenta en la siguiente consulta;
+        sin id, canonica() compara por el texto normalizado y SQL por trigramas.
+        """
+        self.ttl = ttl
+        self.umbral = umbral
+        self._alias = {}
+        self._trigramas = {}
+        self._resueltos = {}
+        self._cargado_en = None
+        self._lock = threading.Lock()
+
+    def invalida(self) -> None:
+        with self._lock:
+            self._cargado_en = None
+
+    def _carga(self) -> bool:
+        try:
+            with motor().connect() as conn:
+                alias = dict(conn.execute(text(
+                    "SELECT texto_normalizado, id_especialidad_canonica FROM ml.especialidad_alias"
+                )).fetchall())
+        except Exception as e:
+            # Sin marcar _cargado_en: la siguiente consulta vuelve a intentar
+            evento("especialidades_error", error=str(e))
+            return False
+        self._alias = alias
+        self._trigramas = {texto: trigramas(texto) for texto in alias}
+        self._resueltos = {}
+        self._cargado_en = time.monotonic()
+        return True
+
+    def carga(self) -> bool:
+        """Carga el diccionario desde la base (al iniciar el servidor). False si falló."""
+        with self._lock:
+            return self._carga()
+
+    def _vigente(self) -> None:
+        if self._cargado_en is not None and time.monotonic() - self._cargado_en < self.ttl:
+            return
+        with self._lock:
+            if self._cargado_en is not None and time.monotonic() - self._cargado_en < self.ttl:
+                return
+            self._carga()
+
+    def id_de(self, texto: Optional[str]) -> Optional[int]:
+        """
+        Id canónico de la especialidad, o None si no se reconoce. Puede recargar el
+        diccionario desde la base: desde código async llamarlo en un hilo.
+        """
+        self._vigente()
+        normalizado = normaliza(texto)
+        if normalizado in self._alias:
+            return self._alias[normalizado]
+        if normalizado not in self._resueltos:
+            if len(self._resueltos) >= 10000:
+                self._resueltos = {}
+            propios = trigramas(normalizado)
+            mejor, mejor_similitud = None, 0.0
+            for alias, trigramas_alias in self._trigramas.items():
+                valor = similitud(propios, trigramas_alias)
+                if valor > mejor_similitud:
+                    mejor, mejor_similitud = alias, valor
+            self._resueltos[normalizado] = self._alias[mejor] if mejor_similitud > self.umbral else None
+        return self._resueltos[normalizado]
+
+    def canonica(self, texto: Optional[str]) -> Hashable:
+        """Clave para comparar especialidades: el id canónico o, si no hay, el texto normalizado."""
+        id_canonica = self.id_de(texto)
+        return id_canonica if id_canonica is not None else normaliza(texto)
+
+
+# Diccionario compartido por todo el proceso
+diccionario_especialidades = DiccionarioEspecialidades()
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "construye":
+        print(json.dumps(construye(), indent=2))
+    elif comando == "alias" and len(sys.argv) == 4:
+        print(json.dumps({"id_especialidad_canonica": agrega_alias(sys.argv[2], sys.argv[3])}))
+    elif comando == "resuelve" and len(sys.argv) == 3:
+        print(json.dumps({"id_especialidad_canonica": diccionario_especialidades.id_de(sys.argv[2])}))
+    else:
+        print(__doc__)
+        sys.exit(1)
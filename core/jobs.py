@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+
+from core.metricas import MASIVO_ERRORES, MASIVO_ETAPA_SEGUNDOS, MASIVO_LICENCIAS, MASIVO_SEGUNDOS, evento
+from core.perfilador import perfil_actual, perfila
+from core.services import parse_dates
+
+# Cantidad de ejecuciones masivas que pueden correr en paralelo contra la base de datos
+MASIVO_MAX_WORKERS = int(os.getenv("MASIVO_MAX_WORKERS", "2"))
+# Cantidad de jobs terminados que se conservan para consulta
+MASIVO_MAX_HISTORIAL = int(os.getenv("MASIVO_MAX_HISTORIAL", "100"))
+# Cantidad máxima de errores y de resultados de muestra que guarda cada job
+MASIVO_MAX_ERRORES = int(os.getenv("MASIVO_MAX_ERRORES", "20"))
+MASIVO_TAMANO_MUESTRA = int(os.getenv("MASIVO_TAMANO_MUESTRA", "10"))
+
+ESTADOS_ACTIVOS = ("queued", "running")
+# Estados finales: done (sin errores), partial (fallaron algunas escrituras de lotes) y
+# failed (la ejecución se interrumpió o no se pudo escribir ningún lote)
+ESTADOS_CON_ERROR = ("partial", "failed")
+
+
+class MasivoJob:
+    def __init__(self, fecha_inicio: str, fecha_fin: str, opciones: Optional[dict] = None):
+        """
+        Estado y progreso de una ejecución masiva para un rango de fechas, con las
+        `opciones` con que se lanzó (modo, tamaño de lote, etc.).
+
+        El progreso es de tamaño acotado: contadores, conteos por regla, a lo más
+        MASIVO_MAX_ERRORES errores y MASIVO_TAMANO_MUESTRA resultados de muestra.
+        Los resultados completos se paginan desde ml.propensity_score.
+        """
+        self.job_id = uuid.uuid4().hex
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.opciones = dict(opciones or {})
+        self.estado = "queued"
+        self.total = 0
+        self.procesadas = 0
+        self.lotes = 0
+        self.por_regla = {}
+        self.errores = []
+        self.errores_total = 0
+        self.escrituras = 0
+        self.muestra = []
+        self.etapas = {}
+        self.error = None
+        self._lock = threading.Lock()
+        self.creado_en = datetime.now()
+        self.iniciado_en = None
+        self.terminado_en = None
+
+    @property
+    def rango(self) -> str:
+        return f"{self.fecha_inicio}_{self.fecha_fin}"
+
+    @property
+    def key(self) -> str:
+        """Rango y opciones: dos jobs con la misma clave hacen exactamente el mismo trabajo."""
+        return self.rango + "".join(f"_{nombre}={valor}" for nombre, valor in sorted(self.opciones.items()))
+
+    def registra_regla(self, regla: str, licencias: int, marcadas: int) -> None:
+        with self._lock:
+            conteo = self.por_regla.setdefault(regla, {"licencias": 0, "marcadas": 0})
+            conteo["licencias"] += licencias
+            conteo["marcadas"] += marcadas
+            self.escrituras += 1
+
+    def registra_etapa(self, etapa: str, desde: float) -> float:
+        """Suma a `etapa` el tiempo transcurrido desde `desde` (perf_counter); devuelve el instante actual."""
+        ahora = time.perf_counter()
+        with self._lock:
+            self.etapas[etapa] = self.etapas.get(etapa, 0.0) + ahora - desde
+        MASIVO_ETAPA_SEGUNDOS.incrementa(ahora - desde, etapa=etapa)
+        return ahora
+
+    def registra_error(self, regla: str, reason: str) -> None:
+        with self._lock:
+            self.errores_total += 1
+            if len(self.errores) < MASIVO_MAX_ERRORES:
+                self.errores.append({"regla": regla, "reason": reason})
+
+    def estado_final(self) -> str:
+        """Estado de un job cuya tarea terminó sin lanzar excepción, según sus escrituras."""
+        with self._lock:
+            if not self.errores_total:
+                return "done"
+            return "partial" if self.escrituras else "failed"
+
+    def agrega_muestra(self, registros: list[dict]) -> None:
+        with self._lock:
+            faltantes = MASIVO_TAMANO_MUESTRA - len(self.muestra)
+            if faltantes > 0:
+                self.muestra.extend(registros[:faltantes])
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            por_regla = {regla: dict(conteo) for regla, conteo in self.por_regla.items()}
+            errores = list(self.errores)
+            muestra = list(self.muestra)
+            etapas = {etapa: round(segundos, 3) for etapa, segundos in self.etapas.items()}
+        return {
+            "job_id": self.job_id,
+            "fecha_inicio": self.fecha_inicio,
+            "fecha_fin": self.fecha_fin,
+            "opciones": dict(self.opciones),
+            "status": self.estado,
+            "total": self.total,
+            "procesadas": self.procesadas,
+            "lotes": self.lotes,
+            "por_regla": por_regla,
+            "errores": errores,
+            "errores_total": self.errores_total,
+            "muestra": muestra,
+            "etapas_segundos": etapas,
+            "error": self.error,
+            "creado_en": self.creado_en.isoformat(),
+            "iniciado_en": self.iniciado_en.isoformat() if self.iniciado_en else None,
+            "terminado_en": self.terminado_en.isoformat() if self.terminado_en else None,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = MASIVO_MAX_WORKERS, max_historial: int = MASIVO_MAX_HISTORIAL):
+        """
+        Administrador de ejecuciones masivas compartido por todo el proceso.
+
+        Los jobs se ejecutan en un pool acotado de hilos. Si ya hay un job en cola o
+        en ejecución para el mismo rango de fechas y las mismas opciones, se devuelve
+        ese mismo job.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="masivo")
+        self._max_historial = max_historial
+        self._jobs = {}
+        self._activos = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, fecha_inicio: str, fecha_fin: str, tarea: Callable[[MasivoJob], None], opciones: Optional[dict] = None
+    ) -> MasivoJob:
+        """
+        Encola `tarea(job)` para el rango indicado, o devuelve el job activo del mismo
+        rango (normalizado, p. ej. 2024-1-1 = 2024-01-01) y las mismas `opciones`.
+        """
+        inicio, fin = parse_dates(fecha_inicio, fecha_fin)
+        job = MasivoJob(f"{inicio:%Y-%m-%d}", f"{fin:%Y-%m-%d}", opciones)
+        with self._lock:
+            job_id = self._activos.get(job.key)
+            if job_id is not None:
+                return self._jobs[job_id]
+
+            self._jobs[job.job_id] = job
+            self._activos[job.key] = job.job_id
+            self._purga_historial()
+
+        # Si el request que encola el job se está perfilando, el job se perfila aparte
+        # (termina después de la respuesta) y se guarda como masivo_<job_id>
+        ejecuta = self._ejecuta_perfilado if perfil_actual() is not None else self._ejecuta
+        self._executor.submit(ejecuta, job, tarea)
+        return job
+
+    def get(self, job_id: str) -> Optional[MasivoJob]:
+        return self._jobs.get(job_id)
+
+    def lista(self) -> list[dict]:
+        return [job.to_dict() for job in list(self._jobs.values())]
+
+    def _ejecuta_perfilado(self, job: MasivoJob, tarea: Callable[[MasivoJob], None]) -> None:
+        with perfila(f"masivo_{job.job_id}", job_id=job.job_id, rango=job.key) as perfil:
+            self._ejecuta(job, tarea)
+            for etapa, segundos in job.etapas.items():
+                perfil.registra_fase(f"masivo_{etapa}", segundos)
+
+    def _ejecuta(self, job: MasivoJob, tarea: Callable[[MasivoJob], None]) -> None:
+        job.estado = "running"
+        job.iniciado_en = datetime.now()
+        try:
+            tarea(job)
+            # Los errores de escritura de cada lote se registran en el job sin interrumpirlo
+            job.estado = job.estado_final()
+            if job.estado == "failed":
+                job.error = f"Fallaron las {job.errores_total} escrituras de scores del masivo"
+        except Exception as e:
+            job.estado = "failed"
+            job.error = str(e)
+        finally:
+            if job.estado in ESTADOS_CON_ERROR:
+                MASIVO_ERRORES.incrementa(estado=job.estado)
+            if job.estado == "failed":
+                evento("masivo_error", job_id=job.job_id, rango=job.key, error=job.error)
+            job.terminado_en = datetime.now()
+            segundos = (job.terminado_en - job.iniciado_en).total_seconds()
+            MASIVO_SEGUNDOS.observa(segundos, estado=job.estado)
+            MASIVO_LICENCIAS.incrementa(job.procesadas)
+            resumen = job.to_dict()
+            evento(
+                "masivo_terminado",
+                job_id=job.job_id,
+                rango=job.key,
+                estado=job.estado,
+                segundos=round(segundos, 3),
+                **{campo: resumen[campo] for campo in ("procesadas", "lotes", "etapas_segundos", "por_regla", "errores_total")},
+            )
+            with self._lock:
+                if self._activos.get(job.key) == job.job_id:
+                    del self._activos[job.key]
+
+    def _purga_historial(self) -> None:
+        terminados = [
+            job for job in self._jobs.values() if job.estado not in ESTADOS_ACTIVOS
+        ]
+        for job in terminados[:max(0, len(terminados) - self._max_historial)]:
+            del self._jobs[job.job_id]
+
+
+# Administrador compartido por todo el proceso
+job_manager = JobManager()
@@ -1,57 +1,247 @@
+import asyncio
+import csv
+import io
+import re
+from functools import partial
+from typing import AsyncIterator, Optional
+import pandas as pd
 from core.manager_pickle import ManagerPickle
-from core.services import query_regla_negocio,query_masivo,query_score,query_score_licencia
+from core.cache import ResultCache
+from core.database import LOTE, carga
+from core.serializacion import EscritorParquet, StreamArrow, dumps, pa
+from core.jobs import MasivoJob, job_manager
+from core.umbrales import ejecuta_umbrales
+from core.services import MASIVO_CHUNK_SIZE,parse_dates,query_regla_negocio_async,query_regla_negocio_lote,query_resultados_masivo,stream_masivo,query_score_async,query_score_licencia_async,query_score_licencia_pagina_async,stream_score_licencia_async,query_rns_score_async,score_cache
 
-execute_scores_map = {}
+# Rangos para los que /score ya lanzó la ejecución masiva (acotado, expira en 1 día)
+execute_scores_map = ResultCache("masivos_lanzados", max_entradas=1024, ttl=24 * 3600)
 
-def consulta_unitaria(
+def regla_de_columna(nombre_columna: str) -> int:
+    """rn de la regla a partir del nombre de la columna de score (propensity_score_rn_<rn>)."""
+    coincidencia = re.search(r"rn_(\d+)$", nombre_columna)
+    if coincidencia is None:
+        raise ValueError(f"nombre_columna debe terminar en rn_<número de regla>: {nombre_columna}")
+    return int(coincidencia.group(1))
+
+
+async def consulta_unitaria_async(
     fecha_inicio: str,
     fecha_fin: str,
     especialidad_profesional: str,
     cod_diagnostico_principal: str,
     nombre_columna: str,
-):
-    from_db = query_regla_negocio(
-        cod_diagnostico_principal, especialidad_profesional, fecha_inicio, fecha_fin
+) -> pd.DataFrame:
+    """
+    Licencias sin score de la regla de `nombre_columna` para el diagnóstico y la
+    especialidad del rango. La consulta usa el motor asíncrono y el puntaje (CPU) se
+    ejecuta en un hilo para no bloquear el event loop. Devuelve el DataFrame puntuado,
+    que el endpoint serializa directo a JSON.
+    """
+    rn = regla_de_columna(nombre_columna)
+    from_db = await query_regla_negocio_async(
+        cod_diagnostico_principal, especialidad_profesional, fecha_inicio, fecha_fin, rn
     )
-    #Ojo procesar y luego listar scored
     if from_db.empty:
-        return []
-    result = ManagerPickle().ejecuta_regla_negocio(
-        "business_rule_model",
-        from_db,
-        nombre_columna,
-        cod_diagnostico_principal,
-        especialidad_profesional,
+        return from_db
+    return await asyncio.to_thread(
+        ManagerPickle().puntua_regla_negocio, f"business_model_rn_{rn}.pkl", from_db, rn
     )
-    return result
 
 
-def masivo(fecha_inicio: str, fecha_fin: str):
-    from_db = query_masivo(fecha_inicio, fecha_fin)
+def consulta_lote(
+    fecha_inicio: str,
+    fecha_fin: str,
+    combinaciones: list[tuple[str, str]],
+    nombre_columna: str,
+) -> pd.DataFrame:
+    """
+    consulta_unitaria_async para muchas combinaciones (cod_diagnostico_principal,
+    especialidad_profesional) del mismo rango: una sola consulta, un solo puntaje
+    vectorizado y un solo upsert. Devuelve las licencias puntuadas con la columna
+    "combinacion" (posición desde 0 en `combinaciones`).
+    """
+    rn = regla_de_columna(nombre_columna)
+    from_db = query_regla_negocio_lote(combinaciones, fecha_inicio, fecha_fin, rn)
     if from_db.empty:
-        return []
-    result = ManagerPickle().ejecuta_masivo(from_db, fecha_inicio, fecha_fin)
+        return from_db
+    result = ManagerPickle().puntua_regla_negocio(f"business_model_rn_{rn}.pkl", from_db, rn)
+    result["combinacion"] = from_db.loc[result.index, "combinacion"]
     return result
 
-def propensy_score(fecha_inicio: str, fecha_fin: str):
+
+def _ejecuta_masivo_job(
+    job: MasivoJob,
+    chunk_size: Optional[int] = None,
+    paralelo: bool = False,
+    incremental: bool = False,
+    umbrales: bool = False,
+):
+    chunk_size = chunk_size or MASIVO_CHUNK_SIZE
+    manager = ManagerPickle(chunk_size, paralelo)
+    # Lecturas y upserts del masivo (incluidos sus hilos) van por el pool de lote
+    with carga(LOTE):
+        versiones = manager.versiones_modelos() if incremental else None
+        lotes = stream_masivo(job.fecha_inicio, job.fecha_fin, chunk_size, versiones)
+        manager.ejecuta_pipeline(lotes, job)
+        # Las ventanas se guardan sobre las filas de score ya escritas por el pipeline
+        if umbrales:
+            ejecuta_umbrales(job.fecha_inicio, job.fecha_fin, job)
+
+
+def _opciones_masivo(
+    chunk_size: Optional[int] = None,
+    paralelo: bool = False,
+    incremental: bool = False,
+    umbrales: bool = False,
+) -> dict:
+    """Opciones que distinguen un job masivo de otro del mismo rango (chunk_size ya resuelto)."""
+    return {
+        "chunk_size": chunk_size or MASIVO_CHUNK_SIZE,
+        "paralelo": paralelo,
+        "incremental": incremental,
+        "umbrales": umbrales,
+    }
+
+
+def masivo(
+    fecha_inicio: str,
+    fecha_fin: str,
+    chunk_size: Optional[int] = None,
+    paralelo: bool = False,
+    incremental: bool = False,
+    umbrales: bool = False,
+):
+    """
+    Encola la ejecución masiva del rango en el administrador de jobs compartido.
+    Si ya hay un job activo para el mismo rango y las mismas opciones se devuelve ese job.
+    En modo incremental solo se puntúan las licencias sin score de la versión vigente del modelo.
+    Con umbrales se calculan además las ventanas por médico de los modelos de umbrales.
+    """
+    opciones = _opciones_masivo(chunk_size, paralelo, incremental, umbrales)
+    job = job_manager.submit(fecha_inicio, fecha_fin, partial(_ejecuta_masivo_job, **opciones), opciones)
+    return job.to_dict()
+
+
+def estado_masivo(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return None
+    return job.to_dict()
+
+def resultados_masivo(job_id: str, limite: int, despues_id_lic: str, despues_rn: int):
+    """
+    Pagina los scores del rango de un job desde ml.propensity_score.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return None
+    return query_resultados_masivo(job.fecha_inicio, job.fecha_fin, limite, despues_id_lic, despues_rn)
+
+async def propensy_score_async(fecha_inicio: str, fecha_fin: str):
     key = makeKeyFromFechas(fecha_inicio, fecha_fin)
-    
-    if len(execute_scores_map) == 0 or execute_scores_map.get(key) is None:
-        from_db = query_masivo(fecha_inicio, fecha_fin)
-        if from_db.empty:
-            return []
-        ManagerPickle().ejecuta_masivo(from_db, fecha_inicio, fecha_fin)
-        execute_scores_map[key] = "run"
-    
-    from_db = query_score(fecha_inicio, fecha_fin)
-    return from_db
-
-def propensy_score_licencia(fecha_inicio: str, fecha_fin: str):
-    from_db = query_score_licencia(fecha_inicio, fecha_fin)
-    return from_db
+
+    if execute_scores_map.get(key) is None:
+        job_manager.submit(fecha_inicio, fecha_fin, _ejecuta_masivo_job, _opciones_masivo())
+        execute_scores_map.set(key, "run")
+
+    return await query_score_async(fecha_inicio, fecha_fin)
+
+async def propensy_score_licencia_async(fecha_inicio: str, fecha_fin: str):
+    return await query_score_licencia_async(fecha_inicio, fecha_fin)
+
+async def propensy_score_licencia_pagina_async(fecha_inicio: str, fecha_fin: str, limite: int, despues_id_lic: str = ""):
+    return await query_score_licencia_pagina_async(fecha_inicio, fecha_fin, limite, despues_id_lic)
+
+COLUMNAS_SCORE_LICENCIA = [
+    "licencia",
+    "fecha_emision",
+    "rut_medico",
+    "dias_reposo",
+    "cod_diagnostico",
+    "especialidad_medico",
+]
+
+async def propensy_score_licencia_ndjson(fecha_inicio: str, fecha_fin: str) -> AsyncIterator[bytes]:
+    """
+    /score/details como NDJSON (una licencia por línea), escrito página a página.
+    """
+    async for filas in stream_score_licencia_async(fecha_inicio, fecha_fin):
+        yield b"".join(dumps(fila) + b"\n" for fila in filas)
+
+async def propensy_score_licencia_csv(fecha_inicio: str, fecha_fin: str) -> AsyncIterator[str]:
+    """
+    /score/details como CSV, escrito página a página. Los scores van en una
+    columna por regla (rn_N), según las reglas con scores en el rango.
+    """
+    columnas_rn = [f"rn_{rn}" for rn in await query_rns_score_async(fecha_inicio, fecha_fin)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS_SCORE_LICENCIA + columnas_rn)
+    yield buffer.getvalue()
+
+    async for filas in stream_score_licencia_async(fecha_inicio, fecha_fin):
+        buffer.seek(0)
+        buffer.truncate()
+        for fila in filas:
+            writer.writerow(
+                [fila[columna] for columna in COLUMNAS_SCORE_LICENCIA]
+                + [fila["score"].get(columna) for columna in columnas_rn]
+            )
+        yield buffer.getvalue()
+
+def _esquema_score_licencia(columnas_rn: list[str]):
+    """Esquema Arrow fijo de /score/details, igual para todas las páginas del stream."""
+    return pa.schema(
+        [
+            ("licencia", pa.string()),
+            ("fecha_emision", pa.timestamp("us")),
+            ("rut_medico", pa.string()),
+            ("dias_reposo", pa.int32()),
+            ("cod_diagnostico", pa.string()),
+            ("especialidad_medico", pa.string()),
+        ]
+        + [(columna, pa.float64()) for columna in columnas_rn]
+    )
+
+def _df_score_licencia(filas: list[dict], columnas_rn: list[str]) -> pd.DataFrame:
+    """Una página de /score/details como DataFrame plano: una columna por regla (rn_N), como el CSV."""
+    df = pd.DataFrame(filas, columns=COLUMNAS_SCORE_LICENCIA)
+    df["fecha_emision"] = pd.to_datetime(df["fecha_emision"])
+    for columna in columnas_rn:
+        df[columna] = pd.to_numeric(pd.Series([fila["score"].get(columna) for fila in filas], dtype=object))
+    return df
+
+async def propensy_score_licencia_arrow(fecha_inicio: str, fecha_fin: str) -> AsyncIterator[bytes]:
+    """
+    /score/details como stream Arrow IPC: un record batch por página, con esquema fijo.
+    """
+    columnas_rn = [f"rn_{rn}" for rn in await query_rns_score_async(fecha_inicio, fecha_fin)]
+    stream = StreamArrow(_esquema_score_licencia(columnas_rn))
+    async for filas in stream_score_licencia_async(fecha_inicio, fecha_fin):
+        yield stream.escribe(_df_score_licencia(filas, columnas_rn))
+    yield stream.cierra()
+
+async def propensy_score_licencia_parquet(fecha_inicio: str, fecha_fin: str) -> bytes:
+    """
+    /score/details como archivo Parquet (un row group por página). Parquet escribe sus
+    metadatos al final, así que el archivo se arma completo antes de responder.
+    """
+    columnas_rn = [f"rn_{rn}" for rn in await query_rns_score_async(fecha_inicio, fecha_fin)]
+    escritor = EscritorParquet(_esquema_score_licencia(columnas_rn))
+    async for filas in stream_score_licencia_async(fecha_inicio, fecha_fin):
+        escritor.escribe(_df_score_licencia(filas, columnas_rn))
+    return escritor.cierra()
 
 def makeKeyFromFechas(fecha_inicio: str, fecha_fin: str):
     """
-    Genera una clave única basada en fecha_inicio y fecha_fin.
+    Genera una clave única basada en el rango de fechas normalizado.
     """
-    return f"{fecha_inicio}_{fecha_fin}"    
\ No newline at end of file
+    fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
+    return ("masivo", fecha_inicio_date, fecha_fin_date)
+
+
+def estadisticas_cache():
+    return {
+        "score": score_cache.stats(),
+        "masivos_lanzados": execute_scores_map.stats(),
+    }    
\ No newline at end of file
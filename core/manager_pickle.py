@@ -2,11 +2,27 @@ from datetime import datetime
 import sys
 import dill as pickle
 from pathlib import Path
-from typing import Hashable
+from typing import Hashable, Iterable, Iterator, Optional
+import contextvars
+import math
+import multiprocessing
+import os
+import numpy as np
 import pandas as pd
-import asyncio
+import queue
 import threading
-from core.services import update_propensity_score_licencias
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from core.especialidades import diccionario_especialidades
+from core.jobs import MASIVO_TAMANO_MUESTRA, MasivoJob
+from core.metricas import PUNTAJE_FILAS, PUNTAJE_MARCADAS, PUNTAJE_SEGUNDOS, evento
+from core.perfilador import fase, une_hilo
+from core.services import DIAS_REPOSO_MAX, MASIVO_CHUNK_SIZE, update_propensity_score_licencias
+from core.model_registry import registry
+
+# Compara la especialidad de las reglas compiladas por id canónico (core/especialidades.py)
+# en vez de por texto exacto; cambia los resultados respecto de predict_prob, por eso es opcional
+REGLAS_ESPECIALIDAD_CANONICA = os.getenv("REGLAS_ESPECIALIDAD_CANONICA", "0") == "1"
 
 class BusinessModel:
     def __init__(self, hyperparameters):
@@ -19,7 +35,7 @@ class BusinessModel:
         """
         Limita días de reposo y convierte fechas.
         """
-        df = df[df['dias_reposo'] <= 365]
+        df = df[df['dias_reposo'] <= DIAS_REPOSO_MAX]
         df['fecha_emision'] = pd.to_datetime(df['fecha_emision'], errors='coerce')
         return df
 
@@ -50,128 +66,410 @@ class BusinessModel:
         df = self.apply_business_rule(df)
         return df
 
+    def compila(self):
+        """
+        Devuelve (y deja en caché en la instancia) la regla compilada desde los hiperparámetros.
+        """
+        regla = self.__dict__.get('_regla_compilada')
+        if regla is None:
+            regla = ReglaCompilada(self.hyperparameters)
+            self._regla_compilada = regla
+        return regla
+
 
 sys.modules['__main__'].BusinessModel = BusinessModel
 
+
+def codifica(df: pd.DataFrame) -> dict:
+    """
+    Codifica como enteros (códigos, valores únicos) las columnas de texto que usan las
+    reglas. Los nulos quedan con código -1. Si la columna ya es categórica se reutilizan
+    sus códigos. Se calcula una vez por lote y se comparte entre todas las reglas.
+    """
+    codificado = {}
+    for columna in ("especialidad_profesional", "cod_diagnostico_principal"):
+        serie = df[columna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codificado[columna] = (serie.cat.codes.to_numpy(), serie.cat.categories)
+        else:
+            codes, uniques = pd.factorize(serie)
+            codificado[columna] = (codes, pd.Index(uniques))
+    return codificado
+
+
+class ReglaCompilada:
+    def __init__(self, hyperparameters):
+        """
+        Versión precompilada de BusinessModel.predict_prob para el puntaje masivo.
+
+        Las condiciones de especialidad y diagnóstico se evalúan una vez por valor
+        distinto (tablas indexadas por código) y se aplican a las filas como máscaras
+        NumPy, sin copiar el DataFrame. puntua() devuelve la misma columna de score
+        que predict_prob(df)[name]: mismas filas, mismo índice y dtype int64.
+        """
+        filtro = hyperparameters['filter']
+        self.nombre = hyperparameters['name']
+        self.limite = hyperparameters['below_limit']
+        self.especialidades = list(filtro['especialidad_profesional'])
+        self.prefijo = filtro['cod_diagnostico_principal']
+        # Los nulos de especialidad se comparan como "" (fillna de apply_business_rule)
+        self.especialidad_vacia = "" in self.especialidades
+
+    def _tabla_especialidad(self, uniques: pd.Index) -> np.ndarray:
+        tabla = np.empty(len(uniques) + 1, dtype=bool)
+        if REGLAS_ESPECIALIDAD_CANONICA:
+            # Una búsqueda en el diccionario por valor distinto, no por fila
+            canonicas = {diccionario_especialidades.canonica(e) for e in self.especialidades}
+            tabla[:-1] = [diccionario_especialidades.canonica(e) in canonicas for e in uniques]
+        else:
+            tabla[:-1] = uniques.isin(self.especialidades)
+        tabla[-1] = self.especialidad_vacia
+        return tabla
+
+    def _tabla_diagnostico(self, uniques: pd.Index) -> np.ndarray:
+        tabla = np.zeros(len(uniques) + 1, dtype=bool)
+        if len(uniques):
+            tabla[:-1] = pd.Series(uniques, dtype=object).astype(str).str.startswith(self.prefijo).fillna(False).to_numpy(dtype=bool)
+        return tabla
+
+    def puntua(self, df: pd.DataFrame, codificado: Optional[dict] = None) -> pd.Series:
+        codificado = codificado or codifica(df)
+
+        # Los nulos (NaN o pd.NA de Int32) no son vigentes, como en preprocess()
+        vigentes = (df['dias_reposo'] <= DIAS_REPOSO_MAX).to_numpy(dtype=bool, na_value=False)
+        dias = df['dias_reposo'].to_numpy(dtype=float, na_value=np.nan)[vigentes]
+
+        codes_esp, uniques_esp = codificado['especialidad_profesional']
+        codes_diag, uniques_diag = codificado['cod_diagnostico_principal']
+        codes_esp = codes_esp[vigentes]
+        codes_diag = codes_diag[vigentes]
+
+        # El código -1 (nulo) indexa la última posición de cada tabla
+        cumple_especialidad = self._tabla_especialidad(uniques_esp)[codes_esp]
+        cumple_diagnostico = self._tabla_diagnostico(uniques_diag)[codes_diag]
+
+        nulos_diag = codes_diag == -1
+        if nulos_diag.any():
+            # Los nulos se evalúan igual que en la regla original (astype(str) del valor)
+            diagnosticos = df['cod_diagnostico_principal'].to_numpy()[vigentes][nulos_diag]
+            cumple_diagnostico[nulos_diag] = pd.Series(diagnosticos, dtype=object).astype(str).str.startswith(self.prefijo).fillna(False).to_numpy(dtype=bool)
+
+        marcadas = cumple_especialidad & cumple_diagnostico & (dias >= self.limite)
+        return pd.Series(marcadas.astype(np.int64), index=df.index[vigentes], name=self.nombre)
+
+# Columnas que consumen los modelos de reglas de negocio
+COLUMNAS_MODELO = ["id_licencia", "dias_reposo", "fecha_emision", "fecha_inicio_reposo", "especialidad_profesional", "cod_diagnostico_principal"]
+# Columnas del lote que acompañan a los scores hasta el upsert (rn_pendientes solo en modo incremental)
+COLUMNAS_SALIDA = ["id_licencia", "folio", "fecha_emision", "rn_pendientes"]
+
+# Modo paralelo: procesos del pool de puntaje y tamaño mínimo de cada partición
+MASIVO_PROCESOS = int(os.getenv("MASIVO_PROCESOS", str(os.cpu_count() or 1)))
+MASIVO_MIN_PARTICION = int(os.getenv("MASIVO_MIN_PARTICION", "10000"))
+
+# Columnas de texto con pocos valores distintos: viajan a los procesos como categóricas
+COLUMNAS_CATEGORICAS = ["especialidad_profesional", "cod_diagnostico_principal"]
+# El score se alinea por índice, así que id_licencia no necesita viajar a los procesos
+COLUMNAS_PARTICION = [columna for columna in COLUMNAS_MODELO if columna != "id_licencia"]
+
+_pool_puntaje = None
+_pool_lock = threading.Lock()
+
+
+def _inicializa_worker(model_names: tuple) -> None:
+    """Precarga los modelos en el registro del proceso worker."""
+    # Con spawn, __main__ del worker se reemplaza después de importar este módulo
+    sys.modules['__main__'].BusinessModel = BusinessModel
+    for model_name in model_names:
+        registry.get(model_name)
+
+
+def _registra_puntaje(score_name: str, puntaje: pd.Series, segundos: Optional[float] = None) -> None:
+    if segundos is not None:
+        PUNTAJE_SEGUNDOS.observa(segundos, regla=score_name)
+    PUNTAJE_FILAS.incrementa(int(puntaje.notna().sum()), regla=score_name)
+    PUNTAJE_MARCADAS.incrementa(int((puntaje == 1).sum()), regla=score_name)
+
+
+def _puntua_modelo(modelo, score_name: str, data: pd.DataFrame, codificado: Optional[dict] = None) -> pd.Series:
+    """
+    Columna de score de un modelo: usa la regla compilada si el modelo la ofrece y,
+    si no, predict_prob.
+    """
+    inicio = time.perf_counter()
+    with fase("puntaje"):
+        if hasattr(modelo, "compila"):
+            puntaje = modelo.compila().puntua(data, codificado)
+        else:
+            puntaje = modelo.predict_prob(data)[score_name]
+    _registra_puntaje(score_name, puntaje, time.perf_counter() - inicio)
+    return puntaje
+
+
+def _puntua_particion(model_name: str, score_name: str, particion: pd.DataFrame) -> pd.Series:
+    """
+    Unidad de trabajo del pool: una regla sobre una partición. Devuelve solo la
+    columna de score, indexada como la partición de entrada.
+    """
+    modelo = registry.get(model_name)
+    if hasattr(modelo, "compila"):
+        # La regla compilada trabaja directo sobre los códigos de las categóricas
+        return modelo.compila().puntua(particion)
+    for columna in COLUMNAS_CATEGORICAS:
+        particion[columna] = particion[columna].astype(object)
+    return modelo.predict_prob(particion)[score_name]
+
+
+def particiones_paralelo(datos_licencias: pd.DataFrame) -> list[pd.DataFrame]:
+    """
+    Particiones que viajan al pool de puntaje: solo las columnas del modelo, con las
+    de texto como categóricas. multiprocessing las envía con pickle, que copia en bloque
+    los arreglos numpy de cada columna (códigos de las categóricas incluidos);
+    benchmarks/suite.py mide ese costo en el caso "paralelo_transferencia".
+    """
+    data = datos_licencias[COLUMNAS_PARTICION].copy()
+    # Los nulos de diagnóstico viajan como su texto (astype(str)), que es como los compara la regla
+    nulos = data["cod_diagnostico_principal"].isna()
+    if nulos.any():
+        data["cod_diagnostico_principal"] = data["cod_diagnostico_principal"].astype(object)
+        data.loc[nulos, "cod_diagnostico_principal"] = data.loc[nulos, "cod_diagnostico_principal"].astype(str)
+    for columna in COLUMNAS_CATEGORICAS:
+        data[columna] = data[columna].astype("category")
+
+    particiones = max(1, min(MASIVO_PROCESOS, math.ceil(len(data) / MASIVO_MIN_PARTICION)))
+    tamano = math.ceil(len(data) / particiones)
+    return [data.iloc[inicio:inicio + tamano] for inicio in range(0, len(data), tamano)]
+
+
+def pool_puntaje(model_names: list[str]) -> ProcessPoolExecutor:
+    """
+    Pool de procesos compartido para el puntaje paralelo. Se crea en el primer uso con
+    contexto spawn (el proceso padre tiene hilos y conexiones abiertas) y cada worker
+    precarga los modelos una sola vez.
+    """
+    global _pool_puntaje
+    with _pool_lock:
+        if _pool_puntaje is None:
+            _pool_puntaje = ProcessPoolExecutor(
+                max_workers=MASIVO_PROCESOS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_inicializa_worker,
+                initargs=(tuple(model_names),),
+            )
+        return _pool_puntaje
+
+
+def cierra_pool_puntaje() -> None:
+    global _pool_puntaje
+    with _pool_lock:
+        if _pool_puntaje is not None:
+            _pool_puntaje.shutdown(wait=False, cancel_futures=True)
+            _pool_puntaje = None
+
 class ManagerPickle:
-    def __init__(self):
+    def __init__(self, chunk_size: int = MASIVO_CHUNK_SIZE, paralelo: bool = False):
         """
-        Inicializa el administrador con una lista de modelos y mapas para resultados y tareas.
+        Inicializa el administrador con la lista de modelos, el tamaño de lote de la
+        ejecución masiva y si los lotes se puntúan en el pool de procesos.
         """
         self.model_names = ["business_model_rn_1.pkl", "business_model_rn_2.pkl"]
-        self.result_map = {}
-        self._active_tasks = {}
+        self.chunk_size = chunk_size
+        self.paralelo = paralelo
+        self.versiones = {}
 
-    def _generate_request_key(self, fecha_inicio: str, fecha_fin: str) -> str:
+    def puntua_regla_negocio(self, pickle_name: str, datos_licencias: pd.DataFrame, rn: int) -> pd.DataFrame:
         """
-        Genera una clave única basada en fecha_inicio y fecha_fin.
+        Puntúa con predict_prob las licencias de una consulta, guarda sus scores (con el
+        folio de cada licencia) y devuelve el DataFrame puntuado, para serializarlo sin
+        pasar por una lista de dicts. Si falla el modelo o el upsert lanza RuntimeError
+        (no devuelve un resultado vacío), para que el endpoint responda 500.
         """
-        return f"{fecha_inicio}_{fecha_fin}"
-
-    def ejecuta_regla_negocio(self, pickle_name: str, datos_licencias: pd.DataFrame, parametros_licencia: pd.Series, rn: int) -> list[dict]:
-        pickle_path = f"repo_pickle/{pickle_name}"            
-        pickle_path_file = Path(pickle_path)        
-        # Verificar si el archivo pickle existe
-        if not pickle_path_file.exists():
-            raise FileNotFoundError(f"El archivo {pickle_name} no se encuentra en {pickle_path}")
-        
-        columnas = ["id_licencia", "dias_reposo", "fecha_emision", "fecha_inicio_reposo", "especialidad_profesional", "cod_diagnostico_principal"]
-        data = datos_licencias[columnas]
-
         score_name = f'propensity_score_rn_{rn}'
-
         try:
-            # Convertir la serie a diccionario para mayor robustez
-            params_dict = parametros_licencia.to_dict()
-            
-            with open(pickle_path, "rb") as modelo:
-                modelo_cargado = pickle.load(modelo)
-            resultados = modelo_cargado.predict_prob(data)
-            resultados["folio"] = params_dict["folio"]
-            update_propensity_score_licencias(resultados, score_name, rn)
-            return resultados.to_dict(orient='records')
-        except KeyError as e:
-            print(f"Error: Falta la clave {e} en parametros_licencia.")
-            return []
-        except TypeError as e:
-            print(f"Error en los parámetros de predict_prob: {e}. Verifica que filter, name y below_limit sean correctos.")
-            return []
-        except FileNotFoundError as e:
-            print(f"Error: {e}")
-            return []
-        except AttributeError as e:
-            print(f"Error al cargar el modelo: {e}. Asegúrate de que el archivo pickle fue creado con la clase BusinessModel definida en este script.")
-            return []
+            modelo_cargado = registry.get(pickle_name)
+            inicio = time.perf_counter()
+            with fase("puntaje"):
+                resultados = modelo_cargado.predict_prob(datos_licencias[COLUMNAS_MODELO])
+            _registra_puntaje(score_name, resultados[score_name], time.perf_counter() - inicio)
+            resultados["folio"] = datos_licencias.loc[resultados.index, "folio"]
+            update_propensity_score_licencias(
+                resultados, score_name, rn, version_modelo=registry.version(pickle_name)
+            )
+            return resultados
         except Exception as e:
-            print(f"Error inesperado: {e}. Verifica los datos o la compatibilidad del modelo.")
-            return []
-
-    def ejecuta_masivo(self, datos_licencias: pd.DataFrame, fecha_inicio: str, fecha_fin: str) -> dict:
-        request_key = self._generate_request_key(fecha_inicio, fecha_fin)
-        if len(self.result_map) > 0 and self.result_map.get(request_key):
-            return self.result_map[request_key]
-        
-        self.result_map[request_key] = {
-            'status': 'starting',
-            'rules_executed': [],
-            'data': []
+            evento("puntaje_error", modelo=pickle_name, rn=rn, filas=len(datos_licencias), error=str(e))
+            raise RuntimeError(f"Error puntuando la regla {rn} con {pickle_name}: {e}") from e
+
+    def carga_modelos(self) -> dict:
+        """
+        Obtiene desde el registro en memoria cada modelo de self.model_names, indexados por rn.
+        """
+        return {
+            rn: registry.get(model_name)
+            for rn, model_name in enumerate(self.model_names, start=1)
         }
-        
-        def run_background():
-            asyncio.run(self.ini_ejecuta_masivo(datos_licencias, fecha_inicio, fecha_fin))
 
-        thread = threading.Thread(target=run_background)
-        thread.start()
-     
+    def versiones_modelos(self) -> dict:
+        """
+        Versión vigente (hash de contenido) de cada modelo de self.model_names, indexada por rn.
+        """
         return {
-            'status': 'in process',
-            'detail': 'Ejecución masiva iniciada',
-            'rules_executed': [],
-            'data': []
+            rn: registry.version(model_name)
+            for rn, model_name in enumerate(self.model_names, start=1)
         }
 
-    async def ini_ejecuta_masivo(self, datos_licencias: pd.DataFrame, fecha_inicio: str, fecha_fin: str) -> dict:
-        request_key = self._generate_request_key(fecha_inicio, fecha_fin)
-        columnas = ["id_licencia", "dias_reposo", "fecha_emision", "fecha_inicio_reposo", "especialidad_profesional", "cod_diagnostico_principal", "folio"]
-        data = datos_licencias[columnas]
-        results = []
-
-        for index, row in datos_licencias.iterrows():
-            for rn, model_name in enumerate(self.model_names, start=1):
-                try:
-                    single_row_df = datos_licencias.loc[[index], columnas]
-                    result = self.ejecuta_regla_negocio(
-                        model_name,
-                        single_row_df,
-                        row,
-                        rn
+    def puntua_lote(self, datos_licencias: pd.DataFrame, modelos: dict) -> pd.DataFrame:
+        """
+        Ejecuta cada regla una sola vez sobre el lote completo (predict_prob es vectorizado)
+        y devuelve una fila por licencia (id_licencia, folio, fecha_emision) con una columna
+        propensity_score_rn_<rn> por regla.
+        Las licencias descartadas por el preprocesamiento del modelo quedan con score NaN.
+        """
+        data = datos_licencias[COLUMNAS_MODELO]
+        puntajes = datos_licencias[[c for c in COLUMNAS_SALIDA if c in datos_licencias.columns]].copy()
+        codificado = codifica(data)
+
+        for rn, modelo in modelos.items():
+            score_name = f'propensity_score_rn_{rn}'
+            puntajes[score_name] = _puntua_modelo(modelo, score_name, data, codificado)
+
+        return puntajes
+
+    def puntua_lote_paralelo(self, datos_licencias: pd.DataFrame) -> pd.DataFrame:
+        """
+        Igual que puntua_lote, pero reparte unidades (regla × partición) en el pool de
+        procesos. Las columnas de texto viajan como categóricas para reducir el
+        serializado y de vuelta solo viaja la columna de score de cada unidad.
+        """
+        particiones = particiones_paralelo(datos_licencias)
+        pool = pool_puntaje(self.model_names)
+
+        futuros = {}
+        for rn, model_name in enumerate(self.model_names, start=1):
+            score_name = f'propensity_score_rn_{rn}'
+            futuros[score_name] = [
+                pool.submit(_puntua_particion, model_name, score_name, particion)
+                for particion in particiones
+            ]
+
+        puntajes = datos_licencias[[c for c in COLUMNAS_SALIDA if c in datos_licencias.columns]].copy()
+        for score_name, pendientes in futuros.items():
+            puntajes[score_name] = pd.concat([pendiente.result() for pendiente in pendientes])
+            # Las reglas corren en paralelo en otros procesos: aquí solo se cuentan filas;
+            # su tiempo queda en la etapa "puntaje" del job
+            _registra_puntaje(score_name, puntajes[score_name])
+
+        return puntajes
+
+    def ejecuta_pipeline(self, lotes: Iterable[pd.DataFrame], job: Optional[MasivoJob] = None) -> dict:
+        """
+        Pipeline de la ejecución masiva: mientras se puntúa un lote, el siguiente se
+        lee en otro hilo y el anterior se guarda en ml.propensity_score. Como máximo
+        hay un lote en lectura anticipada, uno puntuándose y uno escribiéndose.
+        """
+        job = job or MasivoJob("", "")
+        modelos = self.carga_modelos()
+        self.versiones = self.versiones_modelos()
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="masivo_upsert") as escritor:
+            pendiente = None
+            inicio = 0
+            # Cada etapa acumula el tiempo que el pipeline pasa bloqueado en ella
+            marca = time.perf_counter()
+            for lote in _lectura_anticipada(lotes):
+                marca = job.registra_etapa("lectura", marca)
+                if self.paralelo:
+                    puntajes = self.puntua_lote_paralelo(lote)
+                else:
+                    puntajes = self.puntua_lote(lote, modelos)
+                marca = job.registra_etapa("puntaje", marca)
+                if pendiente is not None:
+                    pendiente.result()
+                    marca = job.registra_etapa("escritura", marca)
+                # El contexto viaja al hilo escritor para que un perfil activo lo incluya
+                pendiente = escritor.submit(contextvars.copy_context().run, self._guarda_lote, puntajes, inicio, job)
+                inicio += len(lote)
+            marca = job.registra_etapa("lectura", marca)
+            if pendiente is not None:
+                pendiente.result()
+                job.registra_etapa("escritura", marca)
+
+        if not job.total:
+            job.total = job.procesadas
+        return job.to_dict()
+
+    def _guarda_lote(self, puntajes: pd.DataFrame, inicio: int, job: MasivoJob) -> None:
+        """
+        Guarda con un upsert por regla los scores de un lote y actualiza el progreso del job.
+        En modo incremental cada regla solo guarda las licencias que la tienen pendiente.
+        """
+        une_hilo()
+        for rn, model_name in enumerate(self.model_names, start=1):
+            score_name = f'propensity_score_rn_{rn}'
+            try:
+                puntuados = puntajes.dropna(subset=[score_name])
+                if "rn_pendientes" in puntuados.columns:
+                    # astype(bool): con el lote vacío map() devuelve object y [] elegiría columnas
+                    puntuados = puntuados[puntuados["rn_pendientes"].map(lambda rns: rn in rns).astype(bool)]
+                if not puntuados.empty:
+                    update_propensity_score_licencias(
+                        puntuados, score_name, rn, version_modelo=self.versiones.get(rn)
                     )
-                    results.append({
-                        'regla': f"ejecuta_regla_negocio_{model_name}_id_{row['id_licencia']}",
-                        'status': 'executed',
-                        'data': result
-                    })
-                    self.result_map[request_key] = {
-                        'status': 'still working',
-                        'rules_executed': results,
-                        'data': data.to_dict(orient='records') 
-                    }                  
-                except Exception as e:
-                    results.append({
-                        'regla': f"ejecuta_regla_negocio_{model_name}_id_{row['id_licencia']}",
-                        'status': 'error',
-                        'reason': str(e)
-                    })
-
-        self.result_map[request_key] = {
-            'status': 'completed' if results else 'no_rules_found',
-            'rules_executed': results,
-            'data': data.to_dict(orient='records')
-        }
-        if request_key in self._active_tasks:
-            del self._active_tasks[request_key]
-        return self.result_map[request_key]
+                job.registra_regla(model_name, len(puntuados), int((puntuados[score_name] == 1).sum()))
+            except Exception as e:
+                job.registra_error(f"{model_name}_lote_{inicio}", str(e))
+
+        if len(job.muestra) < MASIVO_TAMANO_MUESTRA:
+            muestra = puntajes.head(MASIVO_TAMANO_MUESTRA).drop(columns=["rn_pendientes"], errors="ignore")
+            job.agrega_muestra(muestra.astype(object).where(muestra.notna(), None).to_dict(orient='records'))
+        job.lotes += 1
+        job.procesadas += len(puntajes)
+
+
+def _lectura_anticipada(lotes: Iterable[pd.DataFrame], maxsize: int = 1) -> Iterator[pd.DataFrame]:
+    """
+    Consume `lotes` en un hilo aparte para que la lectura del siguiente lote desde la
+    base de datos se superponga con el procesamiento del actual. La cola acotada limita
+    la cantidad de lotes en memoria.
+    """
+    cola = queue.Queue(maxsize=maxsize)
+    detener = threading.Event()
+    fin = object()
+
+    def encola(item) -> bool:
+        while not detener.is_set():
+            try:
+                cola.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def productor():
+        une_hilo()
+        try:
+            for lote in lotes:
+                if not encola(lote):
+                    return
+            encola(fin)
+        except Exception as e:
+            encola(e)
+        finally:
+            # Cierra el generador (y con él el cursor del lado del servidor) si se abandona antes de tiempo
+            cerrar = getattr(lotes, "close", None)
+            if cerrar is not None:
+                cerrar()
 
-    def get_results_by_request(self, fecha_inicio: str, fecha_fin: str) -> dict:
-        request_key = self._generate_request_key(fecha_inicio, fecha_fin)
-        return self.result_map.get(request_key, {'status': 'not_found', 'rules_executed': [], 'data': []})
\ No newline at end of file
+    hilo = threading.Thread(
+        target=contextvars.copy_context().run, args=(productor,), name="masivo_lectura", daemon=True
+    )
+    hilo.start()
+    try:
+        while True:
+            item = cola.get()
+            if item is fin:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        detener.set()
@@ -0,0 +1,211 @@
+"""
+Métricas del servicio en memoria del proceso: contadores e histogramas con etiquetas,
+exportados en el formato de texto de Prometheus (GET /lm/ml/metrics), y eventos de
+log estructurados (un JSON por línea en stdout).
+
+Las métricas son por proceso: con varios workers de uvicorn cada uno expone las suyas.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Optional
+
+# Eventos de log estructurados (METRICAS_LOG=0 los desactiva)
+METRICAS_LOG = os.getenv("METRICAS_LOG", "1") == "1"
+# Las consultas que tardan más que esto (segundos) se registran además como evento
+SQL_LENTA_SEGUNDOS = float(os.getenv("SQL_LENTA_SEGUNDOS", "5"))
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _escapa(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{nombre}="{_escapa(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementa(self, valor: float = 1, **etiquetas) -> None:
+        clave = tuple(etiquetas.get(nombre, "") for nombre in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas) -> float:
+        return self._valores.get(tuple(etiquetas.get(nombre, "") for nombre in self.etiquetas), 0)
+
+    def exporta(self) -> list[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for clave, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS):
+        """Histograma de segundos con buckets fijos; cada serie guarda conteos por bucket, suma y total."""
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observa(self, valor: float, **etiquetas) -> None:
+        clave = tuple(etiquetas.get(nombre, "") for nombre in self.etiquetas)
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = {"buckets": [0] * (len(self.buckets) + 1), "suma": 0.0, "total": 0}
+            serie["buckets"][indice] += 1
+            serie["suma"] += valor
+            serie["total"] += 1
+
+    @contextmanager
+    def mide(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observa(time.perf_counter() - inicio, **etiquetas)
+
+    def resumen(self, **etiquetas) -> dict:
+        serie = self._series.get(tuple(etiquetas.get(nombre, "") for nombre in self.etiquetas))
+        return {"suma": serie["suma"], "total": serie["total"]} if serie else {"suma": 0.0, "total": 0}
+
+    def exporta(self) -> list[str]:
+        with self._lock:
+            series = {clave: {**serie, "buckets": list(serie["buckets"])} for clave, serie in self._series.items()}
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for clave, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), serie["buckets"]):
+                acumulado += conteo
+                le = f'le="{limite}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {serie['suma']}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {serie['total']}")
+        return lineas
+
+
+class Indicador:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple, funcion: Callable[[], dict]):
+        """Valor instantáneo calculado al exportar: `funcion` devuelve {tupla de etiquetas: valor}."""
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+
+    def exporta(self) -> list[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge"]
+        try:
+            valores = self.funcion()
+        except Exception as e:
+            evento("metrica_error", metrica=self.nombre, error=str(e))
+            valores = {}
+        for clave, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registra(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: tuple = ()) -> Contador:
+        return self._registra(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS) -> Histograma:
+        return self._registra(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def indicador(self, nombre: str, ayuda: str, etiquetas: tuple, funcion: Callable[[], dict]) -> Indicador:
+        return self._registra(Indicador(nombre, ayuda, etiquetas, funcion))
+
+    def exporta(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exporta())
+        return "\n".join(lineas) + "\n"
+
+
+def evento(nombre: str, **campos) -> None:
+    """Escribe un evento de log estructurado: una línea JSON con ts, evento y `campos`."""
+    if not METRICAS_LOG:
+        return
+    print(json.dumps({"ts": datetime.now().isoformat(timespec="milliseconds"), "evento": nombre, **campos}, default=str), flush=True)
+
+
+# Registro compartido por todo el proceso
+metricas = RegistroMetricas()
+
+SQL_SEGUNDOS = metricas.histograma(
+    "susesoml_sql_segundos", "Tiempo de ejecución y lectura por archivo de sql/", ("consulta",)
+)
+SQL_FILAS = metricas.contador("susesoml_sql_filas_total", "Filas leídas por archivo de sql/", ("consulta",))
+SQL_ERRORES = metricas.contador("susesoml_sql_errores_total", "Errores por archivo de sql/", ("consulta",))
+POOL_ESPERA_SEGUNDOS = metricas.histograma(
+    "susesoml_pool_espera_segundos", "Espera para obtener una conexión del pool (incluye abrir una nueva)", ("pool",)
+)
+POOL_AGOTADO = metricas.contador(
+    "susesoml_pool_agotado_total", "Checkouts que agotaron pool_timeout esperando una conexión", ("pool",)
+)
+MODELO_CARGA_SEGUNDOS = metricas.histograma(
+    "susesoml_modelo_carga_segundos", "Tiempo de carga (unpickle y compilación) de cada modelo", ("modelo",)
+)
+PUNTAJE_SEGUNDOS = metricas.histograma(
+    "susesoml_puntaje_segundos", "Tiempo de puntaje de un lote por regla (predict_prob o regla compilada)", ("regla",)
+)
+PUNTAJE_FILAS = metricas.contador("susesoml_puntaje_filas_total", "Licencias puntuadas por regla", ("regla",))
+PUNTAJE_MARCADAS = metricas.contador("susesoml_puntaje_marcadas_total", "Licencias marcadas (score 1) por regla", ("regla",))
+UPSERT_LOTE_SEGUNDOS = metricas.histograma(
+    "susesoml_upsert_lote_segundos", "Latencia de cada lote de upsert en ml.propensity_score (con su rollup diario)", ("rn",)
+)
+UPSERT_FILAS = metricas.contador("susesoml_upsert_filas_total", "Registros escritos en ml.propensity_score", ("rn",))
+MASIVO_SEGUNDOS = metricas.histograma(
+    "susesoml_masivo_segundos", "Duración de las ejecuciones masivas por estado final", ("estado",),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+)
+MASIVO_ETAPA_SEGUNDOS = metricas.contador(
+    "susesoml_masivo_etapa_segundos_total",
+    "Segundos acumulados de las ejecuciones masivas por etapa (lectura, puntaje, escritura)",
+    ("etapa",),
+)
+MASIVO_LICENCIAS = metricas.contador("susesoml_masivo_licencias_total", "Licencias procesadas por ejecuciones masivas")
+MASIVO_ERRORES = metricas.contador(
+    "susesoml_masivo_errores_total", "Ejecuciones masivas terminadas con error (failed) o con lotes sin guardar (partial)", ("estado",)
+)
+
+
+def registra_sql(consulta: str, segundos: float, filas: Optional[int] = None, error: bool = False) -> None:
+    SQL_SEGUNDOS.observa(segundos, consulta=consulta)
+    SQL_FILAS.incrementa(filas or 0, consulta=consulta)
+    if error:
+        SQL_ERRORES.incrementa(consulta=consulta)
+    if segundos >= SQL_LENTA_SEGUNDOS:
+        evento("sql_lenta", consulta=consulta, segundos=round(segundos, 3), filas=filas, error=error)
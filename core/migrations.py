@@ -0,0 +1,271 @@
+"""
+Migraciones versionadas del esquema ml (sql/migrations/NNN_nombre.sql) y
+verificación con EXPLAIN de que las consultas de sql/ usan sus índices.
+
+Uso:
+    python -m core.migrations aplica     # aplica las migraciones pendientes
+    python -m core.migrations estado     # lista aplicadas y pendientes
+    python -m core.migrations verifica   # EXPLAIN de cada consulta de sql/
+"""
+import json
+import re
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import text
+
+from core.database import LOTE, motor
+
+MIGRATIONS_DIR = Path("sql/migrations")
+
+DOLLAR_TAG = re.compile(r"\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$")
+
+# CREATE [UNIQUE] INDEX CONCURRENTLY IF NOT EXISTS <índice> ON [<esquema>.]<tabla>
+CREA_INDICE_CONCURRENTE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+ON\s+(?:ONLY\s+)?(?:(\w+)\.)?\w+",
+    re.IGNORECASE,
+)
+
+# Índices que debe poder usar cada consulta de sql/ (ver sql/migrations/)
+INDICES_ESPERADOS = {
+    "consulta1.sql": [
+        "idx_licencias_cod_diagnostico_fecha_emision",
+        "especialidad_profesional_pkey",
+        "idx_epm_rut_medico",
+        "ux_propensity_score_id_lic_rn",
+    ],
+    "consulta1_lote.sql": [
+        "idx_licencias_cod_diagnostico_fecha_emision",
+        "especialidad_profesional_pkey",
+        "idx_epm_rut_medico",
+        "ux_propensity_score_id_lic_rn",
+    ],
+    "masivo.sql": ["idx_licencias_fecha_emision", "idx_lde_id_licencia"],
+    "masivo_incremental.sql": [
+        "idx_licencias_fecha_emision",
+        "idx_lde_id_licencia",
+        "ux_propensity_score_id_lic_rn",
+    ],
+    # Paginadas por keyset con LIMIT: el plan recorre licencias en orden de id_lic
+    # (unique_id_lic) y filtra la fecha, en vez de leer el rango completo por fecha
+    "masivo_resultados.sql": ["unique_id_lic", "ux_propensity_score_id_lic_rn"],
+    "propensy_score_diario.sql": ["propensity_score_diario_pkey"],
+    "propensy_score_licencia.sql": [
+        "unique_id_lic",
+        "idx_lde_id_licencia",
+        "ux_propensity_score_id_lic_rn",
+    ],
+    "propensy_score_resume.sql": [
+        "idx_licencias_fecha_emision",
+        "idx_lde_id_licencia",
+        "ux_propensity_score_id_lic_rn",
+    ],
+    "umbrales.sql": ["idx_licencias_fecha_emision"],
+    # Escritura: EXPLAIN sin ANALYZE no la ejecuta. El upsert de scores se arma en
+    # services.py y el agregado diario lo mantienen los triggers de la migración 009
+    "umbrales_update.sql": ["ux_propensity_score_id_lic_rn"],
+}
+
+# Parámetros de ejemplo para el EXPLAIN (las consultas ignoran los que no usan)
+PARAMS_EXPLAIN = {
+    "fecha_inicio": datetime(2025, 1, 1),
+    "fecha_fin": datetime(2025, 1, 31) + timedelta(days=1) - timedelta(microseconds=1),
+    "cod_diagnostico_principal": "F32",
+    "especialidad_profesional": "Medicina General",
+    "id_especialidad_canonica": 1,
+    "cod_diagnosticos": ["F32", "M54"],
+    "especialidades": ["Medicina General", "Traumatología"],
+    "ids_especialidad": [1, 1],
+    "combinaciones": [0, 1],
+    "rn": 1,
+    "rns": [1, 2],
+    "versiones": ["", ""],
+    "dias_reposo_max": 365,
+    "id_licencia": ["L0000000001", "L0000000002"],
+    "frecuencia_semanal": [0.0, 0.0],
+    "otorgados_semanal": [0.0, 0.0],
+    "frecuencia_quincenal": [0.0, 0.0],
+    "otorgados_quincenal": [0.0, 0.0],
+    "frecuencia_mensual": [0.0, 0.0],
+    "otorgados_mensual": [0.0, 0.0],
+    "despues_id_lic": "",
+    "despues_rn": 0,
+    "limite": 1000,
+}
+
+
+def divide_sentencias(sql: str) -> list[str]:
+    """
+    Divide un script en sentencias por ';', respetando comentarios, literales y
+    cuerpos $tag$...$tag$. CREATE INDEX CONCURRENTLY no admite ir en un bloque
+    multi-sentencia, por eso cada sentencia se ejecuta por separado.
+    """
+    sentencias, actual = [], []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith("--", i):
+            fin = sql.find("\n", i)
+            fin = n if fin == -1 else fin
+            actual.append(sql[i:fin])
+            i = fin
+        elif c == "'":
+            fin = sql.find("'", i + 1)
+            while fin != -1 and sql.startswith("''", fin):
+                fin = sql.find("'", fin + 2)
+            fin = n if fin == -1 else fin + 1
+            actual.append(sql[i:fin])
+            i = fin
+        elif c == "$" and DOLLAR_TAG.match(sql, i):
+            tag = DOLLAR_TAG.match(sql, i).group(0)
+            fin = sql.find(tag, i + len(tag))
+            fin = n if fin == -1 else fin + len(tag)
+            actual.append(sql[i:fin])
+            i = fin
+        elif c == ";":
+            sentencias.append("".join(actual))
+            actual = []
+            i += 1
+        else:
+            actual.append(c)
+            i += 1
+    sentencias.append("".join(actual))
+
+    def tiene_codigo(sentencia: str) -> bool:
+        return any(
+            linea.strip() and not linea.strip().startswith("--")
+            for linea in sentencia.splitlines()
+        )
+
+    return [s.strip() for s in sentencias if tiene_codigo(s)]
+
+
+def _migraciones() -> list[tuple[str, Path]]:
+    return [(path.name.split("_", 1)[0], path) for path in sorted(MIGRATIONS_DIR.glob("*.sql"))]
+
+
+def _aplicadas(conn) -> set[str]:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS ml.schema_migrations ("
+        " version varchar(16) PRIMARY KEY,"
+        " nombre varchar(255) NOT NULL,"
+        " aplicada_en timestamp NOT NULL DEFAULT now())"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM ml.schema_migrations"))}
+
+
+def _descarta_indice_invalido(conn, sentencia: str) -> None:
+    """
+    Si un CREATE INDEX CONCURRENTLY anterior falló (p. ej. por un duplicado escrito
+    durante la construcción), PostgreSQL deja el índice INVALID y IF NOT EXISTS lo
+    saltaría: se elimina para que la sentencia lo vuelva a construir.
+    """
+    creacion = CREA_INDICE_CONCURRENTE.search(sentencia)
+    if creacion is None:
+        return
+    indice, esquema = creacion.groups()
+    nombre = f"{esquema}.{indice}" if esquema else indice
+    invalido = conn.execute(
+        text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:nombre)"),
+        {"nombre": nombre},
+    ).scalar()
+    if invalido:
+        print(f"Eliminando índice inválido {nombre}")
+        conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}")
+
+
+def aplica_migraciones() -> list[str]:
+    """
+    Aplica en orden las migraciones pendientes. Cada sentencia corre en autocommit
+    (requisito de CREATE INDEX CONCURRENTLY); las migraciones usan IF NOT EXISTS
+    para poder reintentarse si una falla a la mitad, y los índices que quedaron
+    inválidos por una construcción fallida se eliminan antes de volver a crearlos.
+    """
+    aplicadas_ahora = []
+    with motor(LOTE).connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        aplicadas = _aplicadas(conn)
+        for version, path in _migraciones():
+            if version in aplicadas:
+                continue
+            print(f"Aplicando migración {path.name}")
+            for sentencia in divide_sentencias(path.read_text()):
+                _descarta_indice_invalido(conn, sentencia)
+                # exec_driver_sql: sin parámetros, el texto se envía tal cual (sin interpretar ':nombre')
+                conn.exec_driver_sql(sentencia)
+            conn.execute(
+                text("INSERT INTO ml.schema_migrations (version, nombre) VALUES (:version, :nombre)"),
+                {"version": version, "nombre": path.name},
+            )
+            aplicadas_ahora.append(path.name)
+    return aplicadas_ahora
+
+
+def estado_migraciones() -> dict:
+    with motor(LOTE).connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        aplicadas = _aplicadas(conn)
+    return {
+        "aplicadas": [path.name for version, path in _migraciones() if version in aplicadas],
+        "pendientes": [path.name for version, path in _migraciones() if version not in aplicadas],
+    }
+
+
+def _indices_del_plan(nodo: dict) -> set[str]:
+    indices = set()
+    if "Index Name" in nodo:
+        indices.add(nodo["Index Name"])
+    for hijo in nodo.get("Plans", []):
+        indices |= _indices_del_plan(hijo)
+    return indices
+
+
+def verifica_indices() -> dict:
+    """
+    Ejecuta EXPLAIN (sin ANALYZE) de cada consulta de INDICES_ESPERADOS con los
+    escaneos secuenciales desactivados, para comprobar que el planificador puede
+    usar los índices esperados aunque las tablas de prueba sean pequeñas. Un índice
+    esperado que existe pero quedó INVALID también hace fallar la consulta.
+    """
+    resultado = {}
+    with motor(LOTE).connect() as conn:
+        # El planificador no usa índices INVALID (construcción concurrente fallida), pero
+        # tampoco los reporta: se buscan aparte para explicar por qué faltan
+        invalidos = {
+            row[0] for row in conn.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+                " JOIN pg_namespace n ON n.oid = c.relnamespace"
+                " WHERE n.nspname = 'ml' AND NOT i.indisvalid"
+            ))
+        }
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for archivo, esperados in INDICES_ESPERADOS.items():
+            query = Path("sql", archivo).read_text().strip().rstrip(";")
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), PARAMS_EXPLAIN).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            usados = _indices_del_plan(plan[0]["Plan"])
+            faltantes = [indice for indice in esperados if indice not in usados]
+            invalidos_consulta = [indice for indice in esperados if indice in invalidos]
+            resultado[archivo] = {
+                "ok": not faltantes and not invalidos_consulta,
+                "usados": sorted(usados),
+                "faltantes": faltantes,
+                "invalidos": invalidos_consulta,
+            }
+        conn.rollback()
+    return resultado
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else "estado"
+    if comando == "aplica":
+        print(json.dumps({"aplicadas": aplica_migraciones()}, indent=2))
+    elif comando == "estado":
+        print(json.dumps(estado_migraciones(), indent=2))
+    elif comando == "verifica":
+        resultado = verifica_indices()
+        print(json.dumps(resultado, indent=2))
+        sys.exit(0 if all(r["ok"] for r in resultado.values()) else 1)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import dill as pickle
+
+from core.metricas import MODELO_CARGA_SEGUNDOS, evento
+
+
+class ModelRegistry:
+    def __init__(self, directorio: str = "repo_pickle", intervalo_revision: float = 5.0):
+        """
+        Registro en memoria de los modelos pickle de un directorio.
+
+        Cada modelo se deserializa una sola vez y se recarga solo cuando cambia
+        el mtime del archivo y además cambia su hash de contenido. La revisión del
+        archivo se hace como máximo una vez cada `intervalo_revision` segundos.
+        """
+        self.directorio = Path(directorio)
+        self.intervalo_revision = intervalo_revision
+        self._modelos = {}
+        self._errores = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash_archivo(path: Path) -> str:
+        sha = hashlib.sha256()
+        with open(path, "rb") as archivo:
+            for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+                sha.update(bloque)
+        return sha.hexdigest()
+
+    def _carga(self, nombre: str, path: Path, mtime: float, sha256: str) -> None:
+        inicio = time.perf_counter()
+        with open(path, "rb") as archivo:
+            modelo = pickle.load(archivo)
+        # Los modelos que lo permiten compilan su regla una sola vez, al cargarse
+        if hasattr(modelo, "compila"):
+            modelo.compila()
+        segundos = time.perf_counter() - inicio
+        MODELO_CARGA_SEGUNDOS.observa(segundos, modelo=nombre)
+        evento("modelo_cargado", modelo=nombre, sha256=sha256[:12], segundos=round(segundos, 4))
+        self._modelos[nombre] = {
+            "modelo": modelo,
+            "path": path,
+            "mtime": mtime,
+            "sha256": sha256,
+            "cargado_en": datetime.now(),
+            "revisado_en": time.monotonic(),
+        }
+        self._errores.pop(nombre, None)
+
+    def carga_todos(self) -> None:
+        """
+        Carga todos los .pkl del directorio. Los que fallan quedan registrados en
+        los errores y no impiden la carga del resto.
+        """
+        for path in sorted(self.directorio.glob("*.pkl")):
+            try:
+                self.get(path.name)
+            except Exception as e:
+                evento("modelo_error", modelo=path.name, error=str(e))
+
+    def get(self, nombre: str):
+        """
+        Devuelve el modelo ya deserializado, cargándolo o recargándolo si es necesario.
+        """
+        entrada = self._modelos.get(nombre)
+        if entrada is not None and time.monotonic() - entrada["revisado_en"] < self.intervalo_revision:
+            return entrada["modelo"]
+
+        with self._lock:
+            path = self.directorio / nombre
+            if not path.exists():
+                raise FileNotFoundError(f"El archivo {nombre} no se encuentra en {path}")
+
+            try:
+                mtime = os.stat(path).st_mtime
+                entrada = self._modelos.get(nombre)
+                if entrada is not None and entrada["mtime"] == mtime:
+                    entrada["revisado_en"] = time.monotonic()
+                    return entrada["modelo"]
+
+                sha256 = self._hash_archivo(path)
+                if entrada is not None and entrada["sha256"] == sha256:
+                    entrada["mtime"] = mtime
+                    entrada["revisado_en"] = time.monotonic()
+                    return entrada["modelo"]
+
+                self._carga(nombre, path, mtime, sha256)
+            except Exception as e:
+                self._errores[nombre] = str(e)
+                raise
+
+            return self._modelos[nombre]["modelo"]
+
+    def versiones(self) -> dict:
+        """
+        Lista los modelos cargados con su versión (hash de contenido) y los que fallaron.
+        """
+        return {
+            "modelos": [
+                {
+                    "nombre": nombre,
+                    "version": entrada["sha256"][:12],
+                    "sha256": entrada["sha256"],
+                    "mtime": datetime.fromtimestamp(entrada["mtime"]).isoformat(),
+                    "cargado_en": entrada["cargado_en"].isoformat(),
+                    "clase": type(entrada["modelo"]).__name__,
+                }
+                for nombre, entrada in sorted(self._modelos.items())
+            ],
+            "errores": dict(self._errores),
+        }
+
+    def version(self, nombre: str) -> str:
+        """Versión corta (hash de contenido) del modelo indicado."""
+        self.get(nombre)
+        return self._modelos[nombre]["sha256"][:12]
+
+
+# Registro compartido por todo el proceso
+registry = ModelRegistry()
@@ -0,0 +1,266 @@
+"""
+Perfilado por request (opcional): un perfilador por muestreo que, cada
+PERFILADO_INTERVALO segundos, toma la pila de los hilos que trabajan para el request
+perfilado, y un desglose del tiempo por fase (sql, dataframe, puntaje, serializacion).
+
+El event loop es un hilo compartido por todos los requests async: en él solo se toma
+la pila mientras corre una tarea del request perfilado (la del middleware, la del
+handler, las que se creen en su contexto con instala_fabrica_tareas() o una que entre
+en una fase), no la de otros requests concurrentes. Los callbacks del driver que corren
+fuera de una tarea (p. ej. la decodificación de filas de asyncpg) no se atribuyen.
+
+Se habilita con PERFILADO=1. Con eso, se perfila un request que trae el header
+X-Perfil: 1 o el parámetro ?perfil=1, y además una fracción PERFILADO_TASA de los
+demás. Cada perfil se guarda en PERFILADO_DIR como:
+    <nombre>.folded   pilas colapsadas ("a;b;c N"), para flamegraph.pl o speedscope
+    <nombre>.json     fases, duración total y metadatos del request
+
+Con PERFILADO=0 no se registra el middleware y cada fase() es una lectura de una
+ContextVar: el costo es despreciable.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from core.metricas import evento
+
+PERFILADO = os.getenv("PERFILADO", "0") == "1"
+PERFILADO_TASA = float(os.getenv("PERFILADO_TASA", "0"))
+PERFILADO_INTERVALO = float(os.getenv("PERFILADO_INTERVALO", "0.005"))
+PERFILADO_DIR = os.getenv("PERFILADO_DIR", "perfiles")
+# Profundidad máxima de pila que se guarda por muestra
+PERFILADO_PROFUNDIDAD = int(os.getenv("PERFILADO_PROFUNDIDAD", "128"))
+
+HEADER_PERFIL = "x-perfil"
+PARAMETRO_PERFIL = "perfil"
+
+_perfil_actual: ContextVar[Optional["Perfil"]] = ContextVar("perfil_actual", default=None)
+
+
+def _pila(frame) -> str:
+    marcos = []
+    while frame is not None and len(marcos) < PERFILADO_PROFUNDIDAD:
+        codigo = frame.f_code
+        marcos.append(f"{codigo.co_name} ({Path(codigo.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(marcos))
+
+
+class Perfil:
+    def __init__(self, nombre: str, intervalo: float = PERFILADO_INTERVALO):
+        """
+        Perfil de un request o job. Los hilos se unen al perfil al entrar en una fase
+        (o con une_hilo()); un hilo aparte toma sus pilas cada `intervalo` segundos.
+        En el hilo de un event loop se une la tarea actual, no el hilo entero.
+        """
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.hilos = set()
+        # {ident del hilo: (loop, tareas del perfil)} de los hilos que corren un event loop
+        self.tareas = {}
+        self.muestras = Counter()
+        self.fases = {}
+        self._detener = threading.Event()
+        self._muestreador = None
+        self._lock = threading.Lock()
+        self.inicio = None
+        self.segundos = None
+
+    def agrega_hilo(self, ident: int) -> None:
+        if ident not in self.hilos:
+            with self._lock:
+                self.hilos = self.hilos | {ident}
+
+    def agrega_tarea(self, ident: int, loop, tarea) -> None:
+        """Une `tarea`: el hilo `ident` de su loop solo se muestrea mientras ella corre."""
+        _, tareas = self.tareas.get(ident, (loop, frozenset()))
+        if tarea not in tareas:
+            with self._lock:
+                _, tareas = self.tareas.get(ident, (loop, frozenset()))
+                self.tareas = {**self.tareas, ident: (loop, tareas | {tarea})}
+        self.agrega_hilo(ident)
+
+    def une_actual(self) -> None:
+        """Une el hilo actual o, si corre un event loop, la tarea actual de ese loop."""
+        ident = threading.get_ident()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.agrega_hilo(ident)
+            return
+        tarea = asyncio.current_task(loop)
+        if tarea is None:
+            self.agrega_hilo(ident)
+        else:
+            self.agrega_tarea(ident, loop, tarea)
+
+    def registra_fase(self, fase: str, segundos: float) -> None:
+        with self._lock:
+            acumulado = self.fases.setdefault(fase, {"segundos": 0.0, "veces": 0})
+            acumulado["segundos"] += segundos
+            acumulado["veces"] += 1
+
+    def _muestrea(self) -> None:
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            tareas = self.tareas
+            # Una tarea del perfil debe estar corriendo antes y después de tomar las pilas
+            # para atribuirle la muestra; si no, la pila del loop es de otro request
+            antes = {ident for ident, (loop, propias) in tareas.items() if asyncio.current_task(loop) in propias}
+            frames = sys._current_frames()
+            for ident in self.hilos:
+                if ident in tareas:
+                    loop, propias = tareas[ident]
+                    if ident not in antes or asyncio.current_task(loop) not in propias:
+                        continue
+                frame = frames.get(ident)
+                if frame is not None and ident != propio:
+                    self.muestras[_pila(frame)] += 1
+
+    def inicia(self) -> None:
+        self.inicio = time.perf_counter()
+        self.une_actual()
+        self._muestreador = threading.Thread(target=self._muestrea, name=f"perfil_{self.nombre}", daemon=True)
+        self._muestreador.start()
+
+    def termina(self) -> None:
+        self._detener.set()
+        self._muestreador.join()
+        self.segundos = time.perf_counter() - self.inicio
+
+    def guarda(self, directorio: str = PERFILADO_DIR, **extra) -> Path:
+        """Escribe <nombre>.folded y <nombre>.json en `directorio`; devuelve la ruta del .json."""
+        destino = Path(directorio)
+        destino.mkdir(parents=True, exist_ok=True)
+        with open(destino / f"{self.nombre}.folded", "w") as archivo:
+            for pila, cantidad in self.muestras.most_common():
+                archivo.write(f"{pila} {cantidad}\n")
+        resumen = {
+            "nombre": self.nombre,
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "segundos": round(self.segundos, 4),
+            "intervalo": self.intervalo,
+            "muestras": sum(self.muestras.values()),
+            "hilos": len(self.hilos),
+            "tareas": sum(len(propias) for _, propias in self.tareas.values()),
+            "fases": {
+                fase: {"segundos": round(valor["segundos"], 4), "veces": valor["veces"]}
+                for fase, valor in sorted(self.fases.items(), key=lambda item: -item[1]["segundos"])
+            },
+            **extra,
+        }
+        path = destino / f"{self.nombre}.json"
+        path.write_text(json.dumps(resumen, indent=2, default=str))
+        return path
+
+
+def perfil_actual() -> Optional[Perfil]:
+    return _perfil_actual.get()
+
+
+def une_hilo() -> None:
+    """Une el hilo (o la tarea async) actual al perfil activo, si hay, para que el muestreador lo incluya."""
+    perfil = _perfil_actual.get()
+    if perfil is not None:
+        perfil.une_actual()
+
+
+def registra_fase(fase: str, segundos: float) -> None:
+    """Suma `segundos` a `fase` en el perfil activo, si hay uno."""
+    perfil = _perfil_actual.get()
+    if perfil is not None:
+        perfil.registra_fase(fase, segundos)
+
+
+@contextmanager
+def fase(nombre: str):
+    """Mide el bloque como la fase `nombre` del perfil activo; sin perfil no hace nada."""
+    perfil = _perfil_actual.get()
+    if perfil is None:
+        yield
+        return
+    perfil.une_actual()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.registra_fase(nombre, time.perf_counter() - inicio)
+
+
+@contextmanager
+def perfila(nombre: str, **extra):
+    """Perfila el bloque (y lo que corra en su contexto) y guarda el resultado al salir."""
+    perfil = Perfil(f"{datetime.now():%Y%m%d_%H%M%S}_{nombre}")
+    token = _perfil_actual.set(perfil)
+    perfil.inicia()
+    try:
+        yield perfil
+    finally:
+        perfil.termina()
+        _perfil_actual.reset(token)
+        try:
+            perfil.guarda(**extra)
+        except Exception as e:
+            evento("perfil_error", perfil=perfil.nombre, error=str(e))
+
+
+def _fabrica_tareas(anterior):
+    def fabrica(loop, coro, **kwargs):
+        if anterior is not None:
+            tarea = anterior(loop, coro, **kwargs)
+        else:
+            tarea = asyncio.Task(coro, loop=loop, **kwargs)
+        contexto = kwargs.get("context")
+        perfil = contexto.get(_perfil_actual) if contexto is not None else _perfil_actual.get()
+        if perfil is not None:
+            perfil.agrega_tarea(threading.get_ident(), loop, tarea)
+        return tarea
+
+    return fabrica
+
+
+def instala_fabrica_tareas() -> None:
+    """
+    Une al perfil activo las tareas que se creen en su contexto en el loop actual (las
+    del single-flight del caché, gather, anyio), para que el muestreador las incluya.
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_task_factory(_fabrica_tareas(loop.get_task_factory()))
+
+
+def perfilable(funcion):
+    """
+    Decorador de handlers: mide el handler como la fase "handler" y une su hilo al
+    perfil (los handlers sync corren en el threadpool); en los async une solo la tarea
+    del handler, no el event loop completo. Conserva la firma para FastAPI.
+    """
+    if inspect.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envoltura(*args, **kwargs):
+            with fase("handler"):
+                return await funcion(*args, **kwargs)
+    else:
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with fase("handler"):
+                return funcion(*args, **kwargs)
+    return envoltura
+
+
+def solicitado(headers, query_params) -> bool:
+    """Si el request debe perfilarse: lo pide con X-Perfil / ?perfil o cae en la muestra."""
+    if headers.get(HEADER_PERFIL, "") in ("1", "true") or query_params.get(PARAMETRO_PERFIL, "") in ("1", "true"):
+        return True
+    return PERFILADO_TASA > 0 and random.random() < PERFILADO_TASA
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+from core.metricas import evento, registra_sql
+from core.perfilador import registra_fase
+
+# En desarrollo, SQL_HOT_RELOAD=1 recarga un .sql cuando cambia su mtime (revisado
+# como máximo cada SQL_HOT_RELOAD_INTERVALO segundos); en producción se leen una sola vez
+SQL_HOT_RELOAD = os.getenv("SQL_HOT_RELOAD", "0") == "1"
+SQL_HOT_RELOAD_INTERVALO = float(os.getenv("SQL_HOT_RELOAD_INTERVALO", "1.0"))
+
+
+class CatalogoConsultas:
+    def __init__(self, directorio: str = "sql", hot_reload: bool = SQL_HOT_RELOAD):
+        """
+        Catálogo de las consultas de `directorio`: cada archivo se lee y se envuelve en
+        text() una sola vez, y se reutiliza el mismo objeto en cada ejecución (así
+        SQLAlchemy reutiliza su compilación en caché y el driver su sentencia preparada).
+        Lleva además, por consulta, ejecuciones, errores, filas y tiempos.
+        """
+        self.directorio = Path(directorio)
+        self.hot_reload = hot_reload
+        self._consultas = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _nombre(file_path: str) -> str:
+        return os.path.normpath(file_path)
+
+    def _carga(self, nombre: str) -> dict:
+        path = Path(nombre)
+        texto = path.read_text()
+        entrada = {
+            "texto": texto,
+            "consulta": text(texto),
+            "mtime": os.stat(path).st_mtime,
+            "revisado_en": time.monotonic(),
+            "cargado_en": datetime.now(),
+        }
+        self._consultas[nombre] = entrada
+        return entrada
+
+    def carga_todos(self) -> int:
+        """Carga todos los .sql del directorio (sin las migraciones). Devuelve cuántos."""
+        with self._lock:
+            for path in sorted(self.directorio.glob("*.sql")):
+                self._carga(self._nombre(str(path)))
+            return len(self._consultas)
+
+    def _entrada(self, file_path: str) -> dict:
+        nombre = self._nombre(file_path)
+        entrada = self._consultas.get(nombre)
+        if entrada is not None and (
+            not self.hot_reload or time.monotonic() - entrada["revisado_en"] < SQL_HOT_RELOAD_INTERVALO
+        ):
+            return entrada
+
+        with self._lock:
+            entrada = self._consultas.get(nombre)
+            if entrada is None:
+                return self._carga(nombre)
+            entrada["revisado_en"] = time.monotonic()
+            if os.stat(nombre).st_mtime != entrada["mtime"]:
+                evento("consulta_recargada", consulta=nombre)
+                return self._carga(nombre)
+            return entrada
+
+    def texto(self, file_path: str) -> str:
+        return self._entrada(file_path)["texto"]
+
+    def consulta(self, file_path: str) -> TextClause:
+        return self._entrada(file_path)["consulta"]
+
+    def registra(self, file_path: str, segundos: float, filas: Optional[int] = None, error: bool = False) -> None:
+        nombre = self._nombre(file_path)
+        registra_sql(nombre, segundos, filas, error)
+        registra_fase("sql", segundos)
+        with self._lock:
+            stats = self._stats.setdefault(nombre, {
+                "ejecuciones": 0, "errores": 0, "filas": 0, "total_s": 0.0, "max_s": 0.0, "ultima_en": None,
+            })
+            stats["ejecuciones"] += 1
+            stats["errores"] += int(error)
+            stats["filas"] += filas or 0
+            stats["total_s"] += segundos
+            stats["max_s"] = max(stats["max_s"], segundos)
+            stats["ultima_en"] = datetime.now()
+
+    def estadisticas(self) -> list[dict]:
+        """Estadísticas por consulta, de la que más tiempo acumula a la que menos."""
+        with self._lock:
+            resultado = [
+                {
+                    "consulta": nombre,
+                    "ejecuciones": stats["ejecuciones"],
+                    "errores": stats["errores"],
+                    "filas": stats["filas"],
+                    "total_ms": round(stats["total_s"] * 1000, 2),
+                    "promedio_ms": round(stats["total_s"] * 1000 / stats["ejecuciones"], 2),
+                    "max_ms": round(stats["max_s"] * 1000, 2),
+                    "filas_promedio": round(stats["filas"] / stats["ejecuciones"], 1),
+                    "ultima_en": stats["ultima_en"].isoformat(),
+                    "cargada_en": self._consultas[nombre]["cargado_en"].isoformat() if nombre in self._consultas else None,
+                }
+                for nombre, stats in self._stats.items()
+            ]
+        return sorted(resultado, key=lambda fila: -fila["total_ms"])
+
+
+# Catálogo compartido por todo el proceso
+catalogo = CatalogoConsultas()
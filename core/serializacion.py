@@ -0,0 +1,137 @@
+"""
+Serialización de resultados a bytes sin pasar por jsonable_encoder de FastAPI:
+- JSON de listas/dicts con orjson si está instalado (si no, json de la biblioteca estándar).
+- JSON de DataFrames con el codificador en C de pandas (to_json), sin armar la lista
+  intermedia de dicts.
+- Arrow IPC (stream) y Parquet con pyarrow, opcional, para consumidores masivos.
+"""
+import datetime
+import decimal
+import io
+import json
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+MEDIA_ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_PARQUET = "application/vnd.apache.parquet"
+
+
+def _default(valor: Any):
+    if isinstance(valor, (pd.Timestamp, datetime.datetime, datetime.date, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, decimal.Decimal):
+        return float(valor)
+    if valor is pd.NaT:
+        return None
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def dumps(valor: Any) -> bytes:
+    """JSON en bytes de `valor` (dicts, listas, fechas, escalares numpy)."""
+    if orjson is not None:
+        return orjson.dumps(valor, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(valor, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dataframe_json(df: pd.DataFrame) -> bytes:
+    """
+    El DataFrame como arreglo JSON de registros (igual que to_dict(orient="records")),
+    codificado directo desde las columnas. Las fechas van en ISO 8601 a segundos y
+    los NaN como null.
+    """
+    if df.empty:
+        return b"[]"
+    return df.to_json(orient="records", date_format="iso", date_unit="s", force_ascii=False).encode()
+
+
+def envoltorio_json(data: bytes, **campos) -> bytes:
+    """{**campos, "data": <data>} con `data` ya serializado, sin volver a decodificarlo."""
+    partes = [dumps(clave) + b":" + dumps(valor) for clave, valor in campos.items()]
+    partes.append(b'"data":' + data)
+    return b"{" + b",".join(partes) + b"}"
+
+
+def arrow_disponible() -> bool:
+    return pa is not None
+
+
+def _requiere_arrow() -> None:
+    if pa is None:
+        raise ValueError("Los formatos arrow y parquet requieren pyarrow (pip install pyarrow)")
+
+
+def tabla_arrow(df: pd.DataFrame, esquema: Optional["pa.Schema"] = None) -> "pa.Table":
+    _requiere_arrow()
+    return pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+
+
+def arrow_ipc(df: pd.DataFrame) -> bytes:
+    """El DataFrame completo como un stream Arrow IPC."""
+    tabla = tabla_arrow(df)
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return buffer.getvalue()
+
+
+def parquet(df: pd.DataFrame) -> bytes:
+    """El DataFrame completo como archivo Parquet (compresión zstd)."""
+    tabla = tabla_arrow(df)
+    buffer = io.BytesIO()
+    pq.write_table(tabla, buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+class StreamArrow:
+    def __init__(self, esquema: "pa.Schema"):
+        """Stream Arrow IPC incremental: cada escribe() devuelve los bytes nuevos del stream."""
+        _requiere_arrow()
+        self.esquema = esquema
+        self._buffer = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._buffer, esquema)
+
+    def _vacia(self) -> bytes:
+        datos = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return datos
+
+    def escribe(self, df: pd.DataFrame) -> bytes:
+        self._writer.write_table(tabla_arrow(df, self.esquema))
+        return self._vacia()
+
+    def cierra(self) -> bytes:
+        self._writer.close()
+        return self._vacia()
+
+
+class EscritorParquet:
+    def __init__(self, esquema: "pa.Schema"):
+        """Parquet armado por lotes (un row group por escribe()); cierra() devuelve el archivo."""
+        _requiere_arrow()
+        self.esquema = esquema
+        self._buffer = io.BytesIO()
+        self._writer = pq.ParquetWriter(self._buffer, esquema, compression="zstd")
+
+    def escribe(self, df: pd.DataFrame) -> None:
+        self._writer.write_table(tabla_arrow(df, self.esquema))
+
+    def cierra(self) -> bytes:
+        self._writer.close()
+        return self._buffer.getvalue()
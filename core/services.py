@@ -1,10 +1,21 @@
+import asyncio
 import datetime
-from typing import List, Optional
-from sqlalchemy import text, exc
-from core.database import SessionLocal
+import json
+import os
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+from sqlalchemy import text, exc, table, column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from core.cache import ResultCache
+from core.columnar import ARREGLO_ENTEROS, CATEGORIA, ENTERO, FECHA, TEXTO, lee_columnar
+from core.database import motor, motor_async, sesion
+from core.especialidades import diccionario_especialidades
+from core.metricas import UPSERT_FILAS, UPSERT_LOTE_SEGUNDOS, evento
+from core.perfilador import fase
+from core.queries import catalogo
+from core.snapshot import snapshot
 #from models.consultas import Consulta1Response
 import pandas as pd
-from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Tuple
 
@@ -28,46 +39,110 @@ def parse_dates(fecha_inicio: str, fecha_fin: str) -> Tuple[datetime, datetime]:
 
 
 def read_sql_file(file_path: str) -> str:
-    """Lee una consulta SQL desde un archivo y la devuelve como un string."""
-    with open(file_path, "r") as file:
-        return file.read()
+    """Devuelve el texto de una consulta SQL desde el catálogo (leído del archivo una sola vez)."""
+    return catalogo.texto(file_path)
 
 
 def execute_query(file_path: str, params: dict):
-    """Ejecuta una consulta SQL desde un archivo con parámetros proporcionados."""
-    session = SessionLocal()
-    query = read_sql_file(file_path)
+    """
+    Ejecuta una consulta SQL del catálogo con parámetros proporcionados, sobre una
+    conexión del pool (sin abrir una sesión ORM para una sola sentencia).
+    """
+    query = catalogo.consulta(file_path)
+    inicio = time.perf_counter()
     try:
-        result = session.execute(text(query), params).fetchall()
+        with motor().connect() as conn:
+            result = conn.execute(query, params).fetchall()
+        catalogo.registra(file_path, time.perf_counter() - inicio, len(result))
         return result
     except exc.SQLAlchemyError as e:
-        session.rollback()
-        raise ValueError(f"Error en la ejecución de la consulta SQL: {str(e)}") from exc.SQLAlchemyError
+        catalogo.registra(file_path, time.perf_counter() - inicio, error=True)
+        raise ValueError(f"Error en la ejecución de la consulta SQL: {str(e)}") from e
     except Exception as e:
-        session.rollback()
-        raise ValueError(f"Error inesperado: {str(e)}") from Exception
-    finally:
-        session.close()
+        catalogo.registra(file_path, time.perf_counter() - inicio, error=True)
+        raise ValueError(f"Error inesperado: {str(e)}") from e
 
 
-def query_regla_negocio(
-    cod_diagnostico_principal, especialidad_profesional, fecha_inicio, fecha_fin: str
-) -> pd.DataFrame:
+async def execute_query_async(file_path: str, params: dict):
+    """
+    Versión asíncrona de execute_query: usa el motor asyncpg y no bloquea el event loop
+    mientras espera a la base de datos.
+    """
+    query = catalogo.consulta(file_path)
+    inicio = time.perf_counter()
+    try:
+        async with motor_async().connect() as conn:
+            result = (await conn.execute(query, params)).fetchall()
+        catalogo.registra(file_path, time.perf_counter() - inicio, len(result))
+        return result
+    except exc.SQLAlchemyError as e:
+        catalogo.registra(file_path, time.perf_counter() - inicio, error=True)
+        raise ValueError(f"Error en la ejecución de la consulta SQL: {str(e)}") from e
+    except Exception as e:
+        catalogo.registra(file_path, time.perf_counter() - inicio, error=True)
+        raise ValueError(f"Error inesperado: {str(e)}") from e
+
+
+# Lectura columnar (COPY ... TO STDOUT) para las consultas que devuelven DataFrames con
+# FETCH_COLUMNAR=1; por defecto se lee por filas (fetchall / yield_per). Medido con
+# benchmarks/columnar_fetch.py (1M filas, PostgreSQL 16 local, resultados en
+# benchmarks/resultados/columnar_fetch_2026-10-18.json): con psycopg2 COPY es 1,5x más
+# rápido (3,26 s vs 4,98 s); con psycopg 3, que entrega COPY fila a fila, 1,6x más lento
+# (7,04 s vs 4,52 s). En ambos el DataFrame ocupa 2,7x menos memoria (56 MB vs 150 MB).
+FETCH_COLUMNAR = os.getenv("FETCH_COLUMNAR", "0") == "1"
+
+# Tipos de las columnas de licencias que se puntúan (sql/masivo.sql y sql/consulta1.sql)
+TIPOS_LICENCIAS = {
+    "id_licencia": TEXTO,
+    "folio": TEXTO,
+    "dias_reposo": ENTERO,
+    "fecha_emision": FECHA,
+    "fecha_inicio_reposo": FECHA,
+    "especialidad_profesional": CATEGORIA,
+    "cod_diagnostico_principal": CATEGORIA,
+}
+
+
+def fetch_dataframe(file_path: str, params: dict, tipos: dict) -> pd.DataFrame:
+    """
+    Ejecuta una consulta SQL desde un archivo y devuelve el resultado completo como
+    DataFrame con los tipos indicados, leído en columnas con COPY.
+    """
+    query = read_sql_file(file_path)
+    inicio = time.perf_counter()
+    try:
+        with motor().connect() as conn:
+            df = list(lee_columnar(conn, query, params, tipos))[0]
+        catalogo.registra(file_path, time.perf_counter() - inicio, len(df))
+        return df
+    except Exception as e:
+        catalogo.registra(file_path, time.perf_counter() - inicio, error=True)
+        raise ValueError(f"Error en la ejecución de la consulta SQL: {str(e)}") from e
+
+
+def _params_regla_negocio(
+    cod_diagnostico_principal, especialidad_profesional, fecha_inicio, fecha_fin: str, rn: int,
+    id_especialidad_canonica: Optional[int],
+) -> dict:
     fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
 
-    query_params = {
+    return {
         "cod_diagnostico_principal": cod_diagnostico_principal,
         "especialidad_profesional": especialidad_profesional,
+        # Sin id canónico (especialidad no reconocida) la consulta compara por trigramas
+        "id_especialidad_canonica": id_especialidad_canonica,
         "fecha_inicio": fecha_inicio_date,
         "fecha_fin": fecha_fin_date,
+        # Licencias que aún no tienen score de la regla rn
+        "rn": rn,
     }
 
-    try:
-        result = execute_query("./sql/consulta1.sql", query_params)
 
-        if not result:
-            return pd.DataFrame() 
-        df = pd.DataFrame(result, columns=[
+def _df_regla_negocio(result) -> pd.DataFrame:
+    if not result:
+        return pd.DataFrame() 
+    with fase("dataframe"):
+        return pd.DataFrame(result, columns=[
             "id_licencia",
             "folio",
             "dias_reposo",
@@ -77,92 +152,353 @@ def query_regla_negocio(
             "cod_diagnostico_principal"
         ])
 
+
+async def query_regla_negocio_async(
+    cod_diagnostico_principal, especialidad_profesional, fecha_inicio, fecha_fin: str, rn: int = 1
+) -> pd.DataFrame:
+    # id_de puede recargar el diccionario desde la base: fuera del event loop
+    id_especialidad_canonica = await asyncio.to_thread(diccionario_especialidades.id_de, especialidad_profesional)
+    query_params = _params_regla_negocio(
+        cod_diagnostico_principal, especialidad_profesional, fecha_inicio, fecha_fin, rn,
+        id_especialidad_canonica,
+    )
+
+    try:
+        result = await execute_query_async("./sql/consulta1.sql", query_params)
+        return await asyncio.to_thread(_df_regla_negocio, result)
+
+    except Exception as e:
+        evento("consulta_error", consulta="consulta1.sql", error=str(e))
+        raise
+
+# Máximo de combinaciones (diagnóstico, especialidad) por consulta en lote
+CONSULTA_LOTE_MAX = int(os.getenv("CONSULTA_LOTE_MAX", "1000"))
+
+TIPOS_CONSULTA_LOTE = {**TIPOS_LICENCIAS, "combinacion": ENTERO}
+
+
+def query_regla_negocio_lote(
+    combinaciones: List[Tuple[str, str]], fecha_inicio: str, fecha_fin: str, rn: int
+) -> pd.DataFrame:
+    """
+    Licencias de todas las combinaciones (cod_diagnostico_principal, especialidad_profesional)
+    en una sola consulta. La columna "combinacion" es la posición (desde 0) de la
+    combinación en `combinaciones`; una licencia puede venir en más de una.
+    """
+    fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
+    if not combinaciones:
+        return pd.DataFrame(columns=list(TIPOS_CONSULTA_LOTE))
+    query_params = {
+        "cod_diagnosticos": [cod_diagnostico for cod_diagnostico, _ in combinaciones],
+        "especialidades": [especialidad for _, especialidad in combinaciones],
+        # 0 = sin id canónico (especialidad no reconocida): la consulta compara por trigramas.
+        # Los arreglos no admiten NULL al compilarse con literales
+        "ids_especialidad": [diccionario_especialidades.id_de(especialidad) or 0 for _, especialidad in combinaciones],
+        "combinaciones": list(range(len(combinaciones))),
+        "fecha_inicio": fecha_inicio_date,
+        "fecha_fin": fecha_fin_date,
+        "rn": rn,
+    }
+
+    try:
+        if FETCH_COLUMNAR:
+            df = fetch_dataframe("./sql/consulta1_lote.sql", query_params, TIPOS_CONSULTA_LOTE)
+        else:
+            result = execute_query("./sql/consulta1_lote.sql", query_params)
+            with fase("dataframe"):
+                df = pd.DataFrame(result, columns=list(TIPOS_CONSULTA_LOTE))
+        df["combinacion"] = df["combinacion"].astype("int64")
         return df
 
     except Exception as e:
-        print(f"Error ejecutando la consulta busca_datos_consulta1: {e}")
+        evento("consulta_error", consulta="consulta1_lote.sql", combinaciones=len(combinaciones), error=str(e))
         raise
 
-def update_propensity_score_licencias(results: List[dict], score_column: str, rn:int) -> None:
-    session = SessionLocal()
+# Caché de /score y /score/details por rango de fechas normalizado
+SCORE_CACHE_MAX = int(os.getenv("SCORE_CACHE_MAX", "128"))
+SCORE_CACHE_TTL = float(os.getenv("SCORE_CACHE_TTL", "300"))
+score_cache = ResultCache("score", max_entradas=SCORE_CACHE_MAX, ttl=SCORE_CACHE_TTL)
+
+
+def _rango_fechas_emision(df: pd.DataFrame) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Rango [min, max] de fecha_emision de los registros escritos, o (None, None) si no se conoce."""
+    if "fecha_emision" not in df.columns:
+        return None, None
+    fechas = pd.to_datetime(df["fecha_emision"], errors="coerce")
+    desde, hasta = fechas.min(), fechas.max()
+    if pd.isna(desde) or pd.isna(hasta):
+        return None, None
+    return desde.to_pydatetime(), hasta.to_pydatetime()
+
+
+# Cada fila del upsert usa 5 parámetros y PostgreSQL admite hasta 65535 por sentencia
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "5000"))
+UPSERT_BATCH_SIZE_MAX = 13000
+
+propensity_score_table = table(
+    "propensity_score",
+    column("id_lic"),
+    column("folio"),
+    column("rn"),
+    column("score"),
+    column("version_modelo"),
+    schema="ml",
+)
+
+
+def build_upsert_propensity_score(registros: List[dict]):
+    """Construye un único INSERT ... VALUES (...), (...) ON CONFLICT para un lote de registros."""
+    stmt = pg_insert(propensity_score_table).values(registros)
+    return stmt.on_conflict_do_update(
+        index_elements=["id_lic", "rn"],
+        set_={"score": stmt.excluded.score, "version_modelo": stmt.excluded.version_modelo},
+    )
+
+
+def update_propensity_score_licencias(
+    results: List[dict], score_column: str, rn:int, batch_size: Optional[int] = None, version_modelo: Optional[str] = None
+) -> int:
+    """
+    Guarda los scores en ml.propensity_score con un upsert multi-fila por lote,
+    junto con la versión del modelo que los calculó.
+
+    Cada lote de `batch_size` registros se envía en una sola sentencia y se confirma
+    en su propia transacción; los triggers de la migración 009 actualizan
+    ml.propensity_score_diario en esa misma sentencia. Si una licencia viene repetida se conserva
+    su último score. Tras cada lote se invalidan los rangos cacheados que incluyen sus fecha_emision.
+    Devuelve la cantidad de registros escritos.
+    """
+    batch_size = min(batch_size or UPSERT_BATCH_SIZE, UPSERT_BATCH_SIZE_MAX)
+    df = pd.DataFrame(results)
+    if df.empty:
+        return 0
+
+    df = df.drop_duplicates(subset=["id_licencia"], keep="last")
+    desde, hasta = _rango_fechas_emision(df)
+    registros = [
+        {"id_lic": id_lic, "folio": folio, "rn": rn, "score": score, "version_modelo": version_modelo}
+        for id_lic, folio, score in zip(
+            df["id_licencia"].tolist(),
+            df["folio"].tolist(),
+            df[score_column].tolist(),
+        )
+    ]
+
+    session = sesion()
+    escritos = 0
     try:
-        df = pd.DataFrame(results)
-
-        upsert_query = """
-        INSERT INTO ml.propensity_score (id_lic, folio, rn, score)
-        VALUES (:id_lic, :folio, :rn, :score)
-        ON CONFLICT (id_lic, rn) DO UPDATE
-        SET score = EXCLUDED.score
-        """
-        params_list = [
-            {
-                'id_lic': row['id_licencia'],
-                'folio': row['folio'],
-                'rn': rn,
-                'score': row[score_column]
-            }
-            for _, row in df.iterrows()
-        ]
-
-        # Ejecutar el upsert en una transacción
-        for params in params_list:
-            session.execute(text(upsert_query), params)
-
-        session.commit()
-        print(f"Tabla ml.propensity_score = {params_list[0]}")
+        for inicio in range(0, len(registros), batch_size):
+            lote = registros[inicio:inicio + batch_size]
+            with UPSERT_LOTE_SEGUNDOS.mide(rn=rn):
+                session.execute(build_upsert_propensity_score(lote))
+                session.commit()
+            escritos += len(lote)
+            UPSERT_FILAS.incrementa(len(lote), rn=rn)
+            score_cache.invalida_rango(desde, hasta)
+
+        return escritos
 
     except exc.SQLAlchemyError as e:
         session.rollback()
-        raise ValueError(f"Error al actualizar ml.propensity_score: {str(e)}")
+        raise ValueError(f"Error al actualizar ml.propensity_score ({escritos} registros ya guardados): {str(e)}")
     except Exception as e:
         session.rollback()
-        raise ValueError(f"Error inesperado al actualizar ml.propensity_score: {str(e)}")
+        raise ValueError(f"Error inesperado al actualizar ml.propensity_score ({escritos} registros ya guardados): {str(e)}")
     finally:
         session.close()
-        
-def query_masivo(
-     fecha_inicio, fecha_fin: str
-) -> pd.DataFrame:
+
+
+# Filas por lote al leer sql/masivo.sql con cursor del lado del servidor
+MASIVO_CHUNK_SIZE = int(os.getenv("MASIVO_CHUNK_SIZE", "50000"))
+
+# Máximo de días de reposo que puntúan los modelos (BusinessModel.preprocess descarta el
+# resto y los nulos); la lectura incremental no trae las licencias que quedarían sin score
+DIAS_REPOSO_MAX = 365
+
+COLUMNAS_MASIVO = [
+    "id_licencia",
+    "folio",
+    "dias_reposo",
+    "fecha_emision",
+    "fecha_inicio_reposo",
+    "especialidad_profesional",
+    "cod_diagnostico_principal"
+]
+
+
+def stream_masivo(
+    fecha_inicio, fecha_fin: str, chunk_size: Optional[int] = None, versiones: Optional[dict] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Lee sql/masivo.sql y entrega el rango como DataFrames de a lo más `chunk_size`
+    filas, sin materializar todo el resultado: en columnas con COPY (FETCH_COLUMNAR)
+    o por filas con un cursor del lado del servidor. Si el snapshot local está activo
+    (SNAPSHOT_DIR) la lectura no incremental se hace desde él, sin ir a la base de datos.
+
+    Con `versiones` ({rn: version_modelo}) la lectura es incremental: usa
+    sql/masivo_incremental.sql, que solo trae las licencias sin score vigente para
+    alguna regla, con la columna rn_pendientes indicando cuáles. Las que el modelo no
+    puntúa (dias_reposo nulo o sobre DIAS_REPOSO_MAX) no se leen: nunca tendrán score.
+    """
     fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
+    chunk_size = chunk_size or MASIVO_CHUNK_SIZE
 
     query_params = {
         "fecha_inicio": fecha_inicio_date,
         "fecha_fin": fecha_fin_date,
     }
-
+    tipos = TIPOS_LICENCIAS
+    if versiones:
+        file_path = "./sql/masivo_incremental.sql"
+        query_params["rns"] = list(versiones.keys())
+        query_params["versiones"] = list(versiones.values())
+        query_params["dias_reposo_max"] = DIAS_REPOSO_MAX
+        tipos = {**TIPOS_LICENCIAS, "rn_pendientes": ARREGLO_ENTEROS}
+    elif snapshot.activo:
+        yield from snapshot.stream(fecha_inicio_date, fecha_fin_date, chunk_size)
+        return
+    else:
+        file_path = "./sql/masivo.sql"
+
+    yield from _stream_dataframes(file_path, query_params, tipos, chunk_size)
+
+
+def _stream_dataframes(file_path: str, query_params: dict, tipos: dict, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Entrega el resultado de la consulta en DataFrames de a lo más `chunk_size` filas
+    con las columnas de `tipos`: con COPY (FETCH_COLUMNAR) o con yield_per.
+    El tiempo registrado en el catálogo es solo el de lectura, sin el que el consumidor
+    pasa procesando cada lote.
+    """
+    segundos, filas, error = 0.0, 0, False
+    inicio = time.perf_counter()
     try:
-        result = execute_query("./sql/masivo.sql", query_params)
+        with motor().connect() as conn:
+            if FETCH_COLUMNAR:
+                lotes = lee_columnar(conn, read_sql_file(file_path), query_params, tipos, chunk_size)
+            else:
+                result = conn.execution_options(yield_per=chunk_size).execute(catalogo.consulta(file_path), query_params)
+                lotes = (pd.DataFrame(particion, columns=list(tipos)) for particion in result.partitions())
+            for df in lotes:
+                segundos += time.perf_counter() - inicio
+                filas += len(df)
+                inicio = None
+                yield df
+                inicio = time.perf_counter()
+    except exc.SQLAlchemyError as e:
+        error = True
+        raise ValueError(f"Error en la ejecución de la consulta SQL: {str(e)}") from e
+    except ValueError:
+        error = True
+        raise
+    except Exception as e:
+        error = True
+        # Errores del driver en COPY (no pasan por SQLAlchemy)
+        raise ValueError(f"Error en la ejecución de la consulta SQL: {str(e)}") from e
+    finally:
+        if inicio is not None:
+            segundos += time.perf_counter() - inicio
+        catalogo.registra(file_path, segundos, filas, error)
 
-        if not result:
-            return pd.DataFrame() 
-        df = pd.DataFrame(result, columns=[
-            "id_licencia",
-            "folio",
-            "dias_reposo",
-            "fecha_emision",
-            "fecha_inicio_reposo",
-            "especialidad_profesional",
-            "cod_diagnostico_principal"
-        ])
 
-        return df
+TIPOS_UMBRALES = {
+    "id_licencia": TEXTO,
+    "rut_medico": TEXTO,
+    "fecha_emision": FECHA,
+    "dias_reposo": ENTERO,
+}
+
+
+def stream_umbrales(fecha_inicio: datetime, fecha_fin: datetime, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lee sql/umbrales.sql (licencias con médico, ordenadas por fecha_emision) para
+    el rango [fecha_inicio, fecha_fin] ya convertido a datetime.
+    """
+    query_params = {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin}
+    yield from _stream_dataframes("./sql/umbrales.sql", query_params, TIPOS_UMBRALES, chunk_size or MASIVO_CHUNK_SIZE)
+
+
+def update_umbrales_propensity_score(ventanas: pd.DataFrame, batch_size: Optional[int] = None) -> int:
+    """
+    Guarda las columnas de ventanas (frecuencia_* / otorgados_*) en las filas de
+    ml.propensity_score de cada licencia, con un UPDATE por lote de `batch_size`
+    licencias (los valores viajan como arreglos, así que el tamaño no está acotado
+    por el máximo de parámetros). Devuelve la cantidad de licencias enviadas.
+    """
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    if ventanas.empty:
+        return 0
+
+    query = catalogo.consulta("./sql/umbrales_update.sql")
+    columnas = [columna for columna in ventanas.columns if columna != "id_licencia"]
+
+    session = sesion()
+    escritos = 0
+    try:
+        for inicio in range(0, len(ventanas), batch_size):
+            lote = ventanas.iloc[inicio:inicio + batch_size]
+            params = {"id_licencia": lote["id_licencia"].tolist()}
+            params.update({columna: lote[columna].astype(float).tolist() for columna in columnas})
+            session.execute(query, params)
+            session.commit()
+            escritos += len(lote)
+        return escritos
 
+    except exc.SQLAlchemyError as e:
+        session.rollback()
+        raise ValueError(f"Error al actualizar las ventanas en ml.propensity_score ({escritos} licencias ya guardadas): {str(e)}")
     except Exception as e:
-        print(f"Error ejecutando la consulta busca_datos_consulta1: {e}")
-        raise        
+        session.rollback()
+        raise ValueError(f"Error inesperado al actualizar las ventanas en ml.propensity_score ({escritos} licencias ya guardadas): {str(e)}")
+    finally:
+        session.close()
     
     
-def query_score(fecha_inicio, fecha_fin: str)-> dict:
+def query_resultados_masivo(
+    fecha_inicio: str, fecha_fin: str, limite: int = 1000, despues_id_lic: str = "", despues_rn: int = 0
+) -> dict:
+    """
+    Pagina (por keyset sobre id_lic, rn) los scores guardados en ml.propensity_score
+    para las licencias del rango. `siguiente` trae el cursor de la página siguiente.
+    """
     fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
 
-
     query_params = {
         "fecha_inicio": fecha_inicio_date,
         "fecha_fin": fecha_fin_date,
+        "despues_id_lic": despues_id_lic,
+        "despues_rn": despues_rn,
+        "limite": limite,
     }
 
-    result = execute_query("./sql/propensy_score_resume.sql", query_params)
+    result = execute_query("./sql/masivo_resultados.sql", query_params)
 
+    data = [
+        {
+            "id_lic": row[0],
+            "folio": row[1],
+            "rn": row[2],
+            "score": row[3]
+        }
+        for row in result
+    ]
+    siguiente = None
+    if len(data) == limite:
+        siguiente = {"despues_id_lic": data[-1]["id_lic"], "despues_rn": data[-1]["rn"]}
+
+    return {"data": data, "siguiente": siguiente}
+
+
+def _params_rango(fecha_inicio: str, fecha_fin: str) -> dict:
+    fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
+
+    return {
+        "fecha_inicio": fecha_inicio_date,
+        "fecha_fin": fecha_fin_date,
+    }
+
+
+def _filas_score(result) -> list[dict]:
     if not result:
         return []
 
@@ -170,52 +506,115 @@ def query_score(fecha_inicio, fecha_fin: str)-> dict:
         {
             "fecha_emision": row[0],
             "rn": row[1],
-            "cantidad_registros": row[2]
+            "cantidad_registros": row[2],
+            "positivos": row[3]
         }
         for row in result
     ]
     return data
 
 
+def _cache_key(consulta: str, query_params: dict) -> tuple:
+    return (consulta, query_params["fecha_inicio"], query_params["fecha_fin"])
 
-def query_score_licencia(fecha_inicio: str, fecha_fin: str) -> list[dict]:
-    fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
 
-    query_params = {
-        "fecha_inicio": fecha_inicio_date,
-        "fecha_fin": fecha_fin_date,
-    }
+async def query_score_async(fecha_inicio, fecha_fin: str) -> list[dict]:
+    query_params = _params_rango(fecha_inicio, fecha_fin)
+
+    async def calcula():
+        return _filas_score(await execute_query_async("./sql/propensy_score_diario.sql", query_params))
+
+    return await score_cache.obtiene_async(_cache_key("query_score", query_params), calcula)
 
-    result = execute_query("./sql/propensy_score_licencia.sql", query_params)
 
+# Licencias por página al recorrer /score/details en modo streaming
+SCORE_DETAILS_PAGINA = int(os.getenv("SCORE_DETAILS_PAGINA", "5000"))
+
+
+def _filas_score_licencia(result) -> list[dict]:
     if not result:
         return []
 
-    agrupados = defaultdict(lambda: {"score": {}})
-
+    data = []
     for row in result:
-        licencia = row[0]
-        fecha_emision = row[1]
-        rut_medico = row[2]
-        dias_reposo = row[3]
-        cod_diagnostico = row[4]
-        especialidad_medico = row[5]
-        rn = row[6]
-        score = row[7]
-
-        key = (licencia, fecha_emision, rut_medico, dias_reposo, cod_diagnostico, especialidad_medico)
-        
-        agrupados[key]["score"][f"rn_{rn}"] = score
-        if "licencia" not in agrupados[key]:
-            agrupados[key].update({
-                "licencia": licencia,
-                "fecha_emision": fecha_emision,
-                "rut_medico": rut_medico,
-                "dias_reposo": dias_reposo,
-                "cod_diagnostico": cod_diagnostico,
-                "especialidad_medico": especialidad_medico,
-            })
-
-    return list(agrupados.values())
+        score = row[6]
+        # Según el driver, jsonb puede llegar ya decodificado o como texto
+        if isinstance(score, str):
+            score = json.loads(score)
+        data.append({
+            "licencia": row[0],
+            "fecha_emision": row[1],
+            "rut_medico": row[2],
+            "dias_reposo": row[3],
+            "cod_diagnostico": row[4],
+            "especialidad_medico": row[5],
+            "score": score,
+        })
+    return data
 
 
+def _params_score_licencia(fecha_inicio: str, fecha_fin: str, limite: Optional[int], despues_id_lic: str) -> dict:
+    return {
+        **_params_rango(fecha_inicio, fecha_fin),
+        "limite": limite,
+        "despues_id_lic": despues_id_lic,
+    }
+
+
+def _pagina_score_licencia(data: list[dict], limite: Optional[int]) -> dict:
+    """Arma la respuesta paginada; `siguiente` es None en la última página."""
+    siguiente = None
+    if limite is not None and len({fila["licencia"] for fila in data}) == limite:
+        siguiente = {"despues_id_lic": data[-1]["licencia"]}
+    return {"data": data, "siguiente": siguiente}
+
+
+async def query_score_licencia_async(fecha_inicio: str, fecha_fin: str) -> list[dict]:
+    query_params = _params_score_licencia(fecha_inicio, fecha_fin, None, "")
+
+    async def calcula():
+        return _filas_score_licencia(await execute_query_async("./sql/propensy_score_licencia.sql", query_params))
+
+    return await score_cache.obtiene_async(_cache_key("query_score_licencia", query_params), calcula)
+
+
+async def query_score_licencia_pagina_async(
+    fecha_inicio: str, fecha_fin: str, limite: int, despues_id_lic: str = ""
+) -> dict:
+    """
+    Una página de /score/details: las `limite` licencias siguientes a `despues_id_lic`.
+    """
+    query_params = _params_score_licencia(fecha_inicio, fecha_fin, limite, despues_id_lic)
+
+    async def calcula():
+        result = await execute_query_async("./sql/propensy_score_licencia.sql", query_params)
+        return _pagina_score_licencia(_filas_score_licencia(result), limite)
+
+    key = _cache_key("query_score_licencia_pagina", query_params) + (limite, despues_id_lic)
+    return await score_cache.obtiene_async(key, calcula)
+
+
+async def stream_score_licencia_async(
+    fecha_inicio: str, fecha_fin: str, pagina: Optional[int] = None
+) -> AsyncIterator[list[dict]]:
+    """
+    Recorre el rango página a página (keyset sobre id_lic) y entrega cada página
+    apenas se lee, de modo que en memoria hay a lo más una página a la vez.
+    """
+    pagina = pagina or SCORE_DETAILS_PAGINA
+    despues_id_lic = ""
+    while True:
+        query_params = _params_score_licencia(fecha_inicio, fecha_fin, pagina, despues_id_lic)
+        result = await execute_query_async("./sql/propensy_score_licencia.sql", query_params)
+        resultado = _pagina_score_licencia(_filas_score_licencia(result), pagina)
+        if resultado["data"]:
+            yield resultado["data"]
+        if resultado["siguiente"] is None:
+            break
+        despues_id_lic = resultado["siguiente"]["despues_id_lic"]
+
+
+async def query_rns_score_async(fecha_inicio: str, fecha_fin: str) -> list[int]:
+    """Reglas con scores en el rango, según ml.propensity_score_diario."""
+    result = await execute_query_async("./sql/propensy_score_rns.sql", _params_rango(fecha_inicio, fecha_fin))
+    return [row[0] for row in result]
@@ -0,0 +1,265 @@
+"""
+Snapshot local de licencias (sql/snapshot_licencias.sql) en archivos Feather por mes
+de fecha_emision, para re-puntuar rangos sin volver a leer la base de datos.
+
+Es opcional: se activa con SNAPSHOT_DIR y requiere pyarrow. Se refresca de forma
+incremental: trae las licencias con id_licencias sobre la marca de avance (guardada en
+_estado.json) y vuelve a leer completas las emitidas en los últimos
+SNAPSHOT_RELECTURA_DIAS días, para recoger las que entraron sin fila en
+licencia_diagnostico_especialidad (la consulta la exige) y la recibieron después.
+
+Límite de exactitud: una licencia cuya fila de licencia_diagnostico_especialidad llega
+más de SNAPSHOT_RELECTURA_DIAS días después de su fecha_emision, o que cambia después de
+ese plazo, no entra al snapshot (y el masivo con SNAPSHOT_DIR no la puntúa) hasta que se
+reconstruye. Si las cargas pueden atrasarse más, subir SNAPSHOT_RELECTURA_DIAS o
+reconstruir periódicamente.
+
+Uso:
+    python -m core.snapshot refresca      # trae las licencias nuevas
+    python -m core.snapshot reconstruye   # vuelve a copiar todo
+    python -m core.snapshot estado
+"""
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from core.columnar import CATEGORIA, ENTERO, FECHA, TEXTO, lee_columnar
+from core.database import LOTE, motor
+from core.metricas import evento
+from core.queries import catalogo
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Directorio del snapshot (vacío = desactivado)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+# Antigüedad máxima (segundos) antes de refrescar al leer; negativo = nunca refrescar al leer
+SNAPSHOT_MAX_EDAD = float(os.getenv("SNAPSHOT_MAX_EDAD", "3600"))
+# Filas leídas por lote desde la base y filas acumuladas antes de escribir los meses
+SNAPSHOT_CHUNK_SIZE = int(os.getenv("SNAPSHOT_CHUNK_SIZE", "200000"))
+SNAPSHOT_MAX_BUFFER = int(os.getenv("SNAPSHOT_MAX_BUFFER", "1000000"))
+# Días de fecha_emision (hasta hoy) que cada refresco vuelve a leer completos
+SNAPSHOT_RELECTURA_DIAS = int(os.getenv("SNAPSHOT_RELECTURA_DIAS", "7"))
+
+TIPOS_SNAPSHOT = {
+    "id_licencias": ENTERO,
+    "id_licencia": TEXTO,
+    "folio": TEXTO,
+    "dias_reposo": ENTERO,
+    "fecha_emision": FECHA,
+    "fecha_inicio_reposo": FECHA,
+    "especialidad_profesional": CATEGORIA,
+    "cod_diagnostico_principal": CATEGORIA,
+}
+
+
+class LicenciasSnapshot:
+    def __init__(
+        self, directorio: str = SNAPSHOT_DIR, max_edad: float = SNAPSHOT_MAX_EDAD, relectura_dias: int = SNAPSHOT_RELECTURA_DIAS
+    ):
+        """
+        Snapshot de licencias en `directorio`, un archivo licencias_AAAA-MM.feather por mes.
+        Los archivos se escriben sin compresión para leerlos con memory map, y se
+        reemplazan de forma atómica (os.replace), así que un lector nunca ve uno a medias.
+        """
+        self.directorio = Path(directorio) if directorio else None
+        self.max_edad = max_edad
+        self.relectura_dias = relectura_dias
+        self._lock = threading.Lock()
+        if self.directorio is not None and feather is None:
+            evento("snapshot_desactivado", directorio=str(self.directorio), motivo="pyarrow no está instalado")
+
+    @property
+    def activo(self) -> bool:
+        return self.directorio is not None and feather is not None
+
+    def _path_mes(self, mes: str) -> Path:
+        return self.directorio / f"licencias_{mes}.feather"
+
+    def estado(self) -> dict:
+        path = self.directorio / "_estado.json" if self.directorio else None
+        if path is None or not path.exists():
+            return {"marca": 0, "actualizado_en": None, "meses": []}
+        return json.loads(path.read_text())
+
+    def _guarda_estado(self, estado: dict) -> None:
+        path = self.directorio / "_estado.json"
+        temporal = path.with_suffix(".tmp")
+        temporal.write_text(json.dumps(estado, indent=2))
+        os.replace(temporal, path)
+
+    def _escribe_mes(
+        self, mes: str, nuevas: Optional[pd.DataFrame], descarta_desde: Optional[int], relee_desde: Optional[pd.Timestamp] = None
+    ) -> None:
+        """
+        Agrega `nuevas` al archivo del mes. Si `descarta_desde` no es None se eliminan
+        antes las filas con id_licencias mayor, que quedaron de un refresco interrumpido
+        y vienen de nuevo en este, y las emitidas desde `relee_desde`, que el refresco
+        vuelve a leer completas.
+        """
+        path = self._path_mes(mes)
+        partes = []
+        if path.exists():
+            actuales = feather.read_feather(path, memory_map=True)
+            if descarta_desde is not None:
+                conserva = actuales["id_licencias"] <= descarta_desde
+                if relee_desde is not None:
+                    conserva &= actuales["fecha_emision"] < relee_desde
+                actuales = actuales[conserva]
+            partes.append(actuales)
+        if nuevas is not None:
+            partes.append(nuevas)
+        df = pd.concat(partes, ignore_index=True)
+        # Las categorías de cada parte difieren: se vuelven a unificar antes de escribir
+        for columna, tipo in TIPOS_SNAPSHOT.items():
+            if tipo == CATEGORIA:
+                df[columna] = df[columna].astype(object).astype("category")
+        temporal = path.with_suffix(".tmp")
+        feather.write_feather(df, temporal, compression="uncompressed")
+        os.replace(temporal, path)
+
+    def _vencido(self, estado: dict) -> bool:
+        actualizado_en = estado["actualizado_en"]
+        return actualizado_en is None or (datetime.now() - datetime.fromisoformat(actualizado_en)).total_seconds() > self.max_edad
+
+    @contextmanager
+    def _bloqueo(self):
+        """
+        Un solo refresco a la vez: entre hilos con el lock del proceso y entre procesos
+        (workers de la API, CLI) con flock sobre .refresco.lock en el directorio.
+        """
+        with self._lock:
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.directorio / ".refresco.lock", "w") as archivo:
+                fcntl.flock(archivo, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(archivo, fcntl.LOCK_UN)
+
+    def refresca(self, reconstruye: bool = False, solo_si_vencido: bool = False) -> dict:
+        """
+        Copia las licencias con id_licencias sobre la marca (todas si `reconstruye`),
+        vuelve a copiar las emitidas en los últimos relectura_dias días y avanza la
+        marca. Devuelve el estado actualizado. Mientras se reconstruye,
+        las lecturas ven un snapshot parcial. Con `solo_si_vencido` no hace nada si,
+        al obtener el bloqueo, otro hilo o proceso ya lo refrescó.
+        """
+        if not self.activo:
+            raise ValueError("El snapshot de licencias no está activo (SNAPSHOT_DIR y pyarrow)")
+
+        with self._bloqueo():
+            # El estado (marca incluida) se lee dentro del bloqueo: otro refresco pudo avanzarla
+            estado = self.estado()
+            if solo_si_vencido and not reconstruye and not self._vencido(estado):
+                return estado
+            if reconstruye:
+                for path in self.directorio.glob("licencias_*.feather"):
+                    path.unlink()
+                estado = {"marca": 0, "actualizado_en": None, "meses": []}
+            marca = estado["marca"]
+            relee_desde = pd.Timestamp(datetime.now().date() - timedelta(days=self.relectura_dias))
+            query = catalogo.texto("sql/snapshot_licencias.sql")
+
+            tocados, pendientes, filas_pendientes, nueva_marca, filas = set(), {}, 0, marca, 0
+
+            def vacia_buffer():
+                for mes, partes in pendientes.items():
+                    self._escribe_mes(
+                        mes, pd.concat(partes, ignore_index=True), None if mes in tocados else marca, relee_desde
+                    )
+                    tocados.add(mes)
+                pendientes.clear()
+
+            params = {"desde_id": marca, "relee_desde": relee_desde.to_pydatetime()}
+            with motor(LOTE).connect() as conn:
+                for df in lee_columnar(conn, query, params, TIPOS_SNAPSHOT, SNAPSHOT_CHUNK_SIZE):
+                    for mes, parte in df.groupby(df["fecha_emision"].dt.strftime("%Y-%m"), sort=False):
+                        pendientes.setdefault(mes, []).append(parte)
+                    filas += len(df)
+                    filas_pendientes += len(df)
+                    nueva_marca = max(nueva_marca, int(df["id_licencias"].max()))
+                    if filas_pendientes >= SNAPSHOT_MAX_BUFFER:
+                        vacia_buffer()
+                        filas_pendientes = 0
+            vacia_buffer()
+            # Meses de la ventana releída sin filas en este refresco: se quitan las que ya no están
+            for mes in set(estado["meses"]) - tocados:
+                if mes >= f"{relee_desde:%Y-%m}":
+                    self._escribe_mes(mes, None, marca, relee_desde)
+
+            estado = {
+                "marca": nueva_marca,
+                "actualizado_en": datetime.now().isoformat(),
+                "meses": sorted(set(estado["meses"]) | tocados),
+                "ultimas_filas": filas,
+                "relee_desde": f"{relee_desde:%Y-%m-%d}",
+            }
+            self._guarda_estado(estado)
+            evento(
+                "snapshot_refrescado", filas=filas, marca=nueva_marca, relee_desde=estado["relee_desde"],
+                reconstruye=reconstruye, meses=sorted(tocados),
+            )
+            return estado
+
+    def _refresca_si_vencido(self) -> None:
+        if self.max_edad < 0:
+            return
+        if self._vencido(self.estado()):
+            # Se vuelve a comprobar dentro del bloqueo: los demás que esperaban no repiten el refresco
+            self.refresca(solo_si_vencido=True)
+
+    def lee(self, fecha_inicio: datetime, fecha_fin: datetime) -> Iterator[pd.DataFrame]:
+        """
+        Entrega, mes a mes, las licencias del snapshot con fecha_emision en el rango
+        (columnas de sql/masivo.sql). Refresca antes si el snapshot está vencido.
+        """
+        self._refresca_si_vencido()
+        for mes in pd.period_range(fecha_inicio, fecha_fin, freq="M").strftime("%Y-%m"):
+            path = self._path_mes(mes)
+            if not path.exists():
+                continue
+            df = feather.read_feather(path, memory_map=True)
+            df = df[df["fecha_emision"].between(fecha_inicio, fecha_fin)].drop(columns="id_licencias")
+            if not df.empty:
+                yield df.reset_index(drop=True)
+
+    def stream(self, fecha_inicio: datetime, fecha_fin: datetime, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """Igual que lee(), en DataFrames de a lo más `chunk_size` filas."""
+        for df in self.lee(fecha_inicio, fecha_fin):
+            for inicio in range(0, len(df), chunk_size):
+                yield df.iloc[inicio:inicio + chunk_size].reset_index(drop=True)
+
+
+# Snapshot compartido por todo el proceso
+snapshot = LicenciasSnapshot()
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else "estado"
+    if comando == "refresca":
+        print(json.dumps(snapshot.refresca(), indent=2))
+    elif comando == "reconstruye":
+        print(json.dumps(snapshot.refresca(reconstruye=True), indent=2))
+    elif comando == "estado":
+        print(json.dumps({"activo": snapshot.activo, **snapshot.estado()}, indent=2))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,116 @@
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.metricas import evento
+from core.services import parse_dates, stream_umbrales, update_umbrales_propensity_score
+
+# Ventanas de los modelos de umbrales (modelo_umbrales_7/15/30): días -> sufijo de columna
+VENTANAS = {7: "semanal", 15: "quincenal", 30: "mensual"}
+
+# Filas por lote al leer sql/umbrales.sql
+UMBRALES_CHUNK_SIZE = int(os.getenv("UMBRALES_CHUNK_SIZE", "200000"))
+
+COLUMNAS_VENTANAS = [
+    f"{medida}_{sufijo}" for sufijo in VENTANAS.values() for medida in ("frecuencia", "otorgados")
+]
+
+
+def calcula_ventanas(ruts: np.ndarray, dias: np.ndarray, dias_reposo: np.ndarray, ventanas: dict = VENTANAS) -> dict:
+    """
+    Para cada licencia cuenta las licencias del mismo médico y suma sus días de reposo
+    en los `w` días que terminan en su fecha de emisión (incluye ese día y la propia
+    licencia), para cada ventana `w`.
+
+    `ruts` son códigos enteros del médico y `dias` la fecha como número de día. Se
+    ordena una sola vez por (médico, día) y cada ventana se resuelve con dos
+    searchsorted sobre esa clave y una suma acumulada: O(N log N) para todas las ventanas.
+    """
+    orden = np.lexsort((dias, ruts))
+    clave = ruts[orden].astype(np.int64) * (1 << 32) + dias[orden].astype(np.int64)
+    acumulado = np.concatenate(([0.0], np.cumsum(np.nan_to_num(dias_reposo[orden].astype(float)))))
+    derecha = np.searchsorted(clave, clave, side="right")
+
+    resultado = {}
+    inverso = np.empty_like(orden)
+    inverso[orden] = np.arange(len(orden))
+    for dias_ventana, sufijo in ventanas.items():
+        izquierda = np.searchsorted(clave, clave - dias_ventana, side="right")
+        resultado[f"frecuencia_{sufijo}"] = (derecha - izquierda)[inverso].astype(float)
+        resultado[f"otorgados_{sufijo}"] = (acumulado[derecha] - acumulado[izquierda])[inverso]
+    return resultado
+
+
+class MotorUmbrales:
+    def __init__(self, ventanas: dict = VENTANAS):
+        """
+        Calcula las ventanas por médico sobre licencias que llegan ordenadas por
+        fecha_emision, lote a lote. Entre lotes solo se conserva la cola de los últimos
+        `max(ventanas)` días, por lo que la memoria no depende del largo del rango.
+        """
+        self.ventanas = ventanas
+        self.max_ventana = max(ventanas)
+
+    def _bloque(self, cola: pd.DataFrame, listos: pd.DataFrame, desde: datetime) -> pd.DataFrame:
+        combinado = pd.concat([cola, listos], ignore_index=True)
+        ruts, _ = pd.factorize(combinado["rut_medico"])
+        dias = combinado["fecha_emision"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        ventanas = calcula_ventanas(ruts, dias, combinado["dias_reposo"].to_numpy(dtype=float), self.ventanas)
+
+        # Solo se emiten las licencias del lote (no las de la cola) que están dentro del rango pedido
+        propias = slice(len(cola), len(combinado))
+        resultado = pd.DataFrame({"id_licencia": combinado["id_licencia"].to_numpy()[propias]})
+        for columna, valores in ventanas.items():
+            resultado[columna] = valores[propias]
+        return resultado[(listos["fecha_emision"] >= desde).to_numpy()]
+
+    def procesa(self, lotes: Iterable[pd.DataFrame], desde: datetime) -> Iterator[pd.DataFrame]:
+        """
+        Entrega las ventanas (id_licencia + COLUMNAS_VENTANAS) de las licencias con
+        fecha_emision >= `desde`. `lotes` debe traer además los `max(ventanas)` días
+        anteriores a `desde` como historia.
+        """
+        cola = None
+        pendientes = None
+        for lote in lotes:
+            lote = lote if pendientes is None else pd.concat([pendientes, lote], ignore_index=True)
+            # El último día del lote puede continuar en el siguiente: se procesa junto con él
+            ultimo = lote["fecha_emision"].max()
+            pendientes = lote[lote["fecha_emision"] == ultimo]
+            listos = lote[lote["fecha_emision"] < ultimo]
+            if listos.empty:
+                continue
+            cola = listos.iloc[:0] if cola is None else cola
+            yield self._bloque(cola, listos, desde)
+            corte = listos["fecha_emision"].max() - timedelta(days=self.max_ventana)
+            cola = pd.concat([cola, listos], ignore_index=True)
+            cola = cola[cola["fecha_emision"] > corte]
+
+        if pendientes is not None and not pendientes.empty:
+            cola = pendientes.iloc[:0] if cola is None else cola
+            yield self._bloque(cola, pendientes, desde)
+
+
+def ejecuta_umbrales(fecha_inicio: str, fecha_fin: str, job=None, chunk_size: Optional[int] = None) -> int:
+    """
+    Calcula las ventanas 7/15/30 días de las licencias del rango y las guarda en
+    ml.propensity_score. Devuelve la cantidad de licencias procesadas.
+    """
+    fecha_inicio_date, fecha_fin_date = parse_dates(fecha_inicio, fecha_fin)
+    motor = MotorUmbrales()
+    lotes = stream_umbrales(
+        fecha_inicio_date - timedelta(days=motor.max_ventana), fecha_fin_date, chunk_size or UMBRALES_CHUNK_SIZE
+    )
+
+    procesadas = 0
+    for ventanas in motor.procesa(lotes, fecha_inicio_date):
+        update_umbrales_propensity_score(ventanas)
+        procesadas += len(ventanas)
+        if job is not None:
+            job.registra_regla("umbrales", len(ventanas), 0)
+
+    evento("umbrales_terminado", fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, procesadas=procesadas)
+    return procesadas
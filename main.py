@@ -1,9 +1,53 @@
-from fastapi import FastAPI
+from dotenv import load_dotenv
+
+# El .env se carga antes de importar los módulos que leen su configuración del entorno
+load_dotenv()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from api.endpoints import router as api_router
+from core.database import pools
+from core.especialidades import diccionario_especialidades
+from core.model_registry import registry
+from core.manager_pickle import cierra_pool_puntaje
+from core.queries import catalogo
+from core.perfilador import PERFILADO, instala_fabrica_tareas, perfila, solicitado
+import time
 import pandas as pd
 
 
-app = FastAPI(title="Manager Pickle Server")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Las tareas que lance un request perfilado se muestrean con él
+    if PERFILADO:
+        instala_fabrica_tareas()
+    # Precargar los modelos de repo_pickle una sola vez al iniciar el servidor
+    registry.carga_todos()
+    # Leer las consultas de sql/ una sola vez (se reutilizan ya compiladas en cada request)
+    catalogo.carga_todos()
+    # Diccionario de especialidades en memoria antes del primer request (si falla, se reintenta al usarlo)
+    diccionario_especialidades.carga()
+    yield
+    cierra_pool_puntaje()
+    await pools.cierra()
+
+
+app = FastAPI(title="Manager Pickle Server", lifespan=lifespan)
+
+if PERFILADO:
+    @app.middleware("http")
+    async def perfilado(request: Request, call_next):
+        """Perfila los requests que lo piden (X-Perfil / ?perfil) o caen en la muestra (PERFILADO_TASA)."""
+        if not solicitado(request.headers, request.query_params):
+            return await call_next(request)
+        nombre = request.url.path.strip("/").replace("/", "_")
+        with perfila(nombre, metodo=request.method, ruta=request.url.path) as perfil:
+            response = await call_next(request)
+            # Lo que no pasó dentro del handler: validación, serialización de la respuesta y middleware
+            total = time.perf_counter() - perfil.inicio
+            perfil.registra_fase("respuesta", total - perfil.fases.get("handler", {}).get("segundos", 0.0))
+        response.headers["X-Perfil"] = perfil.nombre
+        return response
 
 # Registrar el router con el prefijo '/lm/ml'
 app.include_router(api_router, prefix="/lm/ml")
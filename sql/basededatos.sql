@@ -71,6 +71,7 @@ GRANT ALL ON SEQUENCE ml.profesionalidad_id_profesionalidad_seq TO postgres;
 CREATE TABLE ml.especialidad_profesional (
 	id_especialidad_profesional serial4 NOT NULL,
 	descripcion_especialidad_profesional varchar(255) NULL,
+	id_especialidad_canonica int4 NULL,
 	CONSTRAINT especialidad_profesional_descripcion_especialidad_profesion_key UNIQUE (descripcion_especialidad_profesional),
 	CONSTRAINT especialidad_profesional_pkey PRIMARY KEY (id_especialidad_profesional)
 );
@@ -82,6 +83,46 @@ GRANT ALL ON TABLE ml.especialidad_profesional TO postgres;
 GRANT SELECT ON TABLE ml.especialidad_profesional TO consultor;
 
 
+-- ml.especialidad_canonica definition
+
+-- Drop table
+
+-- DROP TABLE ml.especialidad_canonica;
+
+CREATE TABLE ml.especialidad_canonica (
+	id_especialidad_canonica serial4 NOT NULL,
+	nombre varchar(255) NOT NULL,
+	CONSTRAINT especialidad_canonica_pkey PRIMARY KEY (id_especialidad_canonica),
+	CONSTRAINT especialidad_canonica_nombre_key UNIQUE (nombre)
+);
+
+-- Permissions
+
+ALTER TABLE ml.especialidad_canonica OWNER TO postgres;
+GRANT ALL ON TABLE ml.especialidad_canonica TO postgres;
+
+
+-- ml.especialidad_alias definition
+
+-- Drop table
+
+-- DROP TABLE ml.especialidad_alias;
+
+CREATE TABLE ml.especialidad_alias (
+	texto_normalizado varchar(255) NOT NULL,
+	id_especialidad_canonica int4 NOT NULL,
+	origen varchar(16) DEFAULT 'trigram'::character varying NOT NULL,
+	actualizado_en timestamp DEFAULT now() NOT NULL,
+	CONSTRAINT especialidad_alias_pkey PRIMARY KEY (texto_normalizado),
+	CONSTRAINT fk_especialidad_alias_canonica FOREIGN KEY (id_especialidad_canonica) REFERENCES ml.especialidad_canonica(id_especialidad_canonica)
+);
+
+-- Permissions
+
+ALTER TABLE ml.especialidad_alias OWNER TO postgres;
+GRANT ALL ON TABLE ml.especialidad_alias TO postgres;
+
+
 -- ml.medicos definition
 
 -- Drop table
@@ -136,8 +177,11 @@ CREATE TABLE ml.propensity_score (
 	frecuencia_semanal float4 NULL,
 	otorgados_mensual float4 NULL,
 	otorgados_semanal float4 NULL,
+	frecuencia_quincenal float4 NULL,
+	otorgados_quincenal float4 NULL,
 	ml float4 NULL,
-	score float4 NULL
+	score float4 NULL,
+	version_modelo varchar(64) NULL
 );
 
 -- Permissions
@@ -146,6 +190,27 @@ ALTER TABLE ml.propensity_score OWNER TO postgres;
 GRANT ALL ON TABLE ml.propensity_score TO postgres;
 
 
+-- ml.propensity_score_diario definition
+
+-- Drop table
+
+-- DROP TABLE ml.propensity_score_diario;
+
+CREATE TABLE ml.propensity_score_diario (
+	fecha_emision date NOT NULL,
+	rn int4 NOT NULL,
+	cantidad_registros int8 NOT NULL,
+	positivos int8 NOT NULL,
+	actualizado_en timestamp NOT NULL DEFAULT now(),
+	CONSTRAINT propensity_score_diario_pkey PRIMARY KEY (fecha_emision, rn)
+);
+
+-- Permissions
+
+ALTER TABLE ml.propensity_score_diario OWNER TO postgres;
+GRANT ALL ON TABLE ml.propensity_score_diario TO postgres;
+
+
 -- ml.propensity_score_bak definition
 
 -- Drop table
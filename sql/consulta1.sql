@@ -15,10 +15,21 @@
     WHERE
         li.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
         AND li.cod_diagnostico_principal = :cod_diagnostico_principal
-        AND similarity(unaccent(lower(ep.descripcion_especialidad_profesional)), unaccent(lower(:especialidad_profesional))) > 0.8
+        -- La especialidad pedida se resuelve a su id canónico en memoria (core/especialidades.py).
+        -- Si no se resolvió, o la especialidad del catálogo aún no tiene id (nueva o sin
+        -- construir el diccionario), se compara el texto por similitud de trigramas como
+        -- antes; % filtra con el índice trigram (migración 005) y similarity() > 0.8 decide.
+        AND (
+            ep.id_especialidad_canonica = :id_especialidad_canonica
+            OR (
+                (ep.id_especialidad_canonica IS NULL OR CAST(:id_especialidad_canonica AS int) IS NULL)
+                AND ml.f_unaccent(lower(ep.descripcion_especialidad_profesional)) % ml.f_unaccent(lower(:especialidad_profesional))
+                AND similarity(ml.f_unaccent(lower(ep.descripcion_especialidad_profesional)), ml.f_unaccent(lower(:especialidad_profesional))) > 0.8
+            )
+        )
         AND NOT EXISTS (
             SELECT 1
             FROM ml.propensity_score ps
             WHERE ps.id_lic = li.id_lic
-            AND ps.rn = 1
+            AND ps.rn = :rn
         );
\ No newline at end of file
@@ -0,0 +1,43 @@
+-- SQLBook: Code
+-- consulta1.sql para un lote de combinaciones (diagnóstico, especialidad canónica) en
+-- una sola consulta: las combinaciones llegan como arreglos paralelos y se unen como
+-- tabla con unnest, de modo que cada una se resuelve con el índice
+-- (cod_diagnostico_principal, fecha_emision). "combinacion" es la posición (desde 0)
+-- de la combinación en el lote. Se excluyen las licencias con score de la regla :rn.
+-- Las combinaciones sin id canónico (id 0) y las especialidades del catálogo aún sin
+-- id se comparan por similitud de trigramas, como en consulta1.sql.
+SELECT
+    li.id_lic AS id_licencia,
+    li.folio,
+    li.dias_reposo,
+    li.fecha_emision,
+    li.fecha_inicio_reposo,
+    ep.descripcion_especialidad_profesional AS especialidad_profesional,
+    li.cod_diagnostico_principal,
+    c.combinacion
+FROM
+    unnest(
+        CAST(:cod_diagnosticos AS varchar[]),
+        CAST(:especialidades AS varchar[]),
+        CAST(:ids_especialidad AS int[]),
+        CAST(:combinaciones AS int[])
+    ) AS c(cod_diagnostico_principal, especialidad_profesional, id_especialidad_canonica, combinacion)
+    JOIN ml.licencias AS li ON li.cod_diagnostico_principal = c.cod_diagnostico_principal
+    JOIN ml.especialidad_profesional_medicos epm ON li.rut_medico = epm.rut_medico
+    JOIN ml.especialidad_profesional ep ON epm.id_especialidad_profesional = ep.id_especialidad_profesional
+WHERE
+    li.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+    AND (
+        ep.id_especialidad_canonica = c.id_especialidad_canonica
+        OR (
+            (ep.id_especialidad_canonica IS NULL OR c.id_especialidad_canonica = 0)
+            AND ml.f_unaccent(lower(ep.descripcion_especialidad_profesional)) % ml.f_unaccent(lower(c.especialidad_profesional))
+            AND similarity(ml.f_unaccent(lower(ep.descripcion_especialidad_profesional)), ml.f_unaccent(lower(c.especialidad_profesional))) > 0.8
+        )
+    )
+    AND NOT EXISTS (
+        SELECT 1
+        FROM ml.propensity_score ps
+        WHERE ps.id_lic = li.id_lic
+        AND ps.rn = :rn
+    );
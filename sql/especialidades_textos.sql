@@ -0,0 +1,18 @@
+-- SQLBook: Code
+-- Textos de especialidad y su frecuencia, desde el catálogo y desde los diagnósticos
+-- de licencias, para construir el diccionario de especialidades canónicas.
+SELECT 
+    t.texto,
+    SUM(t.cantidad) AS cantidad
+FROM (
+    SELECT ep.descripcion_especialidad_profesional AS texto, 1 AS cantidad
+    FROM ml.especialidad_profesional ep
+    UNION ALL
+    SELECT lde.especialidad_medico AS texto, COUNT(*) AS cantidad
+    FROM ml.licencia_diagnostico_especialidad lde
+    GROUP BY lde.especialidad_medico
+) t
+WHERE 
+    t.texto IS NOT NULL
+GROUP BY 
+    t.texto
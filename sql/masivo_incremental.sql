@@ -0,0 +1,34 @@
+-- SQLBook: Code
+-- Licencias del rango a las que les falta el score de alguna regla (:rns) con la
+-- versión vigente de su modelo (:versiones, en el mismo orden que :rns).
+-- rn_pendientes indica qué reglas hay que puntuar para cada licencia.
+-- Las licencias sin dias_reposo o con más de :dias_reposo_max no se leen: el modelo las
+-- descarta sin score, así que quedarían pendientes y se releerían en cada ejecución.
+SELECT 
+    lic.id_lic AS id_licencia,
+    lic.folio,
+    lic.dias_reposo,
+    lic.fecha_emision,
+    lic.fecha_inicio_reposo,
+    diag.especialidad_medico AS especialidad_profesional,
+    diag.cod_diagnostico AS cod_diagnostico_principal,
+    pend.rn_pendientes
+FROM ml.licencias lic
+INNER JOIN ml.licencia_diagnostico_especialidad diag
+    ON lic.id_lic = diag.id_licencia
+CROSS JOIN LATERAL (
+    SELECT ARRAY(
+        SELECT m.rn
+        FROM unnest(CAST(:rns AS int[]), CAST(:versiones AS varchar[])) AS m(rn, version_modelo)
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM ml.propensity_score ps
+            WHERE ps.id_lic = lic.id_lic
+            AND ps.rn = m.rn
+            AND ps.version_modelo = m.version_modelo
+        )
+    ) AS rn_pendientes
+) pend
+WHERE lic.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+    AND lic.dias_reposo <= :dias_reposo_max
+    AND cardinality(pend.rn_pendientes) > 0;
@@ -0,0 +1,13 @@
+-- SQLBook: Code
+SELECT 
+    ps.id_lic,
+    ps.folio,
+    ps.rn,
+    ps.score
+FROM ml.propensity_score ps
+INNER JOIN ml.licencias l
+    ON l.id_lic = ps.id_lic
+WHERE l.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+    AND (ps.id_lic, ps.rn) > (:despues_id_lic, :despues_rn)
+ORDER BY ps.id_lic, ps.rn
+LIMIT :limite;
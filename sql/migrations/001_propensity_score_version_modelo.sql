@@ -0,0 +1,6 @@
+-- SQLBook: Code
+-- Versión (hash de contenido del pickle) del modelo que calculó cada score.
+-- La ejecución masiva incremental vuelve a puntuar las licencias cuyo score
+-- se calculó con una versión distinta a la cargada.
+ALTER TABLE ml.propensity_score
+    ADD COLUMN IF NOT EXISTS version_modelo varchar(64) NULL;
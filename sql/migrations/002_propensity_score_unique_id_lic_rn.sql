@@ -0,0 +1,15 @@
+-- SQLBook: Code
+-- Índice único (id_lic, rn): lo exige el ON CONFLICT (id_lic, rn) del upsert de scores
+-- y sirve también para los JOIN / NOT EXISTS por id_lic contra ml.propensity_score.
+
+-- Elimina duplicados previos conservando la última fila escrita de cada (id_lic, rn)
+DELETE FROM ml.propensity_score a
+USING ml.propensity_score b
+WHERE a.id_lic = b.id_lic
+    AND a.rn = b.rn
+    AND a.ctid < b.ctid;
+
+-- Si la construcción falla (p. ej. por un duplicado escrito después del DELETE) el índice
+-- queda INVALID; al reintentar, core/migrations.py lo elimina antes de este CREATE
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_propensity_score_id_lic_rn
+    ON ml.propensity_score USING btree (id_lic, rn);
@@ -0,0 +1,8 @@
+-- SQLBook: Code
+-- Todas las consultas de sql/ filtran ml.licencias por rango de fecha_emision.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_licencias_fecha_emision
+    ON ml.licencias USING btree (fecha_emision);
+
+-- consulta1.sql filtra además por diagnóstico exacto dentro del rango
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_licencias_cod_diagnostico_fecha_emision
+    ON ml.licencias USING btree (cod_diagnostico_principal, fecha_emision);
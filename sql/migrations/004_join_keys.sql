@@ -0,0 +1,14 @@
+-- SQLBook: Code
+-- Llaves de JOIN de las consultas de sql/
+
+-- masivo*.sql, propensy_score_*.sql: licencias ⨝ licencia_diagnostico_especialidad
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lde_id_licencia
+    ON ml.licencia_diagnostico_especialidad USING btree (id_licencia);
+
+-- consulta1.sql: licencias ⨝ especialidad_profesional_medicos por rut_medico
+-- (la PK de especialidad_profesional_medicos no empieza por rut_medico)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_epm_rut_medico
+    ON ml.especialidad_profesional_medicos USING btree (rut_medico);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_licencias_rut_medico
+    ON ml.licencias USING btree (rut_medico);
@@ -0,0 +1,18 @@
+-- SQLBook: Code
+-- Índice trigram para el filtro por similitud de especialidad de consulta1.sql.
+-- unaccent() no es IMMUTABLE y no puede usarse en un índice: se envuelve en
+-- ml.f_unaccent, que fija el diccionario y sí lo es.
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION ml.f_unaccent(text)
+    RETURNS text
+    LANGUAGE sql
+    IMMUTABLE PARALLEL SAFE STRICT
+AS $func$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$func$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_especialidad_profesional_trgm
+    ON ml.especialidad_profesional
+    USING gin (ml.f_unaccent(lower(descripcion_especialidad_profesional)) gin_trgm_ops);
@@ -0,0 +1,33 @@
+-- SQLBook: Code
+-- Agregado diario de ml.propensity_score para /score (sql/propensy_score_diario.sql).
+-- Lo mantienen por diferencias los triggers de la migración 009; aquí se carga el
+-- histórico una sola vez.
+CREATE TABLE IF NOT EXISTS ml.propensity_score_diario (
+    fecha_emision date NOT NULL,
+    rn int4 NOT NULL,
+    cantidad_registros int8 NOT NULL,
+    positivos int8 NOT NULL,
+    actualizado_en timestamp NOT NULL DEFAULT now(),
+    CONSTRAINT propensity_score_diario_pkey PRIMARY KEY (fecha_emision, rn)
+);
+
+INSERT INTO ml.propensity_score_diario (fecha_emision, rn, cantidad_registros, positivos)
+SELECT 
+    l.fecha_emision::date,
+    ps.rn,
+    COUNT(*),
+    COUNT(*) FILTER (WHERE ps.score > 0)
+FROM 
+    ml.licencias l
+    INNER JOIN ml.licencia_diagnostico_especialidad lde ON l.id_lic = lde.id_licencia
+    INNER JOIN ml.propensity_score ps ON l.id_lic = ps.id_lic
+WHERE 
+    l.fecha_emision IS NOT NULL
+    AND ps.rn IS NOT NULL
+GROUP BY 
+    l.fecha_emision::date,
+    ps.rn
+ON CONFLICT (fecha_emision, rn) DO UPDATE
+SET cantidad_registros = EXCLUDED.cantidad_registros,
+    positivos = EXCLUDED.positivos,
+    actualizado_en = now();
@@ -0,0 +1,5 @@
+-- SQLBook: Code
+-- Ventana de 15 días de los modelos de umbrales (core/umbrales.py); las de 7 y 30
+-- días usan las columnas *_semanal y *_mensual ya existentes.
+ALTER TABLE ml.propensity_score ADD COLUMN IF NOT EXISTS frecuencia_quincenal float4 NULL;
+ALTER TABLE ml.propensity_score ADD COLUMN IF NOT EXISTS otorgados_quincenal float4 NULL;
@@ -0,0 +1,26 @@
+-- SQLBook: Code
+-- Diccionario de especialidades canónicas (core/especialidades.py). Cada texto de
+-- especialidad normalizado (sin tildes, minúsculas, espacios colapsados) apunta a una
+-- especialidad canónica; origen 'manual' marca las correcciones que el constructor no pisa.
+CREATE TABLE IF NOT EXISTS ml.especialidad_canonica (
+    id_especialidad_canonica serial4 NOT NULL,
+    nombre varchar(255) NOT NULL,
+    CONSTRAINT especialidad_canonica_pkey PRIMARY KEY (id_especialidad_canonica),
+    CONSTRAINT especialidad_canonica_nombre_key UNIQUE (nombre)
+);
+
+CREATE TABLE IF NOT EXISTS ml.especialidad_alias (
+    texto_normalizado varchar(255) NOT NULL,
+    id_especialidad_canonica int4 NOT NULL,
+    origen varchar(16) NOT NULL DEFAULT 'trigram',
+    actualizado_en timestamp NOT NULL DEFAULT now(),
+    CONSTRAINT especialidad_alias_pkey PRIMARY KEY (texto_normalizado),
+    CONSTRAINT fk_especialidad_alias_canonica FOREIGN KEY (id_especialidad_canonica)
+        REFERENCES ml.especialidad_canonica(id_especialidad_canonica)
+);
+
+-- sql/consulta1.sql filtra por este id en vez de calcular similarity() por fila
+ALTER TABLE ml.especialidad_profesional ADD COLUMN IF NOT EXISTS id_especialidad_canonica int4 NULL;
+
+CREATE INDEX IF NOT EXISTS idx_especialidad_profesional_canonica
+    ON ml.especialidad_profesional USING btree (id_especialidad_canonica);
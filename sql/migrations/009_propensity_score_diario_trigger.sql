@@ -0,0 +1,114 @@
+-- SQLBook: Code
+-- ml.propensity_score_diario se mantiene por diferencias: triggers por sentencia sobre
+-- ml.propensity_score suman las filas nuevas y restan las anteriores (tablas de
+-- transición), en la misma transacción que la escritura. Reemplaza el recálculo de
+-- días completos por lote de upsert, cuyo costo crecía con el tamaño del día y que
+-- con escrituras concurrentes podía dejar un conteo viejo (READ COMMITTED).
+-- Los incrementos (col = col + delta) se aplican en orden de (fecha_emision, rn) para
+-- que dos escrituras concurrentes se esperen sin bloquearse mutuamente.
+CREATE OR REPLACE FUNCTION ml.propensity_score_diario_delta()
+    RETURNS trigger
+    LANGUAGE plpgsql
+AS $func$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO ml.propensity_score_diario AS d (fecha_emision, rn, cantidad_registros, positivos, actualizado_en)
+        SELECT l.fecha_emision::date, c.rn, COUNT(*), COUNT(*) FILTER (WHERE c.score > 0), now()
+        FROM nuevos c
+            JOIN ml.licencias l ON l.id_lic = c.id_lic
+            JOIN ml.licencia_diagnostico_especialidad lde ON l.id_lic = lde.id_licencia
+        WHERE l.fecha_emision IS NOT NULL AND c.rn IS NOT NULL
+        GROUP BY l.fecha_emision::date, c.rn
+        ORDER BY 1, 2
+        ON CONFLICT (fecha_emision, rn) DO UPDATE
+        SET cantidad_registros = d.cantidad_registros + EXCLUDED.cantidad_registros,
+            positivos = d.positivos + EXCLUDED.positivos,
+            actualizado_en = EXCLUDED.actualizado_en;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE ml.propensity_score_diario AS d
+        SET cantidad_registros = d.cantidad_registros - c.cantidad,
+            positivos = d.positivos - c.positivos,
+            actualizado_en = now()
+        FROM (
+            SELECT l.fecha_emision::date AS fecha_emision, v.rn, COUNT(*) AS cantidad,
+                   COUNT(*) FILTER (WHERE v.score > 0) AS positivos
+            FROM viejos v
+                JOIN ml.licencias l ON l.id_lic = v.id_lic
+                JOIN ml.licencia_diagnostico_especialidad lde ON l.id_lic = lde.id_licencia
+            GROUP BY 1, 2
+        ) c
+        WHERE d.fecha_emision = c.fecha_emision AND d.rn = c.rn;
+
+    ELSE
+        -- UPDATE: solo las filas cuyo score (o clave) cambió aportan diferencia; las
+        -- que no cambian (p. ej. umbrales_update.sql) se anulan antes de unir con licencias
+        INSERT INTO ml.propensity_score_diario AS d (fecha_emision, rn, cantidad_registros, positivos, actualizado_en)
+        SELECT l.fecha_emision::date, c.rn, SUM(c.cantidad), SUM(c.positivos), now()
+        FROM (
+            SELECT id_lic, rn, SUM(cantidad) AS cantidad, SUM(positivos) AS positivos
+            FROM (
+                SELECT n.id_lic, n.rn, 1 AS cantidad, CASE WHEN n.score > 0 THEN 1 ELSE 0 END AS positivos
+                FROM nuevos n
+                UNION ALL
+                SELECT v.id_lic, v.rn, -1, CASE WHEN v.score > 0 THEN -1 ELSE 0 END
+                FROM viejos v
+            ) cambios
+            GROUP BY id_lic, rn
+            HAVING SUM(cantidad) <> 0 OR SUM(positivos) <> 0
+        ) c
+            JOIN ml.licencias l ON l.id_lic = c.id_lic
+            JOIN ml.licencia_diagnostico_especialidad lde ON l.id_lic = lde.id_licencia
+        WHERE l.fecha_emision IS NOT NULL AND c.rn IS NOT NULL
+        GROUP BY l.fecha_emision::date, c.rn
+        ORDER BY 1, 2
+        ON CONFLICT (fecha_emision, rn) DO UPDATE
+        SET cantidad_registros = d.cantidad_registros + EXCLUDED.cantidad_registros,
+            positivos = d.positivos + EXCLUDED.positivos,
+            actualizado_en = EXCLUDED.actualizado_en;
+    END IF;
+    RETURN NULL;
+END
+$func$;
+
+-- Triggers y recálculo del histórico en una sola transacción, con las escrituras de
+-- ml.propensity_score bloqueadas: ningún cambio queda fuera del recálculo ni se cuenta dos veces
+DO $do$
+BEGIN
+    LOCK TABLE ml.propensity_score IN SHARE ROW EXCLUSIVE MODE;
+
+    DROP TRIGGER IF EXISTS propensity_score_diario_insert ON ml.propensity_score;
+    DROP TRIGGER IF EXISTS propensity_score_diario_update ON ml.propensity_score;
+    DROP TRIGGER IF EXISTS propensity_score_diario_delete ON ml.propensity_score;
+    CREATE TRIGGER propensity_score_diario_insert
+        AFTER INSERT ON ml.propensity_score
+        REFERENCING NEW TABLE AS nuevos
+        FOR EACH STATEMENT EXECUTE FUNCTION ml.propensity_score_diario_delta();
+    CREATE TRIGGER propensity_score_diario_update
+        AFTER UPDATE ON ml.propensity_score
+        REFERENCING OLD TABLE AS viejos NEW TABLE AS nuevos
+        FOR EACH STATEMENT EXECUTE FUNCTION ml.propensity_score_diario_delta();
+    CREATE TRIGGER propensity_score_diario_delete
+        AFTER DELETE ON ml.propensity_score
+        REFERENCING OLD TABLE AS viejos
+        FOR EACH STATEMENT EXECUTE FUNCTION ml.propensity_score_diario_delta();
+
+    DELETE FROM ml.propensity_score_diario;
+    INSERT INTO ml.propensity_score_diario (fecha_emision, rn, cantidad_registros, positivos)
+    SELECT
+        l.fecha_emision::date,
+        ps.rn,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE ps.score > 0)
+    FROM
+        ml.licencias l
+        INNER JOIN ml.licencia_diagnostico_especialidad lde ON l.id_lic = lde.id_licencia
+        INNER JOIN ml.propensity_score ps ON l.id_lic = ps.id_lic
+    WHERE
+        l.fecha_emision IS NOT NULL
+        AND ps.rn IS NOT NULL
+    GROUP BY
+        l.fecha_emision::date,
+        ps.rn;
+END
+$do$;
@@ -0,0 +1,14 @@
+-- SQLBook: Code
+-- Resumen de /score leído desde el agregado diario (ver sql/propensy_score_resume.sql
+-- para la versión que agrega sobre las tablas de detalle)
+SELECT 
+    d.fecha_emision,
+    d.rn,
+    d.cantidad_registros,
+    d.positivos
+FROM 
+    ml.propensity_score_diario d
+WHERE 
+    d.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+ORDER BY 
+    d.fecha_emision, d.rn
@@ -1,17 +1,46 @@
 -- SQLBook: Code
+-- Una fila por licencia (y diagnóstico/especialidad) con los scores de cada regla
+-- pivoteados en "score" ({"rn_1": ..., "rn_2": ...}). Se pagina por keyset sobre
+-- id_lic: cada página trae las :limite licencias siguientes a :despues_id_lic
+-- (con :limite NULL se trae el rango completo).
+WITH pagina AS (
+    SELECT 
+        l.id_lic,
+        l.fecha_emision,
+        l.rut_medico,
+        l.dias_reposo
+    FROM 
+        ml.licencias l
+    WHERE 
+        l.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+        AND l.id_lic > :despues_id_lic
+        AND EXISTS (SELECT 1 FROM ml.licencia_diagnostico_especialidad lde WHERE lde.id_licencia = l.id_lic)
+        AND EXISTS (SELECT 1 FROM ml.propensity_score ps WHERE ps.id_lic = l.id_lic)
+    ORDER BY 
+        l.id_lic
+    LIMIT :limite
+)
 SELECT 
-	l.id_lic ,
-    l.fecha_emision ,
-    l.rut_medico ,
-    l.dias_reposo ,
+    p.id_lic,
+    p.fecha_emision,
+    p.rut_medico,
+    p.dias_reposo,
     lde.cod_diagnostico,
     lde.especialidad_medico,
-    ps.rn,
-    ps.score
+    COALESCE(
+        jsonb_object_agg('rn_' || ps.rn, ps.score) FILTER (WHERE ps.rn IS NOT NULL),
+        '{}'::jsonb
+    ) AS score
 FROM 
-    ml.licencias l
-    INNER JOIN ml.licencia_diagnostico_especialidad lde ON l.id_lic = lde.id_licencia
-    INNER JOIN ml.propensity_score ps ON l.id_lic = ps.id_lic
-WHERE 
-	1=1
-    and l.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin 
\ No newline at end of file
+    pagina p
+    INNER JOIN ml.licencia_diagnostico_especialidad lde ON p.id_lic = lde.id_licencia
+    INNER JOIN ml.propensity_score ps ON p.id_lic = ps.id_lic
+GROUP BY 
+    p.id_lic,
+    p.fecha_emision,
+    p.rut_medico,
+    p.dias_reposo,
+    lde.cod_diagnostico,
+    lde.especialidad_medico
+ORDER BY 
+    p.id_lic, lde.cod_diagnostico, lde.especialidad_medico
@@ -0,0 +1,10 @@
+-- SQLBook: Code
+-- Reglas con scores en el rango, desde el agregado diario (columnas del CSV de /score/details)
+SELECT DISTINCT 
+    d.rn
+FROM 
+    ml.propensity_score_diario d
+WHERE 
+    d.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+ORDER BY 
+    d.rn
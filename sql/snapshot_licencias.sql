@@ -0,0 +1,20 @@
+-- SQLBook: Code
+-- Licencias nuevas para el snapshot local (core/snapshot.py): mismas columnas que
+-- sql/masivo.sql más id_licencias, que es la marca de avance del snapshot. Las emitidas
+-- desde :relee_desde se leen todas de nuevo: su fila de diagnóstico pudo llegar después
+-- de que la marca pasó por ellas.
+SELECT 
+    lic.id_licencias,
+    lic.id_lic AS id_licencia,
+    lic.folio,
+    lic.dias_reposo,
+    lic.fecha_emision,
+    lic.fecha_inicio_reposo,
+    diag.especialidad_medico AS especialidad_profesional,
+    diag.cod_diagnostico AS cod_diagnostico_principal
+FROM ml.licencias lic
+INNER JOIN ml.licencia_diagnostico_especialidad diag
+    ON lic.id_lic = diag.id_licencia
+WHERE (lic.id_licencias > :desde_id OR lic.fecha_emision >= :relee_desde)
+    AND lic.fecha_emision IS NOT NULL
+ORDER BY lic.id_licencias;
@@ -0,0 +1,15 @@
+-- SQLBook: Code
+-- Licencias por médico para las ventanas de los modelos de umbrales (core/umbrales.py).
+-- :fecha_inicio ya incluye los días de historia de la ventana más larga.
+SELECT 
+    l.id_lic AS id_licencia,
+    l.rut_medico,
+    l.fecha_emision,
+    l.dias_reposo
+FROM 
+    ml.licencias l
+WHERE 
+    l.fecha_emision BETWEEN :fecha_inicio AND :fecha_fin
+    AND l.rut_medico IS NOT NULL
+ORDER BY 
+    l.fecha_emision;
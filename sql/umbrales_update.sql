@@ -0,0 +1,21 @@
+-- SQLBook: Code
+-- Guarda las ventanas de los modelos de umbrales en todas las filas (una por regla)
+-- de cada licencia en ml.propensity_score. Los arreglos van en paralelo, uno por columna.
+UPDATE ml.propensity_score ps
+SET 
+    frecuencia_semanal = v.frecuencia_semanal,
+    otorgados_semanal = v.otorgados_semanal,
+    frecuencia_quincenal = v.frecuencia_quincenal,
+    otorgados_quincenal = v.otorgados_quincenal,
+    frecuencia_mensual = v.frecuencia_mensual,
+    otorgados_mensual = v.otorgados_mensual
+FROM unnest(
+    CAST(:id_licencia AS varchar[]),
+    CAST(:frecuencia_semanal AS float4[]),
+    CAST(:otorgados_semanal AS float4[]),
+    CAST(:frecuencia_quincenal AS float4[]),
+    CAST(:otorgados_quincenal AS float4[]),
+    CAST(:frecuencia_mensual AS float4[]),
+    CAST(:otorgados_mensual AS float4[])
+) AS v(id_lic, frecuencia_semanal, otorgados_semanal, frecuencia_quincenal, otorgados_quincenal, frecuencia_mensual, otorgados_mensual)
+WHERE ps.id_lic = v.id_lic;
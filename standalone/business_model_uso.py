@@ -19,7 +19,7 @@ def validar_columnas(df, columnas_requeridas):
 
 def main():
     if len(sys.argv) < 3:
-        print("Uso: python business_test.py <modelo.pkl> <datos.csv> [archivo_salida.csv]")
+        print("Uso: python business_test.py <modelo.pkl> <datos.csv|.feather|.parquet> [archivo_salida.csv]")
         sys.exit(1)
 
     modelo_path = sys.argv[1]
@@ -39,7 +39,13 @@ def main():
         print(f"Error: el archivo de datos '{datos_path}' no existe.")
         sys.exit(1)
 
-    df = pd.read_csv(datos_path)
+    # Además de CSV acepta los archivos del snapshot local de licencias (core/snapshot.py)
+    if datos_path.endswith(".feather"):
+        df = pd.read_feather(datos_path)
+    elif datos_path.endswith(".parquet"):
+        df = pd.read_parquet(datos_path)
+    else:
+        df = pd.read_csv(datos_path)
 
     # Validar columnas necesarias
     validar_columnas(df, required_columns)
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from core.cache import ResultCache
+
+ENERO = ("score", datetime(2024, 1, 1), datetime(2024, 1, 31, 23, 59, 59))
+MARZO = ("score", datetime(2024, 3, 1), datetime(2024, 3, 31, 23, 59, 59))
+
+
+def test_no_guarda_un_calculo_invalidado_mientras_corria():
+    cache = ResultCache("prueba")
+
+    def calcula():
+        # La escritura confirma e invalida después de que la lectura empezó
+        cache.invalida_rango(datetime(2024, 1, 15), datetime(2024, 1, 15))
+        return ["viejo"]
+
+    assert cache.obtiene(ENERO, calcula) == ["viejo"]
+    assert cache.get(ENERO) is None
+    assert cache.stats()["descartadas"] == 1
+    assert cache.obtiene(ENERO, lambda: ["nuevo"]) == ["nuevo"]
+    assert cache.get(ENERO) == ["nuevo"]
+
+
+def test_invalidar_otro_rango_no_descarta_el_calculo():
+    cache = ResultCache("prueba")
+
+    def calcula():
+        cache.invalida_rango(datetime(2024, 3, 10), datetime(2024, 3, 10))
+        return ["enero"]
+
+    cache.obtiene(ENERO, calcula)
+    assert cache.get(ENERO) == ["enero"]
+
+
+def test_set_con_generacion_vieja_se_descarta():
+    cache = ResultCache("prueba")
+    generacion = cache.generacion
+    cache.invalida_rango(None, None)
+    assert cache.set(MARZO, ["viejo"], generacion) is False
+    assert cache.set(MARZO, ["nuevo"], cache.generacion) is True
+
+
+def test_pedidos_simultaneos_calculan_una_vez():
+    cache = ResultCache("prueba")
+    liberar = threading.Event()
+    llamadas = []
+
+    def calcula():
+        llamadas.append(1)
+        liberar.wait(5)
+        return ["fila"]
+
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(cache.obtiene(ENERO, calcula))) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    limite = time.monotonic() + 5
+    while cache.stats()["coalescidas"] < 7 and time.monotonic() < limite:
+        time.sleep(0.001)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+    assert len(llamadas) == 1
+    assert resultados == [["fila"]] * 8
+
+
+def test_pedidos_async_simultaneos_calculan_una_vez():
+    cache = ResultCache("prueba")
+    llamadas = []
+
+    async def calcula():
+        llamadas.append(1)
+        await asyncio.sleep(0.05)
+        return ["fila"]
+
+    async def pedidos():
+        return await asyncio.gather(*(cache.obtiene_async(ENERO, calcula) for _ in range(20)))
+
+    assert asyncio.run(pedidos()) == [["fila"]] * 20
+    assert len(llamadas) == 1
+    assert cache.get(ENERO) == ["fila"]
+
+
+def test_error_llega_a_todos_los_que_esperan():
+    cache = ResultCache("prueba")
+
+    async def calcula():
+        await asyncio.sleep(0.01)
+        raise ValueError("base caída")
+
+    async def pedidos():
+        return await asyncio.gather(*(cache.obtiene_async(ENERO, calcula) for _ in range(3)), return_exceptions=True)
+
+    errores = asyncio.run(pedidos())
+    assert all(isinstance(error, ValueError) for error in errores)
+    assert cache.stats()["en_curso"] == 0
+
+
+def test_pedido_posterior_a_la_invalidacion_no_espera_el_calculo_viejo():
+    cache = ResultCache("prueba")
+    llamadas = []
+
+    async def calcula():
+        llamadas.append(1)
+        await asyncio.sleep(0.05)
+        return len(llamadas)
+
+    async def pedidos():
+        primero = asyncio.ensure_future(cache.obtiene_async(ENERO, calcula))
+        await asyncio.sleep(0.01)
+        cache.invalida_rango(datetime(2024, 1, 20), datetime(2024, 1, 20))
+        segundo = await cache.obtiene_async(ENERO, calcula)
+        return await primero, segundo
+
+    assert asyncio.run(pedidos()) == (2, 2)
+    assert len(llamadas) == 2
+    assert cache.get(ENERO) == 2
@@ -0,0 +1,76 @@
+import io
+
+import pandas as pd
+
+from core.columnar import (
+    ARREGLO_ENTEROS, CATEGORIA, ENTERO, FECHA, TEXTO, _LectorCopy, _parsea, sql_con_literales,
+)
+
+TIPOS = {
+    "id_licencia": TEXTO,
+    "dias_reposo": ENTERO,
+    "fecha_emision": FECHA,
+    "especialidad_profesional": CATEGORIA,
+    "cod_diagnostico_principal": TEXTO,
+    "ids": ARREGLO_ENTEROS,
+}
+
+# Salida de COPY ... TO STDOUT WITH (FORMAT csv, NULL '\N'): el texto vacío sale como ""
+FILAS = [
+    b'L1,10,2025-01-10,Medicina General,F32,"{1,2,3}"\n',
+    b'L2,\\N,2025-01-11,"",NA,{}\n',
+    b'L3,0,\\N,\\N,"",\\N\n',
+    b'L4,365,2025-01-12,"Traumatolog\xc3\xada, adultos",null,{7}\n',
+]
+
+
+def _archivo(bloques):
+    # psycopg 3 entrega un bloque por fila
+    return io.BufferedReader(_LectorCopy(bloques), 16)
+
+
+def test_nulo_distinto_de_texto_vacio():
+    (df,) = list(_parsea(_archivo(FILAS), TIPOS, None))
+    assert df["id_licencia"].tolist() == ["L1", "L2", "L3", "L4"]
+    assert df["cod_diagnostico_principal"].tolist() == ["F32", "NA", "", "null"]
+    especialidades = df["especialidad_profesional"]
+    assert especialidades.dtype == "category"
+    assert especialidades.iloc[1] == ""
+    assert pd.isna(especialidades.iloc[2])
+    assert especialidades.iloc[3] == "Traumatología, adultos"
+    assert df["ids"].tolist() == [[1, 2, 3], [], [], [7]]
+    assert df["fecha_emision"].dtype.kind == "M"
+    assert pd.isna(df["fecha_emision"].iloc[2])
+    assert df["fecha_emision"].iloc[0] == pd.Timestamp("2025-01-10")
+
+
+def test_enteros_int32_en_todos_los_lotes():
+    lotes = list(_parsea(_archivo(FILAS), TIPOS, 2))
+    assert [len(df) for df in lotes] == [2, 2]
+    # El segundo lote no trae nulos en dias_reposo y aun así queda como Int32 nullable
+    assert all(str(df["dias_reposo"].dtype) == "Int32" for df in lotes)
+    assert lotes[0]["dias_reposo"].tolist() == [10, pd.NA]
+    assert lotes[1]["dias_reposo"].tolist() == [0, 365]
+
+
+def test_bloques_partidos_en_cualquier_punto():
+    payload = b"".join(FILAS)
+    bloques = [payload[i:i + 5] for i in range(0, len(payload), 5)]
+    (partido,) = list(_parsea(_archivo(bloques), TIPOS, None))
+    (por_fila,) = list(_parsea(_archivo(FILAS), TIPOS, None))
+    pd.testing.assert_frame_equal(partido, por_fila)
+
+
+def test_sin_filas_no_entrega_lotes():
+    assert list(_parsea(_archivo([]), TIPOS, 10)) == []
+
+
+def test_sql_con_literales_escapa_y_omite_parametros_no_usados():
+    sql = sql_con_literales(
+        "SELECT 1 FROM t WHERE a = :nombre AND b = ANY(:ids) AND c % 'x';",
+        {"nombre": "O'Higgins", "ids": [1, 2], "sobra": 3},
+    )
+    assert "'O''Higgins'" in sql
+    assert "ARRAY[1, 2]" in sql
+    assert "c % 'x'" in sql
+    assert not sql.endswith(";")
@@ -0,0 +1,33 @@
+import asyncio
+
+from core import database
+from core.database import LOTE, Pools
+
+
+def _entorno(monkeypatch, host, nombre):
+    for clave, valor in {"DB_HOST": host, "DB_PORT": "5433", "DB_NAME": nombre, "DB_USER": "ml", "DB_PASS": "secreto"}.items():
+        monkeypatch.setenv(clave, valor)
+
+
+def test_datos_de_conexion_se_leen_al_crear_el_motor(monkeypatch):
+    # El módulo ya está importado: lo que cuenta es el entorno al crear cada motor
+    _entorno(monkeypatch, "db-uno", "susesoml")
+    pools = Pools()
+    url = pools.motor(LOTE).url
+    assert (url.host, url.port, url.database, url.username, url.password) == ("db-uno", 5433, "susesoml", "ml", "secreto")
+    url_async = pools.motor_async().url
+    assert url_async.drivername == "postgresql+asyncpg"
+    assert (url_async.host, url_async.database) == ("db-uno", "susesoml")
+
+    _entorno(monkeypatch, "db-dos", "otra")
+    asyncio.run(pools.cierra())
+    url = pools.motor(LOTE).url
+    assert (url.host, url.database) == ("db-dos", "otra")
+    asyncio.run(pools.cierra())
+
+
+def test_prepare_threshold_segun_el_driver_de_la_url(monkeypatch):
+    monkeypatch.setenv("SQL_PREPARE_THRESHOLD", "3")
+    config = database.config_pool(LOTE)
+    assert database._connect_args(config, "postgresql+psycopg://u:p@h:1/d")["prepare_threshold"] == 3
+    assert "prepare_threshold" not in database._connect_args(config, "postgresql+psycopg2://u:p@h:1/d")
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from core.jobs import ESTADOS_ACTIVOS, JobManager
+
+
+def _manager_bloqueado():
+    """JobManager cuyos jobs quedan activos hasta que se libera el evento."""
+    liberar = threading.Event()
+    return JobManager(max_workers=4), liberar, lambda job: liberar.wait(5)
+
+
+def test_mismo_rango_normalizado_devuelve_el_mismo_job():
+    manager, liberar, tarea = _manager_bloqueado()
+    try:
+        primero = manager.submit("2024-01-01", "2024-01-31", tarea, {"incremental": False})
+        segundo = manager.submit("2024-1-1", "2024-1-31", tarea, {"incremental": False})
+        assert segundo is primero
+        assert primero.fecha_inicio == "2024-01-01"
+    finally:
+        liberar.set()
+
+
+def test_opciones_distintas_crean_otro_job():
+    manager, liberar, tarea = _manager_bloqueado()
+    try:
+        completo = manager.submit("2024-01-01", "2024-01-31", tarea, {"incremental": False, "chunk_size": 50000})
+        incremental = manager.submit("2024-01-01", "2024-01-31", tarea, {"incremental": True, "chunk_size": 50000})
+        otro_lote = manager.submit("2024-01-01", "2024-01-31", tarea, {"incremental": False, "chunk_size": 1000})
+        assert len({completo.job_id, incremental.job_id, otro_lote.job_id}) == 3
+        assert incremental.opciones == {"incremental": True, "chunk_size": 50000}
+    finally:
+        liberar.set()
+
+
+def _estado_final(tarea):
+    """Estado con que termina un job que ejecuta `tarea`."""
+    manager = JobManager(max_workers=1)
+    job = manager.submit("2024-01-01", "2024-01-31", tarea, {})
+    limite = time.monotonic() + 5
+    while job.estado in ESTADOS_ACTIVOS and time.monotonic() < limite:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_sin_errores_termina_done():
+    job = _estado_final(lambda job: job.registra_regla("rn_1", 10, 2))
+    assert job.estado == "done"
+    assert job.error is None
+
+
+def test_job_con_algunas_escrituras_fallidas_termina_partial():
+    def tarea(job):
+        job.registra_regla("rn_1", 10, 2)
+        job.registra_error("rn_2_lote_0", "deadlock detected")
+
+    job = _estado_final(tarea)
+    assert job.estado == "partial"
+    assert job.to_dict()["errores_total"] == 1
+
+
+def test_job_sin_ninguna_escritura_termina_failed():
+    def tarea(job):
+        job.registra_error("rn_1_lote_0", "connection refused")
+        job.registra_error("rn_2_lote_0", "connection refused")
+
+    job = _estado_final(tarea)
+    assert job.estado == "failed"
+    assert "2 escrituras" in job.error
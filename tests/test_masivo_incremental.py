@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from core import services
+from core.jobs import MasivoJob
+from core.manager_pickle import BusinessModel, ManagerPickle
+from core.services import DIAS_REPOSO_MAX
+
+
+def _licencias():
+    dias = [None, 0, 30, DIAS_REPOSO_MAX, DIAS_REPOSO_MAX + 1, 1000]
+    return pd.DataFrame({
+        "id_licencia": [f"L{i}" for i in range(len(dias))],
+        "folio": [f"F{i}" for i in range(len(dias))],
+        "dias_reposo": pd.array(dias, dtype="Int32"),
+        "fecha_emision": pd.Timestamp("2025-01-10"),
+        "fecha_inicio_reposo": pd.Timestamp("2025-01-10"),
+        "especialidad_profesional": "Medicina General",
+        "cod_diagnostico_principal": "F32",
+    })
+
+
+def test_lectura_incremental_filtra_por_dias_reposo(monkeypatch):
+    capturados = {}
+
+    def stream(file_path, query_params, tipos, chunk_size):
+        capturados.update(file_path=file_path, params=query_params)
+        return iter(())
+
+    monkeypatch.setattr(services, "_stream_dataframes", stream)
+    list(services.stream_masivo("2025-01-01", "2025-01-31", versiones={1: "a", 2: "b"}))
+    assert capturados["file_path"] == "./sql/masivo_incremental.sql"
+    assert capturados["params"]["dias_reposo_max"] == DIAS_REPOSO_MAX
+
+
+def test_excluidas_de_la_lectura_son_las_que_el_modelo_no_puntua():
+    licencias = _licencias()
+    modelos = {
+        1: BusinessModel({"filter": {"especialidad_profesional": ["Medicina General"], "cod_diagnostico_principal": "F"}, "name": "propensity_score_rn_1", "below_limit": 30}),
+    }
+    puntajes = ManagerPickle().puntua_lote(licencias, modelos)
+    sin_score = puntajes["propensity_score_rn_1"].isna().to_numpy()
+    # Mismo predicado que sql/masivo_incremental.sql (NULL <= n no es verdadero)
+    leidas = (licencias["dias_reposo"] <= DIAS_REPOSO_MAX).to_numpy(dtype=bool, na_value=False)
+    assert np.array_equal(sin_score, ~leidas)
+
+
+def test_lote_sin_licencias_puntuables_no_registra_errores(monkeypatch):
+    escritos = []
+    monkeypatch.setattr("core.manager_pickle.update_propensity_score_licencias", lambda *args, **kwargs: escritos.append(args))
+    manager = ManagerPickle()
+    licencias = _licencias().iloc[4:].assign(rn_pendientes=[[1, 2], [1, 2]])
+    modelos = {
+        rn: BusinessModel({"filter": {"especialidad_profesional": ["Medicina General"], "cod_diagnostico_principal": "F"}, "name": f"propensity_score_rn_{rn}", "below_limit": 30})
+        for rn in (1, 2)
+    }
+    job = MasivoJob("2025-01-01", "2025-01-31")
+    manager._guarda_lote(manager.puntua_lote(licencias, modelos), 0, job)
+    assert job.errores_total == 0
+    assert escritos == []
+    assert job.procesadas == 2
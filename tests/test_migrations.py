@@ -0,0 +1,99 @@
+from core.migrations import _descarta_indice_invalido, _migraciones, divide_sentencias
+
+
+class _Conexion:
+    """Conexión falsa: responde si el índice consultado es inválido y anota lo ejecutado."""
+
+    def __init__(self, invalido):
+        self.invalido = invalido
+        self.consultados = []
+        self.ejecutadas = []
+
+    def execute(self, query, params):
+        self.consultados.append(params["nombre"])
+        invalido = self.invalido
+
+        class _Resultado:
+            def scalar(self):
+                return invalido
+
+        return _Resultado()
+
+    def exec_driver_sql(self, sentencia):
+        self.ejecutadas.append(sentencia)
+
+
+CREA = "-- Índice único\nCREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_propensity_score_id_lic_rn\n    ON ml.propensity_score USING btree (id_lic, rn)"
+
+
+def test_indice_invalido_se_elimina_antes_de_crearlo():
+    conn = _Conexion(invalido=True)
+    _descarta_indice_invalido(conn, CREA)
+    assert conn.consultados == ["ml.ux_propensity_score_id_lic_rn"]
+    assert conn.ejecutadas == ["DROP INDEX CONCURRENTLY IF EXISTS ml.ux_propensity_score_id_lic_rn"]
+
+
+def test_indice_valido_o_inexistente_no_se_toca():
+    for invalido in (False, None):
+        conn = _Conexion(invalido=invalido)
+        _descarta_indice_invalido(conn, CREA)
+        assert conn.ejecutadas == []
+
+
+def test_otras_sentencias_no_consultan_el_catalogo():
+    conn = _Conexion(invalido=True)
+    _descarta_indice_invalido(conn, "DELETE FROM ml.propensity_score a USING ml.propensity_score b WHERE a.ctid < b.ctid")
+    _descarta_indice_invalido(conn, "CREATE INDEX IF NOT EXISTS idx_x ON ml.licencias (fecha_emision)")
+    assert conn.consultados == []
+
+
+def test_divide_respeta_cuerpos_dollar_quoted():
+    sql = """
+CREATE FUNCTION ml.f() RETURNS trigger AS $$
+BEGIN
+    UPDATE ml.t SET n = n + 1; -- dentro del cuerpo
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DO $cuerpo$ BEGIN PERFORM 1; PERFORM $$;$$; END $cuerpo$;
+SELECT 1
+"""
+    sentencias = divide_sentencias(sql)
+    assert len(sentencias) == 3
+    assert sentencias[0].startswith("CREATE FUNCTION ml.f()")
+    assert sentencias[0].endswith("$$ LANGUAGE plpgsql")
+    assert "UPDATE ml.t SET n = n + 1; -- dentro del cuerpo" in sentencias[0]
+    assert sentencias[1] == "DO $cuerpo$ BEGIN PERFORM 1; PERFORM $$;$$; END $cuerpo$"
+    assert sentencias[2] == "SELECT 1"
+
+
+def test_divide_ignora_punto_y_coma_en_literales():
+    sql = "INSERT INTO ml.t VALUES ('a;b', 'it''s; ok', '');\nSELECT ';'"
+    assert divide_sentencias(sql) == [
+        "INSERT INTO ml.t VALUES ('a;b', 'it''s; ok', '')",
+        "SELECT ';'",
+    ]
+
+
+def test_divide_ignora_comentarios():
+    sql = """
+-- Encabezado; con punto y coma
+CREATE INDEX idx_a ON ml.t (a); -- comentario; final
+-- Solo comentarios: no es una sentencia;
+;
+SELECT '--no es comentario' -- sí lo es; aquí
+"""
+    # Los tramos que solo tienen comentarios no cuentan como sentencia
+    assert divide_sentencias(sql) == [
+        "-- Encabezado; con punto y coma\nCREATE INDEX idx_a ON ml.t (a)",
+        "SELECT '--no es comentario' -- sí lo es; aquí",
+    ]
+
+
+def test_migraciones_del_repo_se_dividen_en_sentencias_con_codigo():
+    migraciones = _migraciones()
+    assert migraciones
+    for _, path in migraciones:
+        sentencias = divide_sentencias(path.read_text(encoding="utf-8"))
+        assert sentencias, path.name
+        assert all(not s.endswith(";") for s in sentencias), path.name
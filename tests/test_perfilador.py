@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from core.perfilador import Perfil, _perfil_actual, fase, instala_fabrica_tareas, perfilable
+
+
+# Tramos de CPU más largos que sys.getswitchinterval() (5 ms): con tramos cortos el
+# muestreador solo obtiene el GIL cuando el loop lo suelta en select()
+TRAMO = 0.02
+
+
+def _ocupa(segundos: float) -> None:
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        pass
+
+
+async def _request_perfilado(segundos: float) -> None:
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        _ocupa(TRAMO)
+        await asyncio.sleep(0)
+
+
+async def _request_concurrente(segundos: float) -> None:
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        _ocupa(TRAMO)
+        await asyncio.sleep(0)
+
+
+def test_event_loop_solo_muestrea_la_tarea_perfilada():
+    perfil = Perfil("prueba", intervalo=0.001)
+
+    @perfilable
+    async def handler():
+        await _request_perfilado(0.4)
+
+    async def perfilado():
+        _perfil_actual.set(perfil)
+        perfil.inicia()
+        await handler()
+        perfil.termina()
+
+    async def principal():
+        await asyncio.gather(perfilado(), _request_concurrente(0.4))
+
+    asyncio.run(principal())
+    pilas = list(perfil.muestras)
+    assert any("_request_perfilado" in pila for pila in pilas)
+    assert not any("_request_concurrente" in pila for pila in pilas)
+    assert perfil.fases["handler"]["veces"] == 1
+
+
+def test_tareas_creadas_por_el_request_perfilado_se_muestrean():
+    perfil = Perfil("prueba_tareas", intervalo=0.001)
+
+    async def perfilado():
+        _perfil_actual.set(perfil)
+        perfil.inicia()
+        # Como el single-flight del caché: el trabajo corre en otra tarea y se espera
+        await asyncio.ensure_future(_request_perfilado(0.4))
+        perfil.termina()
+
+    async def principal():
+        instala_fabrica_tareas()
+        await asyncio.gather(perfilado(), _request_concurrente(0.4))
+
+    asyncio.run(principal())
+    pilas = list(perfil.muestras)
+    assert any("_request_perfilado" in pila for pila in pilas)
+    assert not any("_request_concurrente" in pila for pila in pilas)
+
+
+def test_hilo_sin_event_loop_se_muestrea_completo():
+    perfil = Perfil("prueba_hilo", intervalo=0.001)
+    token = _perfil_actual.set(perfil)
+    try:
+        perfil.inicia()
+
+        def trabajo():
+            with fase("puntaje"):
+                _ocupa(0.1)
+
+        hilo = threading.Thread(target=contextvars.copy_context().run, args=(trabajo,))
+        hilo.start()
+        hilo.join()
+        perfil.termina()
+    finally:
+        _perfil_actual.reset(token)
+    assert perfil.tareas == {}
+    assert any("trabajo" in pila for pila in perfil.muestras)
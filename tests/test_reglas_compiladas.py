@@ -0,0 +1,50 @@
+from itertools import product
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.manager_pickle import BusinessModel, codifica, particiones_paralelo
+from core.model_registry import registry
+
+ESPECIALIDADES = ["Medicina General", "MEDICINA GENERAL", "Sin Especialidad", "Cardiología", "medicina general", "", None]
+# None y NaN se comparan como su texto ("None", "nan"), igual que en apply_business_rule
+DIAGNOSTICOS = ["F32", "F", "M54", "M", "f32", "XF3", "Z99", "", "None", None, np.nan]
+DIAS_REPOSO = [np.nan, -1, 0, 29, 30, 31, 364, 365, 366, 1000]
+
+REGLAS_PROPIAS = [
+    {"filter": {"especialidad_profesional": ["Cardiología", ""], "cod_diagnostico_principal": "F3"}, "name": "propensity_score_rn_3", "below_limit": 0},
+    {"filter": {"especialidad_profesional": ["Medicina General"], "cod_diagnostico_principal": "N"}, "name": "propensity_score_rn_4", "below_limit": 365},
+    {"filter": {"especialidad_profesional": [], "cod_diagnostico_principal": ""}, "name": "propensity_score_rn_5", "below_limit": 1},
+]
+
+
+def _modelos():
+    modelos = [registry.get(f"business_model_rn_{rn}.pkl") for rn in (1, 2)]
+    return modelos + [BusinessModel(hyperparameters) for hyperparameters in REGLAS_PROPIAS]
+
+
+def _licencias(dias_dtype) -> pd.DataFrame:
+    filas = list(product(ESPECIALIDADES, DIAGNOSTICOS, DIAS_REPOSO))
+    df = pd.DataFrame(filas, columns=["especialidad_profesional", "cod_diagnostico_principal", "dias_reposo"])
+    df["dias_reposo"] = df["dias_reposo"].astype(dias_dtype)
+    df["id_licencia"] = [f"L{i}" for i in range(len(df))]
+    df["fecha_emision"] = "2025-01-10"
+    df["fecha_inicio_reposo"] = "2025-01-11"
+    # Índice no correlativo: el score se alinea por índice, no por posición
+    df.index = df.index * 3 + 7
+    return df
+
+
+@pytest.mark.parametrize("dias_dtype", ["float64", "Int32"])
+@pytest.mark.parametrize("modelo", _modelos(), ids=lambda modelo: modelo.hyperparameters["name"])
+def test_regla_compilada_igual_a_predict_prob(modelo, dias_dtype):
+    df = _licencias(dias_dtype)
+    nombre = modelo.hyperparameters["name"]
+    esperado = modelo.predict_prob(df.copy())[nombre]
+
+    pd.testing.assert_series_equal(modelo.compila().puntua(df), esperado)
+    # Con los códigos ya calculados del lote (puntua_lote) y con categóricas (modo paralelo)
+    pd.testing.assert_series_equal(modelo.compila().puntua(df, codifica(df)), esperado)
+    categoricas = pd.concat([modelo.compila().puntua(particion) for particion in particiones_paralelo(df)])
+    pd.testing.assert_series_equal(categoricas, esperado)
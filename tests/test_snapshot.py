@@ -0,0 +1,87 @@
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from core import snapshot as modulo_snapshot  # noqa: E402
+from core.snapshot import LicenciasSnapshot  # noqa: E402
+
+HOY = pd.Timestamp(datetime.now().date())
+
+
+class _Base:
+    """ml.licencias ⨝ licencia_diagnostico_especialidad en memoria, filtrada como sql/snapshot_licencias.sql."""
+
+    def __init__(self):
+        self.licencias = []
+        self.con_diagnostico = set()
+
+    def agrega(self, id_licencias: int, fecha_emision: pd.Timestamp, con_diagnostico: bool = True):
+        self.licencias.append({
+            "id_licencias": id_licencias,
+            "id_licencia": f"L{id_licencias}",
+            "folio": f"F{id_licencias}",
+            "dias_reposo": 10,
+            "fecha_emision": fecha_emision,
+            "fecha_inicio_reposo": fecha_emision,
+            "especialidad_profesional": "Medicina General",
+            "cod_diagnostico_principal": "F32",
+        })
+        if con_diagnostico:
+            self.con_diagnostico.add(id_licencias)
+
+    def lee_columnar(self, conn, query, params, tipos, chunk_size):
+        df = pd.DataFrame(self.licencias)
+        visibles = df["id_licencias"].isin(self.con_diagnostico) & (
+            (df["id_licencias"] > params["desde_id"]) | (df["fecha_emision"] >= params["relee_desde"])
+        )
+        df = df[visibles].sort_values("id_licencias")
+        df["especialidad_profesional"] = df["especialidad_profesional"].astype("category")
+        df["cod_diagnostico_principal"] = df["cod_diagnostico_principal"].astype("category")
+        if not df.empty:
+            yield df.reset_index(drop=True)
+
+
+@pytest.fixture
+def base(monkeypatch):
+    base = _Base()
+    monkeypatch.setattr(modulo_snapshot, "lee_columnar", base.lee_columnar)
+    monkeypatch.setattr(modulo_snapshot, "motor", lambda carga: type("Motor", (), {"connect": lambda self: nullcontext()})())
+    return base
+
+
+def _ids(snap: LicenciasSnapshot, desde: pd.Timestamp, hasta: pd.Timestamp) -> list[str]:
+    return sorted(licencia for df in snap.lee(desde.to_pydatetime(), hasta.to_pydatetime()) for licencia in df["id_licencia"])
+
+
+def test_diagnostico_tardio_dentro_de_la_ventana_entra_al_snapshot(base, tmp_path):
+    snap = LicenciasSnapshot(str(tmp_path), max_edad=-1, relectura_dias=7)
+    base.agrega(1, HOY - timedelta(days=40))
+    base.agrega(2, HOY - timedelta(days=2), con_diagnostico=False)
+    base.agrega(3, HOY - timedelta(days=1))
+    assert snap.refresca()["marca"] == 3
+
+    # La fila de diagnóstico de la licencia 2 llega después: su id ya está bajo la marca
+    base.con_diagnostico.add(2)
+    base.agrega(4, HOY - timedelta(days=60))
+    snap.refresca()
+
+    desde, hasta = HOY - timedelta(days=90), HOY + timedelta(days=1)
+    assert _ids(snap, desde, hasta) == ["L1", "L2", "L3", "L4"]
+
+
+def test_diagnostico_tardio_fuera_de_la_ventana_requiere_reconstruir(base, tmp_path):
+    snap = LicenciasSnapshot(str(tmp_path), max_edad=-1, relectura_dias=7)
+    base.agrega(1, HOY - timedelta(days=30), con_diagnostico=False)
+    base.agrega(2, HOY - timedelta(days=1))
+    snap.refresca()
+    base.con_diagnostico.add(1)
+    snap.refresca()
+
+    desde, hasta = HOY - timedelta(days=90), HOY + timedelta(days=1)
+    assert _ids(snap, desde, hasta) == ["L2"]
+    snap.refresca(reconstruye=True)
+    assert _ids(snap, desde, hasta) == ["L1", "L2"]
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.umbrales import COLUMNAS_VENTANAS, VENTANAS, MotorUmbrales
+
+DESDE = datetime(2025, 3, 1)
+
+
+def _licencias() -> pd.DataFrame:
+    """Licencias ordenadas por fecha_emision como sql/umbrales.sql, con 30 días de historia antes de DESDE."""
+    rng = np.random.default_rng(17)
+    n = 3000
+    fechas = DESDE - timedelta(days=30) + pd.to_timedelta(rng.integers(0, 75, n), unit="D")
+    # Un día con muchas licencias: ocupa varios lotes seguidos con los chunk_size chicos
+    fechas = np.where(rng.random(n) < 0.1, np.datetime64("2025-03-20"), fechas.to_numpy())
+    dias_reposo = rng.integers(1, 30, n).astype(float)
+    dias_reposo[rng.random(n) < 0.05] = np.nan
+    df = pd.DataFrame({
+        "id_licencia": [f"L{i:05d}" for i in range(n)],
+        "rut_medico": rng.choice([f"{r}-K" for r in range(25)], n),
+        "fecha_emision": pd.to_datetime(fechas),
+        "dias_reposo": dias_reposo,
+    })
+    return df.sort_values("fecha_emision", kind="stable", ignore_index=True)
+
+
+def _ventanas_ingenuas(df: pd.DataFrame) -> pd.DataFrame:
+    """Para cada licencia, recorre todas las del mismo médico en los w días que terminan en su fecha."""
+    ruts = df["rut_medico"].to_numpy()
+    fechas = df["fecha_emision"].to_numpy()
+    dias_reposo = df["dias_reposo"].fillna(0).to_numpy()
+    filas = []
+    for i in np.flatnonzero(fechas >= np.datetime64(DESDE)):
+        del_medico = ruts == ruts[i]
+        fila = {"id_licencia": df["id_licencia"].iat[i]}
+        for dias_ventana, sufijo in VENTANAS.items():
+            en_ventana = del_medico & (fechas > fechas[i] - np.timedelta64(dias_ventana, "D")) & (fechas <= fechas[i])
+            fila[f"frecuencia_{sufijo}"] = float(en_ventana.sum())
+            fila[f"otorgados_{sufijo}"] = float(dias_reposo[en_ventana].sum())
+        filas.append(fila)
+    return pd.DataFrame(filas).sort_values("id_licencia", ignore_index=True)
+
+
+@pytest.fixture(scope="module")
+def licencias():
+    return _licencias()
+
+
+@pytest.fixture(scope="module")
+def esperado(licencias):
+    return _ventanas_ingenuas(licencias)
+
+
+@pytest.mark.parametrize("chunk_size", [50, 333, 1000, 5000])
+def test_ventanas_por_lotes_igual_al_conteo_ingenuo(licencias, esperado, chunk_size):
+    lotes = (licencias.iloc[inicio:inicio + chunk_size] for inicio in range(0, len(licencias), chunk_size))
+    resultado = pd.concat(MotorUmbrales().procesa(lotes, DESDE), ignore_index=True)
+
+    assert resultado["id_licencia"].is_unique
+    resultado = resultado.sort_values("id_licencia", ignore_index=True)
+    pd.testing.assert_frame_equal(resultado[["id_licencia"] + COLUMNAS_VENTANAS], esperado[["id_licencia"] + COLUMNAS_VENTANAS])
+
+
+def test_lotes_que_cortan_un_dia_y_ultimo_dia_diferido(licencias, esperado):
+    # Cortes en medio del día con muchas licencias y un último lote de un solo día
+    dia = licencias.index[licencias["fecha_emision"] == pd.Timestamp("2025-03-20")]
+    ultimo_dia = licencias.index[licencias["fecha_emision"] == licencias["fecha_emision"].max()][0]
+    cortes = [0, dia[5], dia[len(dia) // 2], dia[-3], ultimo_dia, len(licencias)]
+    lotes = [licencias.iloc[inicio:fin] for inicio, fin in zip(cortes, cortes[1:])]
+    resultado = pd.concat(MotorUmbrales().procesa(lotes, DESDE), ignore_index=True).sort_values("id_licencia", ignore_index=True)
+    pd.testing.assert_frame_equal(resultado[["id_licencia"] + COLUMNAS_VENTANAS], esperado[["id_licencia"] + COLUMNAS_VENTANAS])
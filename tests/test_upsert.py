@@ -0,0 +1,121 @@
+import pandas as pd
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.dialects import postgresql
+
+from core import services
+from core.services import UPSERT_BATCH_SIZE_MAX, build_upsert_propensity_score
+
+COLUMNAS = ("id_lic", "folio", "rn", "score", "version_modelo")
+
+
+class _Sesion:
+    """Sesión falsa: compila cada sentencia con el dialecto de PostgreSQL y anota los eventos."""
+
+    def __init__(self, eventos, falla_en=None):
+        self.eventos = eventos
+        self.falla_en = falla_en
+        self.ejecutadas = 0
+
+    def execute(self, stmt):
+        self.ejecutadas += 1
+        if self.ejecutadas == self.falla_en:
+            raise exc.OperationalError("INSERT", {}, Exception("conexión perdida"))
+        self.eventos.append(("execute", stmt.compile(dialect=postgresql.dialect())))
+
+    def commit(self):
+        self.eventos.append(("commit",))
+
+    def rollback(self):
+        self.eventos.append(("rollback",))
+
+    def close(self):
+        self.eventos.append(("close",))
+
+
+def _filas(compilada) -> list[dict]:
+    """Reconstruye las filas del VALUES multi-fila a partir de los parámetros compilados."""
+    params = compilada.params
+    return [
+        {col: params[f"{col}_m{i}"] for col in COLUMNAS}
+        for i in range(len(params) // len(COLUMNAS))
+    ]
+
+
+def _resultados(n, dia="2025-01-10"):
+    return [
+        {"id_licencia": f"L{i}", "folio": f"F{i}", "score": i / n, "fecha_emision": pd.Timestamp(dia)}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def eventos(monkeypatch):
+    eventos = []
+    monkeypatch.setattr(services, "sesion", lambda: _Sesion(eventos))
+    monkeypatch.setattr(
+        services.score_cache, "invalida_rango", lambda desde, hasta: eventos.append(("invalida", desde, hasta))
+    )
+    return eventos
+
+
+def test_sentencia_upsert_multi_fila():
+    registros = [
+        {"id_lic": "L1", "folio": "F1", "rn": 2, "score": 0.25, "version_modelo": "v1"},
+        {"id_lic": "L2", "folio": "F2", "rn": 2, "score": 0.75, "version_modelo": "v1"},
+    ]
+    compilada = build_upsert_propensity_score(registros).compile(dialect=postgresql.dialect())
+    sql = str(compilada)
+    assert sql.startswith("INSERT INTO ml.propensity_score (id_lic, folio, rn, score, version_modelo) VALUES")
+    assert "ON CONFLICT (id_lic, rn) DO UPDATE SET score = excluded.score, version_modelo = excluded.version_modelo" in sql
+    assert _filas(compilada) == registros
+
+
+def test_divide_en_lotes_e_invalida_tras_cada_uno(eventos):
+    escritos = services.update_propensity_score_licencias(
+        _resultados(25), "score", rn=1, batch_size=10, version_modelo="v1"
+    )
+    assert escritos == 25
+    tipos = [e[0] for e in eventos]
+    assert tipos == ["execute", "commit", "invalida"] * 3 + ["close"]
+
+    lotes = [_filas(e[1]) for e in eventos if e[0] == "execute"]
+    assert [len(lote) for lote in lotes] == [10, 10, 5]
+    assert [f["id_lic"] for lote in lotes for f in lote] == [f"L{i}" for i in range(25)]
+    assert all(f["rn"] == 1 and f["version_modelo"] == "v1" for lote in lotes for f in lote)
+    dia = pd.Timestamp("2025-01-10").to_pydatetime()
+    assert all(e[1:] == (dia, dia) for e in eventos if e[0] == "invalida")
+
+
+def test_licencia_repetida_conserva_el_ultimo_score(eventos):
+    resultados = _resultados(3)
+    resultados.append({**resultados[0], "score": 0.99, "fecha_emision": pd.Timestamp("2025-01-12")})
+    escritos = services.update_propensity_score_licencias(resultados, "score", rn=1, batch_size=10)
+    assert escritos == 3
+
+    (compilada,) = [e[1] for e in eventos if e[0] == "execute"]
+    scores = {f["id_lic"]: f["score"] for f in _filas(compilada)}
+    assert scores == {"L0": 0.99, "L1": 1 / 3, "L2": 2 / 3}
+    invalidaciones = [e[1:] for e in eventos if e[0] == "invalida"]
+    assert invalidaciones == [(pd.Timestamp("2025-01-10").to_pydatetime(), pd.Timestamp("2025-01-12").to_pydatetime())]
+
+
+def test_lote_se_limita_al_maximo_de_parametros(eventos):
+    services.update_propensity_score_licencias(
+        _resultados(UPSERT_BATCH_SIZE_MAX + 1), "score", rn=1, batch_size=50000
+    )
+    lotes = [e[1] for e in eventos if e[0] == "execute"]
+    assert [len(_filas(c)) for c in lotes] == [UPSERT_BATCH_SIZE_MAX, 1]
+    assert all(len(c.params) <= 65535 for c in lotes)
+
+
+def test_error_en_un_lote_conserva_los_anteriores(monkeypatch, eventos):
+    monkeypatch.setattr(services, "sesion", lambda: _Sesion(eventos, falla_en=2))
+    with pytest.raises(ValueError, match=r"\(10 registros ya guardados\)"):
+        services.update_propensity_score_licencias(_resultados(25), "score", rn=1, batch_size=10)
+    assert [e[0] for e in eventos] == ["execute", "commit", "invalida", "rollback", "close"]
+
+
+def test_sin_resultados_no_abre_sesion(monkeypatch):
+    monkeypatch.setattr(services, "sesion", lambda: pytest.fail("no debe abrir sesión"))
+    assert services.update_propensity_score_licencias([], "score", rn=1) == 0